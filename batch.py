@@ -0,0 +1,1052 @@
+"""Batch/corpus mode: run many contracts through the extraction pipeline.
+
+The stages run as a pipeline, each with its own concurrency limit:
+
+- convert: docling PDF -> markdown (CPU-bound, warm worker pool)
+- fast path: deterministic template/table/key-value extraction (fastpath.py)
+- layout index: values and regions learned from earlier documents with the
+  same layout (layout_index.py)
+- revisions: a new revision of a known Contract ID re-extracts only the
+  fields whose sections changed and is submitted as an update (revisions.py)
+- llm: extraction of the remaining fields + correction completions (I/O-bound);
+  with packing, small documents share extraction requests (packing.py), and
+  with routing, fields that fail validation are re-asked of a stronger
+  deployment (routing.py)
+- submit: Zenskar POST (I/O-bound)
+
+With a job store (jobs.py) every completed stage is checkpointed, and a
+document whose run was interrupted resumes after its last checkpoint.
+
+Usage:
+    python batch.py ./contracts --out ./results
+    python batch.py "./inbox/**/*.pdf" --convert-workers 4 --llm-concurrency 16
+    python batch.py manifest.txt --no-submit
+    python batch.py ./order_forms --pack-tokens 6000
+    python batch.py ./contracts --jobs    # resumable; run in several processes to share it
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import time
+import traceback
+from pathlib import Path
+
+import main
+from cache import DEFAULT_CACHE_DIR, Cache, file_hash, markdown_key
+from conversion import ConversionPool, converter_settings
+from fastpath import (
+    DEFAULT_THRESHOLD,
+    TEMPLATES,
+    FastPathResult,
+    fast_extract,
+    load_templates,
+    merge_fast_path,
+    missing_prompt,
+)
+from jobs import DEFAULT_JOBS, DEFAULT_LEASE, DEFAULT_MAX_ATTEMPTS, JobStore, default_worker
+from layout_index import DEFAULT_INDEX, LayoutIndex
+from llm import AsyncLLM
+from packing import Packer
+from prompt_layout import correction_prefix, extraction_prefix, fields_content
+from page_selection import DEFAULT_KEYWORDS, OCR_MODES, PageSelection
+from page_stream import StreamOptions
+from revisions import DEFAULT_REVISIONS, RevisionStore, change_set, plan_revision
+from routing import SCOPES, RoutingPolicy, assess, merge_escalated
+from schema import (
+    CORRECTION_FORMAT,
+    EXTRACTION_FORMAT,
+    FIELD_PATHS,
+    flatten,
+    partial_format,
+    select_fields,
+)
+from submission import DEFAULT_LEDGER, SubmissionLedger, ZenskarSubmitter
+from sections import plan_context, reduce_extractions
+from tracing import OTLPFileExporter, Tracer, aggregate, annotate, percentile
+
+
+def discover_sources(target):
+    """Resolve a directory, glob pattern or manifest file to a list of sources."""
+    path = Path(target)
+    if path.is_dir():
+        return sorted(str(p) for p in path.rglob("*.pdf"))
+    if path.is_file() and path.suffix.lower() != ".pdf":
+        # Manifest: one path/URL per line, or JSON lines with a "source" key
+        sources = []
+        for line in path.read_text().splitlines():
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                line = json.loads(line)["source"]
+            sources.append(line)
+        return sources
+    if path.is_file():
+        return [str(path)]
+    return sorted(glob.glob(target, recursive=True))
+
+
+def doc_id_for(source, seen):
+    """Stable, unique output name for a source."""
+    stem = Path(source).stem or "document"
+    doc_id = stem
+    n = 1
+    while doc_id in seen:
+        n += 1
+        doc_id = f"{stem}-{n}"
+    seen.add(doc_id)
+    return doc_id
+
+
+class Pipeline:
+    def __init__(self, convert_workers=None, llm_concurrency=8, submit_concurrency=4,
+                 max_in_flight=None, prompt=main.PROMPT, submit=True, convert_timeout=None,
+                 cache=None, llm=None, context_tokens=6000, structured=True, submitter=None,
+                 fast_path=True, templates=TEMPLATES, fast_path_threshold=DEFAULT_THRESHOLD,
+                 layout_index=None, pack_tokens=0, pack_max_docs=8, pack_wait=0.2,
+                 revisions=None, page_selection=None, stream=None, routing=None,
+                 stable_prefix=False, refresh=False):
+        """`refresh` extracts every document in full, reusing nothing from stored revisions."""
+        self.convert_workers = convert_workers or os.cpu_count() or 1
+        self.prompt = prompt
+        self.stable_prefix = stable_prefix
+        self.submit = submit
+        self.cache = cache
+        self.context_tokens = context_tokens
+        self.structured = structured
+        self.fast_path = fast_path
+        self.templates = templates
+        self.fast_path_threshold = fast_path_threshold
+        self.layout_index = layout_index
+        self.revisions = revisions
+        self.refresh = refresh
+        self.routing = routing
+        self.model = routing.fast if routing is not None else main.MODEL
+        self.correct_model = self.model
+        if routing is not None and routing.correct_with == "strong":
+            self.correct_model = routing.strong
+        self.llm = llm or AsyncLLM(max_in_flight=llm_concurrency, cache=cache)
+        self.submitter = submitter or ZenskarSubmitter(max_workers=submit_concurrency)
+        self.convert_limit = asyncio.Semaphore(self.convert_workers)
+        self.llm_limit = asyncio.Semaphore(llm_concurrency)
+        self.submit_limit = asyncio.Semaphore(submit_concurrency)
+        # Bound the number of documents held between stages
+        self.max_in_flight = (max_in_flight
+                              or 2 * (self.convert_workers + llm_concurrency + submit_concurrency))
+        self.in_flight = asyncio.Semaphore(self.max_in_flight)
+        self.converter = ConversionPool(workers=self.convert_workers, timeout=convert_timeout,
+                                        selection=page_selection, stream=stream)
+        self.packer = None
+        if pack_tokens:
+            self.packer = Packer(self._send_packed, self._extract_one, prompt, pack_tokens,
+                                 pack_max_docs, pack_wait,
+                                 system_prompt=extraction_prefix(prompt) if stable_prefix else None,
+                                 single_prompt=lambda fields: self._extraction_request(fields)[0])
+
+    def close(self):
+        self.converter.close()
+        self.submitter.close()
+
+    async def _stage(self, tracer, name, limit, func, *args):
+        async with limit:
+            with tracer.span(name):
+                return await func(*args)
+
+    async def _convert(self, source):
+        return await asyncio.to_thread(self.converter.convert_pages, source)
+
+    async def _llm(self, system_prompt, user_content, response_format, model=None):
+        model = model or self.model
+        if self.structured:
+            return await self.llm.chat(system_prompt, user_content, model=model,
+                                       response_format=response_format)
+        return await self.llm.chat(system_prompt, user_content, model=model)
+
+    async def _send_packed(self, system_prompt, user_content, response_format):
+        async with self.llm_limit:
+            return await self._llm(system_prompt, user_content, response_format)
+
+    def _extraction_request(self, fields=None):
+        """(system prompt, response_format) of an extraction of `fields` (None: all).
+
+        With the stable prefix layout both are the same for every extraction.
+        """
+        if self.stable_prefix:
+            return extraction_prefix(self.prompt), EXTRACTION_FORMAT
+        if fields is None:
+            return self.prompt, EXTRACTION_FORMAT
+        return missing_prompt(fields), partial_format(fields)
+
+    def _content(self, content, fields=None):
+        return fields_content(content, fields) if self.stable_prefix else content
+
+    def _parse(self, answer, fields=None):
+        extracted = main.parse_extraction(answer)
+        if self.stable_prefix and fields is not None:
+            return select_fields(extracted, fields)
+        return extracted
+
+    async def _extract_one(self, content, fields=None):
+        """One single-document extraction request (fields as in _extract)."""
+        prompt, response_format = self._extraction_request(fields)
+        async with self.llm_limit:
+            return self._parse(await self._llm(prompt, self._content(content, fields),
+                                               response_format), fields)
+
+    def _zenskar_id(self, previous):
+        """The Zenskar contract a revision updates, if the previous one was created.
+
+        A revision stored without one (--no-submit, or submitted later with
+        submission.py) is looked up by its document hash in the ledger.
+        """
+        if previous is None:
+            return None
+        if previous["zenskar_id"] is not None:
+            return previous["zenskar_id"]
+        if self.submitter.ledger is None:
+            return None
+        return created_id(self.submitter.ledger.get(previous["document_hash"]))
+
+    async def _submit(self, document_hash, payload, zenskar_id=None):
+        """Create the contract, or PATCH `payload` onto contract `zenskar_id`."""
+        if zenskar_id is None:
+            result = await asyncio.to_thread(self.submitter.submit, document_hash, payload)
+        else:
+            result = await asyncio.to_thread(self.submitter.update, zenskar_id, document_hash,
+                                             payload)
+        annotate(retries=result["retries"], submit_status=result["status"])
+        return result
+
+    async def _markdown(self, record, tracer):
+        """The document's markdown, from the cache or the conversion pool."""
+        source = record["source"]
+        markdown = None
+        if self.cache is not None:
+            key = markdown_key(source, converter_settings(self.converter.selection,
+                                                          self.converter.stream))
+            markdown = self.cache.get("markdown", key)
+        if markdown is not None:
+            with tracer.span("convert", cache_hit=1):
+                pass
+            return markdown
+        converted = await self._stage(tracer, "convert", self.convert_limit, self._convert,
+                                      source)
+        markdown = converted["markdown"]
+        if converted["pages"] is not None:
+            record["pages"] = converted["pages"]
+        if converted["stream"] is not None:
+            record["stream"] = converted["stream"]
+        record["convert_peak_rss_kb"] = converted["peak_rss_kb"]
+        if self.cache is not None:
+            self.cache.put("markdown", key, markdown)
+        return markdown
+
+    async def _route(self, record, tracer, markdown, extracted, validated, validation_log,
+                     invalid_fields):
+        """Escalate what the fast deployment got wrong to the strong one.
+
+        Returns the (possibly) updated extracted record and its validation.
+        """
+        escalation = assess(extracted, validation_log, invalid_fields, self.routing)
+        record["routing"] = {
+            "model": self.routing.fast,
+            "log_entries": escalation.log_entries,
+            "completeness": escalation.completeness,
+            "reasons": escalation.reasons,
+            "escalated": escalation.fields,
+        }
+        if not escalation.fields:
+            return extracted, validated, validation_log, invalid_fields
+        start = time.perf_counter()
+        with tracer.span("escalate", model=self.routing.strong, fields=len(escalation.fields)):
+            strong = await self._extract({}, tracer, markdown, escalation.fields,
+                                         model=self.routing.strong)
+        extracted = merge_escalated(extracted, strong, escalation.fields)
+        record["extracted"] = extracted
+        validated, validation_log, still_invalid = main.validate_record(extracted)
+        record["routing"].update({
+            "escalate_seconds": time.perf_counter() - start,
+            "fixed": [path for path in invalid_fields if path not in still_invalid],
+            "still_invalid": still_invalid,
+        })
+        return extracted, validated, validation_log, still_invalid
+
+    def _revision_plan(self, markdown, document_hash):
+        """The latest stored revision of this document's contract and what to re-extract.
+
+        The plan is None for the same document again, or with `refresh`: it is
+        extracted in full, so prompt, model and cache changes still reach it.
+        """
+        fast = fast_extract(markdown, self.templates, self.fast_path_threshold)
+        contract_id = fast.accepted.get("Contract ID")
+        previous = self.revisions.latest(contract_id) if contract_id else None
+        if previous is None:
+            return None, None
+        if self.refresh or previous["document_hash"] == document_hash:
+            return previous, None
+        return previous, plan_revision(previous["markdown"], previous["final"], markdown)
+
+    async def _fast_extract(self, record, tracer, markdown):
+        """Fill what the fast path and layout index can and ask the LLM only for the rest."""
+        fast = FastPathResult(threshold=self.fast_path_threshold)
+        if self.fast_path:
+            with tracer.span("fast_path") as span:
+                fast = fast_extract(markdown, self.templates, self.fast_path_threshold)
+                span.set(template=fast.template, hits=len(fast.accepted), missing=len(fast.missing))
+            record["fast_path"] = {
+                "template": fast.template,
+                "hits": sorted(fast.accepted),
+                "missing": fast.missing,
+                "confidence": fast.confidence,
+            }
+        context = markdown
+        if self.layout_index is not None:
+            with tracer.span("layout_index") as span:
+                match = self.layout_index.lookup(markdown, fast.missing)
+                for path, value in match.values.items():
+                    fast.values[path] = value
+                    fast.confidence[path] = match.confidence[path]
+                    fast.sources[path] = "index"
+                span.set(known=match.known is not None, values=len(match.values),
+                         regions=len(match.regions))
+            missing = fast.missing
+            # Known layout: send only the sections the remaining fields were found in
+            narrowed = bool(missing) and all(path in match.regions for path in missing)
+            if narrowed:
+                context = match.context(missing)
+            record["layout"] = {
+                "fingerprint": match.fingerprint,
+                "known": match.known,
+                "similarity": match.similarity,
+                "from_index": sorted(path for path in match.values if path in fast.accepted),
+                "narrowed": narrowed,
+            }
+        if not fast.missing:
+            return merge_fast_path(fast.fields, {})
+        if not fast.accepted and not self.fast_path:
+            return await self._extract(record, tracer, markdown)
+        return merge_fast_path(fast.fields, await self._extract(record, tracer, context,
+                                                                fast.missing))
+
+    async def _extract(self, record, tracer, markdown, fields=None, model=None):
+        """Extract from the relevant sections, map-reducing over chunks if needed.
+
+        With `fields` ("Metadata.<sub field>" paths) only those are asked for;
+        `model` overrides the pipeline's deployment (and skips packing).
+        """
+        prompt, response_format = self._extraction_request(fields)
+        plan_fields = {}
+        if fields is not None:
+            plan_fields = {"fields": [path.split(".")[-1] for path in fields]}
+        if self.context_tokens:
+            plan = plan_context(markdown, self.context_tokens, **plan_fields)
+            chunks = plan.chunks
+            record["context"] = {
+                "mode": plan.mode,
+                "sections_total": plan.sections_total,
+                "sections_sent": plan.sections_sent,
+                "tokens_full": plan.tokens_full,
+                "tokens_sent": plan.tokens_sent,
+            }
+        else:
+            chunks = [markdown]
+        if (self.packer is not None and model is None and len(chunks) == 1
+                and self.packer.fits(chunks[0])):
+            with tracer.span("extract") as span:
+                extracted, pack_size = await self.packer.extract(chunks[0], fields)
+                span.set(packed=pack_size)
+            record["packing"] = {"pack_size": pack_size}
+            return extracted
+        answers = await asyncio.gather(*(
+            self._stage(tracer, "extract", self.llm_limit, self._llm, prompt,
+                        self._content(chunk, fields), response_format, model)
+            for chunk in chunks
+        ))
+        if len(answers) == 1:
+            return self._parse(answers[0], fields)
+        results = []
+        for answer in answers:
+            try:
+                results.append(self._parse(answer, fields))
+            except json.JSONDecodeError:
+                continue
+        if not results:
+            raise ValueError("no chunk returned parseable JSON")
+        return reduce_extractions(results)
+
+    async def process(self, doc_id, source, tracer=None, job=None, on_admit=None):
+        """Run one document through every stage; spans are recorded on `tracer`.
+
+        With a claimed `job` (jobs.py), each completed stage is checkpointed
+        and stages the job already completed are not run again. `on_admit` is
+        called once the document gets one of the `max_in_flight` slots.
+        """
+        tracer = tracer or Tracer(doc_id)
+        record = {"id": doc_id, "source": source, "status": "ok", "trace_id": tracer.trace_id}
+        start = time.perf_counter()
+        async with self.in_flight:
+            if on_admit is not None:
+                on_admit()
+            with tracer.span("document", source=str(source)) as root:
+                await self._process(record, tracer, job)
+                root.set(status=record["status"])
+                if record["status"] != "ok":
+                    root.status = "error"
+        record["timings"] = tracer.timings()
+        record["latency"] = time.perf_counter() - start
+        return record
+
+    async def _process(self, record, tracer, job=None):
+        source = record["source"]
+        stage = "convert"
+        try:
+            record["document_hash"] = file_hash(source)
+            if job is not None and job.state != "pending":
+                if job.record.get("document_hash") != record["document_hash"]:
+                    # The file changed since it was checkpointed
+                    job.restart()
+                else:
+                    record.update({key: value for key, value in job.record.items()
+                                   if key not in ("status", "trace_id", "error")})
+                    record["resumed_from"] = job.state
+
+            def resumed(state):
+                return job is not None and job.reached(state)
+
+            def checkpoint(state, **artifacts):
+                if job is not None:
+                    job.checkpoint(state, record, **artifacts)
+
+            if resumed("converted"):
+                markdown = job.artifact("markdown")
+                with tracer.span("convert", resumed=1):
+                    pass
+            else:
+                markdown = await self._markdown(record, tracer)
+                checkpoint("converted", markdown=markdown)
+
+            stage = "extract"
+            previous = plan = None
+            if self.revisions is not None:
+                with tracer.span("revision") as span:
+                    previous, plan = self._revision_plan(markdown, record["document_hash"])
+                    span.set(known=previous is not None, incremental=plan is not None)
+            if resumed("extracted"):
+                extracted = record["extracted"]
+            elif plan is not None:
+                # Keep what the unchanged sections held, re-extract the rest from the changes
+                llm_fields = {}
+                if plan.fields:
+                    llm_fields = await self._extract(record, tracer, plan.context, plan.fields)
+                extracted = plan.merge(llm_fields)
+            elif self.fast_path or self.layout_index is not None:
+                extracted = await self._fast_extract(record, tracer, markdown)
+            else:
+                extracted = await self._extract(record, tracer, markdown)
+            if not resumed("extracted"):
+                record["extracted"] = extracted
+                checkpoint("extracted")
+
+            stage = "validate"
+            if resumed("validated"):
+                validated, invalid_fields = record["validated"], record["invalid_fields"]
+                validation_log = record["validation_log"]
+            else:
+                with tracer.span("validate") as span:
+                    validated, validation_log, invalid_fields = main.validate_record(extracted)
+                    span.set(invalid_fields=len(invalid_fields))
+                if self.routing is not None:
+                    extracted, validated, validation_log, invalid_fields = await self._route(
+                        record, tracer, markdown, extracted, validated, validation_log,
+                        invalid_fields)
+                record["validated"] = validated
+                record["validation_log"] = validation_log
+                record["invalid_fields"] = invalid_fields
+                checkpoint("validated")
+
+            final = validated
+            if resumed("corrected"):
+                final = record["final"]
+            elif invalid_fields:
+                stage = "correct"
+                corrected = await self._stage(
+                    tracer, "correct", self.llm_limit, self._llm,
+                    correction_prefix() if self.stable_prefix else main.VALID_PROMPT,
+                    main.correction_input(main.failing_subset(extracted, invalid_fields),
+                                          validation_log),
+                    CORRECTION_FORMAT, self.correct_model,
+                )
+                corrected_data = main.parse_correction(corrected)
+                record["corrected"] = corrected_data
+                if corrected_data is not None:
+                    final = main.merge_corrections(validated, corrected_data, invalid_fields)
+            if not resumed("corrected"):
+                record["final"] = final
+                checkpoint("corrected")
+
+            contract_id = final.get("Contract ID")
+            if contract_id in (None, "N/A"):
+                contract_id = None
+            if self.revisions is not None and contract_id is not None:
+                if previous is None:
+                    # Contract ID only known after extraction: no savings, but still an update
+                    previous = self.revisions.latest(contract_id)
+                # The same document again is not a new revision
+                if previous is not None and previous["document_hash"] != record["document_hash"]:
+                    record["revision"] = {
+                        "contract_id": contract_id,
+                        "previous": previous["revision"],
+                        "incremental": plan is not None,
+                        "reused": sorted(plan.reuse) if plan else [],
+                        "reextracted": plan.fields if plan else None,
+                        "sections_total": plan.sections_total if plan else None,
+                        "sections_changed": plan.sections_changed if plan else None,
+                        "changes": change_set(previous["final"], final),
+                    }
+
+            submission = None
+            zenskar_id = self._zenskar_id(previous)
+            if self.submit and resumed("submitted"):
+                submission = record["submission"]
+            elif self.submit:
+                stage = "submit"
+                payload = main.build_payload(final)
+                if zenskar_id is not None:
+                    before = main.build_payload(previous["final"])
+                    payload = {key: value for key, value in payload.items()
+                               if before.get(key) != value}
+                if zenskar_id is not None and not payload:
+                    submission = {"status": "unchanged", "retries": 0}
+                else:
+                    submission = await self._stage(tracer, "submit", self.submit_limit,
+                                                   self._submit, record["document_hash"],
+                                                   payload, zenskar_id)
+                record["submission"] = submission
+                if submission["status"] == "failed":
+                    record["status"] = "failed"
+                    record["error"] = {"stage": stage, "message": submission.get("error")
+                                       or f"HTTP {submission['status_code']}"}
+            zenskar_id = created_id(submission) or zenskar_id
+            # A submitted revision becomes the baseline only once its Zenskar contract is known,
+            # so the next one is sent as an update of that contract, never as a second create
+            if (self.revisions is not None and contract_id is not None and record["status"] == "ok"
+                    and (not self.submit or zenskar_id is not None)):
+                self.revisions.record(contract_id, record["document_hash"], markdown, final,
+                                      zenskar_id)
+            if self.layout_index is not None and record["status"] == "ok":
+                # Only once submitted (or with no submit step), and only what validates
+                learned = learnable(final)
+                if learned:
+                    self.layout_index.learn(markdown, learned)
+            if self.submit and record["status"] == "ok":
+                checkpoint("submitted")
+        except Exception as e:
+            record["status"] = "failed"
+            record["error"] = {"stage": stage, "message": f"{type(e).__name__}: {e}",
+                               "traceback": traceback.format_exc()}
+
+
+def learnable(final):
+    """The fields of a final record that pass validation and hold a value, for the layout index."""
+    _, _, invalid_fields = main.validate_record(final)
+    values = flatten(final)
+    paths = [path for path in FIELD_PATHS
+             if path not in invalid_fields and main.has_value(values.get(path))]
+    return select_fields(final, paths) if paths else None
+
+
+def created_id(submission):
+    """Zenskar contract id from a create/update response body, if any."""
+    if not submission or not submission.get("body"):
+        return None
+    try:
+        return json.loads(submission["body"]).get("id")
+    except (json.JSONDecodeError, AttributeError):
+        return None
+
+
+def summarize(records, wall_time):
+    """Throughput, latency percentiles and failures for a finished run."""
+    latencies = [r["latency"] for r in records]
+    stages = sorted({name for r in records for name in r["timings"]})
+    failures = [{"id": r["id"], "source": r["source"], **r["error"]}
+                for r in records if r["status"] != "ok"]
+    for failure in failures:
+        failure.pop("traceback", None)
+    return {
+        "documents": len(records),
+        "succeeded": len(records) - len(failures),
+        "failed": len(failures),
+        "wall_time": wall_time,
+        "throughput_docs_per_sec": len(records) / wall_time if wall_time else None,
+        "latency": {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95)},
+        "stages": {
+            name: {
+                "p50": percentile([r["timings"][name] for r in records if name in r["timings"]], 50),
+                "p95": percentile([r["timings"][name] for r in records if name in r["timings"]], 95),
+            }
+            for name in stages
+        },
+        "correction": correction_stats(records),
+        "fast_path": fast_path_stats(records),
+        "layout": layout_stats(records),
+        "revisions": revision_stats(records),
+        "routing": routing_stats(records),
+        "context": context_stats(records),
+        "pages": page_stats(records),
+        "stream": stream_stats(records),
+        "failures": failures,
+    }
+
+
+def correction_stats(records):
+    """How many contracts and fields skipped the LLM correction pass."""
+    validated = [r for r in records if "invalid_fields" in r]
+    fields = sum(count_fields(r["extracted"]) for r in validated)
+    corrected_fields = sum(len(r["invalid_fields"]) for r in validated)
+    return {
+        "contracts_fast_path": sum(1 for r in validated if not r["invalid_fields"]),
+        "contracts_corrected": sum(1 for r in validated if r["invalid_fields"]),
+        "fields_fast_path": fields - corrected_fields,
+        "fields_corrected": corrected_fields,
+    }
+
+
+def fast_path_stats(records):
+    """Documents that needed no extraction call, and the hit rate per field."""
+    results = [r["fast_path"] for r in records if "fast_path" in r]
+    hits = {}
+    for result in results:
+        for path in result["hits"]:
+            hits[path] = hits.get(path, 0) + 1
+    return {
+        "documents": len(results),
+        "documents_without_llm": sum(1 for r in results if not r["missing"]),
+        "hit_rate": {path: count / len(results) for path, count in sorted(hits.items())},
+    }
+
+
+def layout_stats(records):
+    """How often the layout index recognized a document and what it supplied."""
+    layouts = [r["layout"] for r in records if "layout" in r]
+    return {
+        "documents": len(layouts),
+        "known_layouts": sum(1 for layout in layouts if layout["known"]),
+        "fields_from_index": sum(len(layout["from_index"]) for layout in layouts),
+        "narrowed_requests": sum(1 for layout in layouts if layout["narrowed"]),
+    }
+
+
+def revision_stats(records):
+    """Amended contracts, and how many of their fields were reused rather than re-extracted."""
+    revisions = [r["revision"] for r in records if "revision" in r]
+    incremental = [revision for revision in revisions if revision["incremental"]]
+    return {
+        "documents": len(revisions),
+        "incremental": len(incremental),
+        "fields_reused": sum(len(revision["reused"]) for revision in incremental),
+        "fields_reextracted": sum(len(revision["reextracted"]) for revision in incremental),
+        "fields_changed": sum(len(revision["changes"]) for revision in revisions),
+        "updates": sum(1 for r in records if "revision" in r
+                       and r.get("submission", {}).get("status") == "updated"),
+    }
+
+
+def routing_stats(records):
+    """Documents the fast deployment answered alone, and what escalation cost and fixed."""
+    routed = [r for r in records if "routing" in r]
+    escalated = [r for r in routed if r["routing"]["escalated"]]
+    fast_only = [r for r in routed if not r["routing"]["escalated"]]
+    reasons = {}
+    for r in escalated:
+        for reason in r["routing"]["reasons"]:
+            reasons[reason] = reasons.get(reason, 0) + 1
+    escalate_seconds = [r["routing"]["escalate_seconds"] for r in escalated]
+    return {
+        "documents": len(routed),
+        "fast_only": len(fast_only),
+        "escalated": len(escalated),
+        "escalation_rate": len(escalated) / len(routed) if routed else None,
+        "reasons": reasons,
+        "fields_escalated": sum(len(r["routing"]["escalated"]) for r in escalated),
+        "fields_fixed": sum(len(r["routing"]["fixed"]) for r in escalated),
+        "latency": {
+            "fast_only": {"p50": percentile([r["latency"] for r in fast_only], 50),
+                          "p95": percentile([r["latency"] for r in fast_only], 95)},
+            "escalated": {"p50": percentile([r["latency"] for r in escalated], 50),
+                          "p95": percentile([r["latency"] for r in escalated], 95)},
+            "escalate": {"p50": percentile(escalate_seconds, 50),
+                         "p95": percentile(escalate_seconds, 95)},
+        },
+    }
+
+
+def page_stats(records):
+    """Pages converted, skipped and sent through OCR by page-selective conversion."""
+    pages = [info for r in records for info in r.get("pages") or []]
+    converted = [info for info in pages if info["selected"]]
+    return {
+        "pages": len(pages),
+        "converted": len(converted),
+        "skipped": len(pages) - len(converted),
+        "ocr": sum(1 for info in pages if info["ocr"]),
+        "probe_seconds": sum(info["probe_seconds"] for info in pages),
+        "convert_seconds_per_page": {
+            "p50": percentile([info["convert_seconds"] for info in converted], 50),
+            "p95": percentile([info["convert_seconds"] for info in converted], 95),
+        },
+    }
+
+
+def stream_stats(records):
+    """Documents converted range by range, and the conversion peak RSS per document."""
+    streamed = [r["stream"] for r in records if "stream" in r]
+    peaks = [r["convert_peak_rss_kb"] for r in records if "convert_peak_rss_kb" in r]
+    return {
+        "documents": len(streamed),
+        "pages": sum(stream["pages"] for stream in streamed),
+        "ranges": sum(len(stream["ranges"]) for stream in streamed),
+        "tokens_seen": sum(stream["tokens_seen"] for stream in streamed),
+        "tokens_kept": sum(stream["tokens_kept"] for stream in streamed),
+        "convert_peak_rss_kb": {"p50": percentile(peaks, 50), "p95": percentile(peaks, 95),
+                                "max": max(peaks) if peaks else None},
+    }
+
+
+def context_stats(records):
+    """Prompt tokens saved by relevance-filtered context."""
+    contexts = [r["context"] for r in records if "context" in r]
+    tokens_full = sum(c["tokens_full"] for c in contexts)
+    tokens_sent = sum(c["tokens_sent"] for c in contexts)
+    return {
+        "modes": {mode: sum(1 for c in contexts if c["mode"] == mode)
+                  for mode in sorted({c["mode"] for c in contexts})},
+        "tokens_full": tokens_full,
+        "tokens_sent": tokens_sent,
+        "tokens_saved_pct": 100 * (1 - tokens_sent / tokens_full) if tokens_full else None,
+    }
+
+
+def count_fields(data):
+    return sum(len(value) if key == "Metadata" and isinstance(value, dict) else 1
+               for key, value in data.items())
+
+
+async def run_batch(sources, out_dir, otel_export=None, **pipeline_options):
+    """Process all sources, writing one JSON and one trace per document plus summary.json.
+
+    Traces go to <out_dir>/traces/<doc_id>.trace.jsonl; with `otel_export`
+    the spans are also appended to that file as OTLP/JSON.
+    """
+    out_dir = Path(out_dir)
+    trace_dir = out_dir / "traces"
+    trace_dir.mkdir(parents=True, exist_ok=True)
+    pipeline = Pipeline(**pipeline_options)
+    exporter = OTLPFileExporter(otel_export) if otel_export else None
+    seen = set()
+    jobs = [(doc_id_for(source, seen), source) for source in sources]
+    tracers = []
+
+    async def run_one(doc_id, source):
+        tracer = Tracer(doc_id)
+        tracers.append(tracer)
+        record = await pipeline.process(doc_id, source, tracer)
+        (out_dir / f"{doc_id}.json").write_text(json.dumps(record, indent=4))
+        tracer.write_jsonl(trace_dir / f"{doc_id}.trace.jsonl")
+        if exporter is not None:
+            exporter.export(tracer)
+        print(f"[{record['status']}] {source} ({record['latency']:.2f}s)")
+        return record
+
+    start = time.perf_counter()
+    try:
+        records = await asyncio.gather(*(run_one(doc_id, source) for doc_id, source in jobs))
+    finally:
+        pipeline.close()
+    summary = run_summary(pipeline, records, tracers, time.perf_counter() - start)
+    (out_dir / "summary.json").write_text(json.dumps(summary, indent=4))
+    return summary
+
+
+async def run_jobs(store, sources, out_dir, worker=None, lease_seconds=DEFAULT_LEASE, poll=1.0,
+                   otel_export=None, **pipeline_options):
+    """Drain a durable job queue (jobs.py), resuming jobs from their last checkpoint.
+
+    `sources` are enqueued first (already queued ones are left alone). Any
+    number of processes can run this against the same store; each writes
+    its documents as run_batch does and its own summary-<worker>.json.
+    Returns once no job is queued or running anywhere.
+    """
+    worker = worker or default_worker()
+    store.enqueue(sources, doc_id_for)
+    out_dir = Path(out_dir)
+    trace_dir = out_dir / "traces"
+    trace_dir.mkdir(parents=True, exist_ok=True)
+    pipeline = Pipeline(**pipeline_options)
+    # Claim only what this worker can start on soon and leave the rest to other workers
+    slots = pipeline_options.get("max_in_flight") or 2 * pipeline.convert_workers
+    exporter = OTLPFileExporter(otel_export) if otel_export else None
+    tracers = {}
+    records = {}
+
+    async def run_one(job):
+        tracer = Tracer(job.job_id)
+        record = await pipeline.process(job.job_id, job.source, tracer, job)
+        if not store.finish(job, record):
+            # Reclaimed by another worker after our lease ran out: its result stands
+            print(f"[lease lost] {job.source}")
+            return
+        # A job retried in this run is reported by its last attempt
+        tracers[job.job_id] = tracer
+        records[job.job_id] = record
+        (out_dir / f"{job.job_id}.json").write_text(json.dumps(record, indent=4))
+        tracer.write_jsonl(trace_dir / f"{job.job_id}.trace.jsonl")
+        if exporter is not None:
+            exporter.export(tracer)
+        resumed = f", resumed after {record['resumed_from']}" if "resumed_from" in record else ""
+        print(f"[{record['status']}] {job.source} ({record['latency']:.2f}s{resumed})")
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            store.renew(worker, lease_seconds)
+
+    start = time.perf_counter()
+    running = set()
+    renewer = asyncio.create_task(heartbeat())
+    try:
+        while True:
+            while len(running) < slots:
+                job = store.claim(worker, lease_seconds)
+                if job is None:
+                    break
+                running.add(asyncio.create_task(run_one(job)))
+            if running:
+                done, running = await asyncio.wait(running, timeout=poll,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+            elif store.remaining():
+                # Other workers hold the rest; wait in case one of them dies
+                await asyncio.sleep(poll)
+            else:
+                break
+    finally:
+        renewer.cancel()
+        for task in running:
+            task.cancel()
+        store.release(worker)
+        pipeline.close()
+    records = list(records.values())
+    summary = run_summary(pipeline, records, list(tracers.values()), time.perf_counter() - start)
+    summary["jobs"] = {"worker": worker,
+                       "resumed": sum(1 for r in records if "resumed_from" in r),
+                       **store.stats()}
+    (out_dir / f"summary-{worker}.json").write_text(json.dumps(summary, indent=4))
+    return summary
+
+
+def run_summary(pipeline, records, tracers, wall_time):
+    """summarize() plus the pipeline's own counters."""
+    summary = summarize(records, wall_time)
+    summary["llm"] = pipeline.llm.stats()
+    summary["submission"] = pipeline.submitter.stats()
+    summary["stream"]["workers_recycled"] = pipeline.converter.recycled
+    summary["trace"] = aggregate(tracers)
+    if pipeline.cache is not None:
+        summary["cache"] = pipeline.cache.stats()
+    if pipeline.layout_index is not None:
+        summary["layout"]["index"] = pipeline.layout_index.stats()
+    if pipeline.packer is not None:
+        summary["packing"] = pipeline.packer.stats()
+    if pipeline.routing is not None:
+        summary["routing"]["policy"] = pipeline.routing.settings()
+    return summary
+
+
+def add_pipeline_arguments(parser):
+    """The Pipeline options, shared by batch.py and service.py."""
+    parser.add_argument("--convert-workers", type=int, default=None,
+                        help="docling conversion processes (default: CPU count)")
+    parser.add_argument("--convert-timeout", type=float, default=None,
+                        help="seconds allowed per document conversion")
+    parser.add_argument("--llm-concurrency", type=int, default=8)
+    parser.add_argument("--rpm", type=int, default=None, help="deployment requests-per-minute quota")
+    parser.add_argument("--tpm", type=int, default=None, help="deployment tokens-per-minute quota")
+    parser.add_argument("--max-retries", type=int, default=6, help="retries per LLM request")
+    parser.add_argument("--submit-concurrency", type=int, default=4)
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="documents held in the pipeline at once")
+    parser.add_argument("--prompt", choices=["PROMPT", "PROMPT1"], default="PROMPT")
+    parser.add_argument("--no-structured-output", action="store_true",
+                        help="do not constrain answers with a JSON-schema response_format")
+    parser.add_argument("--stable-prefix", action="store_true",
+                        help="send every extraction with one byte-stable system prompt (prompt, "
+                             "schema, few-shot examples) and the document last, so the "
+                             "provider's prompt cache applies")
+    parser.add_argument("--no-prefix-grouping", action="store_true",
+                        help="admit LLM requests first come, first served instead of grouped "
+                             "by prompt prefix")
+    parser.add_argument("--context-tokens", type=int, default=6000,
+                        help="token budget for document content per request; longer "
+                             "documents send only relevant sections (0 sends everything)")
+    parser.add_argument("--max-pages", type=int, default=None,
+                        help="convert at most the first N pages of each PDF")
+    parser.add_argument("--page-keywords", default=None,
+                        help='convert only pages mentioning one of these comma-separated '
+                             'keywords ("default" for a built-in list); the first page is kept')
+    parser.add_argument("--ocr", choices=OCR_MODES, default=None,
+                        help='"auto" OCRs only pages without a text layer; "all" and "none" '
+                             "force it (default: docling's full pipeline on every page)")
+    parser.add_argument("--stream-pages", type=int, default=None,
+                        help="convert PDFs longer than this many pages range by range, keeping "
+                             "only their relevant sections in memory")
+    parser.add_argument("--range-pages", type=int, default=10,
+                        help="pages per conversion call when streaming")
+    parser.add_argument("--rss-budget-mb", type=int, default=None,
+                        help="conversion worker memory budget: ranges shrink above it and the "
+                             "worker is replaced after a document that leaves it above")
+    parser.add_argument("--route", choices=SCOPES, default=None,
+                        help="extract with --fast-model first and re-ask --strong-model for "
+                             '"fields" that fail validation, or for the whole "document"')
+    parser.add_argument("--fast-model", default=main.MODEL,
+                        help="deployment tried first (default: AZURE_DEPLOYMENT_NAME)")
+    parser.add_argument("--strong-model", default=main.STRONG_MODEL,
+                        help="deployment escalated to (default: AZURE_STRONG_DEPLOYMENT_NAME)")
+    parser.add_argument("--escalate-log-entries", type=int, default=0,
+                        help="escalate when validation logs more entries than this")
+    parser.add_argument("--min-completeness", type=float, default=0.8,
+                        help="escalate missing fields when fewer than this share have a value")
+    parser.add_argument("--correct-with", choices=["fast", "strong"], default="strong",
+                        help="deployment for the correction pass when routing")
+    parser.add_argument("--no-fast-path", action="store_true",
+                        help="send every field to the LLM instead of trying patterns first")
+    parser.add_argument("--templates", default=None,
+                        help="JSON file of extra fast-path templates (see fastpath.py)")
+    parser.add_argument("--fast-path-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="confidence below which a fast-path value is re-asked of the LLM")
+    parser.add_argument("--layout-index", default=DEFAULT_INDEX,
+                        help="learned field locations per document layout, kept across runs")
+    parser.add_argument("--no-layout-index", action="store_true",
+                        help="neither use nor update the layout index")
+    parser.add_argument("--revisions", default=DEFAULT_REVISIONS,
+                        help="latest revision per Contract ID, for incremental re-extraction")
+    parser.add_argument("--no-revisions", action="store_true",
+                        help="extract every document in full and always create a new contract")
+    parser.add_argument("--pack-tokens", type=int, default=0,
+                        help="extract small documents together, up to this many content "
+                             "tokens per request (0 sends one document per request)")
+    parser.add_argument("--pack-max-docs", type=int, default=8,
+                        help="documents per packed request")
+    parser.add_argument("--pack-wait", type=float, default=0.2,
+                        help="seconds a small document waits for others to share its request")
+    parser.add_argument("--no-submit", action="store_true", help="skip the Zenskar POST")
+    parser.add_argument("--zenskar-url", default=main.ZENSKAR_URL)
+    parser.add_argument("--ledger", default=DEFAULT_LEDGER,
+                        help="submission ledger; documents already in it are not posted again")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--cache-max-mb", type=int, default=1024)
+    parser.add_argument("--no-cache", action="store_true", help="bypass the cache")
+    parser.add_argument("--refresh-cache", action="store_true",
+                        help="ignore cached entries and overwrite them with fresh results; "
+                             "revisions are extracted in full too")
+    parser.add_argument("--clear-cache", action="store_true", help="drop all cached entries first")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Extract contracts in bulk.")
+    parser.add_argument("target", help="directory, glob pattern or manifest file")
+    parser.add_argument("--out", default="./results", help="output directory")
+    add_pipeline_arguments(parser)
+    parser.add_argument("--otel-export", default=None, metavar="PATH",
+                        help="also append OpenTelemetry (OTLP/JSON) spans to this file")
+    parser.add_argument("--jobs", nargs="?", const=DEFAULT_JOBS, default=None, metavar="PATH",
+                        help="run from a durable job queue that checkpoints every stage, so a "
+                             "rerun resumes where it stopped; start several processes to "
+                             f"drain it together (default path: {DEFAULT_JOBS})")
+    parser.add_argument("--worker", default=None,
+                        help="worker name in the job queue (default: host-pid)")
+    parser.add_argument("--lease", type=float, default=DEFAULT_LEASE,
+                        help="seconds before a job held by an unresponsive worker is reclaimed")
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help="attempts per job before it is marked failed")
+    return parser.parse_args(argv)
+
+
+def page_selection_from_args(args):
+    """A PageSelection when any page option was given, else None (full conversion)."""
+    if args.max_pages is None and args.page_keywords is None and args.ocr is None:
+        return None
+    keywords = None
+    if args.page_keywords:
+        keywords = (DEFAULT_KEYWORDS if args.page_keywords == "default"
+                    else args.page_keywords.split(","))
+    return PageSelection(max_pages=args.max_pages, keywords=keywords, ocr=args.ocr or "auto")
+
+
+def cache_from_args(args):
+    cache = Cache(args.cache_dir, max_bytes=args.cache_max_mb * 1024 * 1024,
+                  enabled=not args.no_cache, refresh=args.refresh_cache)
+    if args.clear_cache:
+        cache.clear()
+    return cache
+
+
+def pipeline_options_from_args(args, cache):
+    """Pipeline keyword arguments for the options added by add_pipeline_arguments."""
+    return dict(
+        convert_workers=args.convert_workers,
+        convert_timeout=args.convert_timeout,
+        llm_concurrency=args.llm_concurrency,
+        submit_concurrency=args.submit_concurrency,
+        max_in_flight=args.max_in_flight,
+        prompt=getattr(main, args.prompt),
+        submit=not args.no_submit,
+        cache=cache,
+        context_tokens=args.context_tokens,
+        structured=not args.no_structured_output,
+        stable_prefix=args.stable_prefix,
+        fast_path=not args.no_fast_path,
+        templates=TEMPLATES + (load_templates(args.templates) if args.templates else []),
+        fast_path_threshold=args.fast_path_threshold,
+        layout_index=None if args.no_layout_index else LayoutIndex(args.layout_index),
+        pack_tokens=args.pack_tokens,
+        pack_max_docs=args.pack_max_docs,
+        pack_wait=args.pack_wait,
+        revisions=None if args.no_revisions else RevisionStore(args.revisions),
+        refresh=args.refresh_cache,
+        page_selection=page_selection_from_args(args),
+        routing=None if args.route is None else RoutingPolicy(
+            args.fast_model, args.strong_model, args.escalate_log_entries, args.min_completeness,
+            args.route, args.correct_with),
+        stream=None if args.stream_pages is None else StreamOptions(
+            args.stream_pages, args.range_pages, args.rss_budget_mb, args.context_tokens or 6000),
+        submitter=ZenskarSubmitter(args.zenskar_url, SubmissionLedger(args.ledger),
+                                   max_workers=args.submit_concurrency),
+        llm=AsyncLLM(rpm=args.rpm, tpm=args.tpm, max_in_flight=args.llm_concurrency,
+                     max_retries=args.max_retries, cache=cache,
+                     group_prefixes=not args.no_prefix_grouping),
+    )
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    sources = discover_sources(args.target)
+    cache = cache_from_args(args)
+    pipeline_options = pipeline_options_from_args(args, cache)
+    store = None
+    if args.jobs:
+        store = JobStore(args.jobs, max_attempts=args.max_attempts)
+        run = run_jobs(store, sources, args.out, worker=args.worker, lease_seconds=args.lease,
+                       otel_export=args.otel_export, **pipeline_options)
+    else:
+        run = run_batch(sources, args.out, otel_export=args.otel_export, **pipeline_options)
+    summary = asyncio.run(run)
+    if store is not None:
+        store.close()
+    cache.close()
+    print(json.dumps({k: v for k, v in summary.items() if k != "failures"}, indent=4))
+    for failure in summary["failures"]:
+        print(f"FAILED {failure['source']} at {failure['stage']}: {failure['message']}")
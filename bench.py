@@ -0,0 +1,335 @@
+"""Offline end-to-end benchmark: recorded LLM answers, stubbed Zenskar API.
+
+Runs the full batch pipeline (docling conversion, extraction, validation,
+correction, submission) over a corpus built from `sample_contract.pdf` and
+synthetic variants of it at different page counts. Completions are replayed
+from cassettes keyed by request hash (the same key as the completion cache),
+and contracts are posted to a local `ZenskarStub`, so no Azure or Zenskar
+endpoint is needed once the cassettes are recorded. A request without a
+cassette is answered from `bench/expected.json`, the hand-labelled fields
+of the sample contract, so the benchmark also runs offline before anything
+is recorded; those answers report estimated tokens and no latency.
+
+The report covers documents per second, per-stage latency percentiles, peak
+memory and token counts. It is compared against a stored baseline and the
+run exits non-zero if throughput, latency, memory or tokens regress beyond
+the tolerance or any extracted record changed.
+
+    # Record cassettes once against the live deployment
+    python bench.py --record
+    # Replay offline and compare with bench/baseline.json (written by the first run)
+    python bench.py
+    python bench.py --update-baseline
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+from batch import run_batch
+from cache import completion_key
+from llm import AsyncLLM, cached_tokens, estimate_tokens, make_async_client
+from submission import ZenskarSubmitter
+from zenskar_stub import ZenskarStub
+
+DEFAULT_CASSETTES = "./bench/cassettes"
+DEFAULT_BASELINE = "./bench/baseline.json"
+DEFAULT_EXPECTED = "./bench/expected.json"
+DEFAULT_CORPUS = "./.cache/bench/corpus"
+PAGE_COUNTS = (2, 4, 8, 16, 32)
+
+
+class CassetteMiss(Exception):
+    """No recorded completion for a request in replay mode."""
+
+
+def request_key(kwargs):
+    """Cassette key for a chat.completions.create request."""
+    messages = kwargs["messages"]
+    system = next((m["content"] for m in messages if m["role"] == "system"), "")
+    user = "\n".join(m["content"] for m in messages if m["role"] != "system")
+    params = {k: v for k, v in kwargs.items()
+              if k not in {"model", "messages", "stream", "stream_options"}}
+    return completion_key(user, system, kwargs.get("model"), params)
+
+
+class CassetteClient:
+    """Drop-in for AsyncAzureOpenAI that replays recorded completions.
+
+    With `record` a miss is sent to `client` (the live deployment by default)
+    and the answer is saved. Otherwise a miss is answered by `fixture(kwargs)`
+    (the answer text) if given, and raises CassetteMiss if not. With
+    `replay_latency` each replayed answer waits as long as the recorded
+    request took. Every response carries the recorded request's `latency`
+    in seconds.
+    """
+
+    def __init__(self, path=DEFAULT_CASSETTES, record=False, client=None, replay_latency=False,
+                 fixture=None):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.record = record
+        self.client = client
+        self.replay_latency = replay_latency
+        self.fixture = fixture
+        self.hits = 0
+        self.recorded = 0
+        self.fixtures = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        key = request_key(kwargs)
+        cassette = self.path / f"{key}.json"
+        if cassette.exists():
+            entry = json.loads(cassette.read_text())
+            self.hits += 1
+            if self.replay_latency:
+                await asyncio.sleep(entry["latency"])
+        elif self.record:
+            entry = await self._record(kwargs)
+            cassette.write_text(json.dumps(entry, indent=4))
+            self.recorded += 1
+        elif self.fixture is not None:
+            entry = self._fixture_entry(kwargs)
+            self.fixtures += 1
+        else:
+            raise CassetteMiss(f"no cassette {key} for a {kwargs.get('model')} request; "
+                               "rerun with --record")
+        usage = dict(entry["usage"])
+        # Cassettes recorded before cached tokens were kept have no count
+        details = SimpleNamespace(cached_tokens=usage.pop("cached_tokens", 0))
+        usage = SimpleNamespace(**usage, prompt_tokens_details=details)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=entry["content"],
+                                                             tool_calls=None),
+                                     finish_reason=entry["finish_reason"])],
+            usage=usage,
+            latency=entry["latency"],
+        )
+
+    def _fixture_entry(self, kwargs):
+        content = self.fixture(kwargs)
+        prompt_tokens = estimate_tokens(kwargs["messages"])
+        completion_tokens = len(content) // 4
+        return {"content": content, "finish_reason": "stop", "latency": 0.0,
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens}}
+
+    async def _record(self, kwargs):
+        if self.client is None:
+            self.client = make_async_client()
+        start = time.perf_counter()
+        response = await self.client.chat.completions.create(**kwargs)
+        latency = time.perf_counter() - start
+        usage = response.usage
+        return {
+            "model": kwargs.get("model"),
+            "prompt_tokens_estimate": estimate_tokens(kwargs["messages"]),
+            "content": response.choices[0].message.content,
+            "finish_reason": response.choices[0].finish_reason,
+            "usage": {"prompt_tokens": usage.prompt_tokens,
+                      "completion_tokens": usage.completion_tokens,
+                      "total_tokens": usage.total_tokens,
+                      "cached_tokens": cached_tokens(usage)},
+            "latency": latency,
+        }
+
+
+def expected_fixture(path=DEFAULT_EXPECTED):
+    """CassetteClient fixture answering every request with the labelled fields in `path`.
+
+    The answer follows the request's response_format: only the asked fields,
+    one record per id for packed requests, and for corrections the labelled
+    values as "Corrected Data".
+    """
+    expected = json.loads(Path(path).read_text())
+
+    def fill(schema, values):
+        answer = {}
+        for key, sub_schema in schema["properties"].items():
+            if sub_schema.get("type") == "object":
+                nested = values.get(key)
+                # Packed ids and "Corrected Data" hold a whole record
+                answer[key] = fill(sub_schema, nested if isinstance(nested, dict) else values)
+            elif sub_schema.get("type") == "array":
+                answer[key] = []
+            else:
+                answer[key] = values.get(key)
+        return answer
+
+    def answer(kwargs):
+        response_format = kwargs.get("response_format")
+        if not response_format:
+            return json.dumps(expected)
+        return json.dumps(fill(response_format["json_schema"]["schema"], expected))
+
+    return answer
+
+
+def make_corpus(sample="./sample_contract.pdf", out_dir=DEFAULT_CORPUS, page_counts=PAGE_COUNTS):
+    """The sample contract plus variants padded to each page count by repeating its pages."""
+    import pypdfium2
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    sources = [str(sample)]
+    original = pypdfium2.PdfDocument(str(sample))
+    try:
+        pages = len(original)
+        for count in page_counts:
+            if count <= pages:
+                continue
+            target = out_dir / f"{Path(sample).stem}-{count}p.pdf"
+            if not target.exists():
+                variant = pypdfium2.PdfDocument.new()
+                variant.import_pages(original, [i % pages for i in range(count)])
+                variant.save(str(target))
+                variant.close()
+            sources.append(str(target))
+    finally:
+        original.close()
+    return sources
+
+
+def record_digest(record):
+    return hashlib.sha256(json.dumps(record.get("final"), sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def report(summary, records):
+    """The metrics compared against the baseline."""
+    trace = summary["trace"]
+    return {
+        "documents": summary["documents"],
+        "succeeded": summary["succeeded"],
+        "throughput_docs_per_sec": summary["throughput_docs_per_sec"],
+        "latency": summary["latency"],
+        "stages": {name: {"p50": stage["wall_p50"], "p95": stage["wall_p95"]}
+                   for name, stage in trace.items()},
+        "peak_rss_kb": max(stage["peak_rss_kb"] for stage in trace.values()),
+        "llm_requests": summary["llm"]["requests"],
+        "prompt_tokens": summary["llm"]["prompt_tokens"],
+        "completion_tokens": summary["llm"]["completion_tokens"],
+        "outputs": {r["id"]: record_digest(r) for r in records},
+    }
+
+
+def compare(current, baseline, tolerance=0.2, min_seconds=0.01):
+    """Regressions of `current` against `baseline`, as human-readable strings.
+
+    Latencies that grew by less than `min_seconds` are ignored as timer noise.
+    """
+    regressions = []
+
+    def worse(name, now, before, higher_is_better=False, slack=tolerance, floor=0):
+        if now is None or before is None:
+            return
+        if higher_is_better:
+            failed = now < before * (1 - slack)
+        else:
+            failed = now > before * (1 + slack) and now - before > floor
+        if failed:
+            regressions.append(f"{name}: {now:.4g} vs baseline {before:.4g}")
+
+    if current["succeeded"] < baseline["succeeded"]:
+        regressions.append(f"succeeded: {current['succeeded']} vs baseline {baseline['succeeded']}")
+    worse("throughput_docs_per_sec", current["throughput_docs_per_sec"],
+          baseline["throughput_docs_per_sec"], higher_is_better=True)
+    for pct in ("p50", "p95"):
+        worse(f"latency.{pct}", current["latency"][pct], baseline["latency"][pct],
+              floor=min_seconds)
+    for name, stage in baseline["stages"].items():
+        if name in current["stages"]:
+            worse(f"stages.{name}.p95", current["stages"][name]["p95"], stage["p95"],
+                  floor=min_seconds)
+    worse("peak_rss_kb", current["peak_rss_kb"], baseline["peak_rss_kb"])
+    # Token counts are deterministic under replay, so any growth is a regression
+    for name in ("llm_requests", "prompt_tokens", "completion_tokens"):
+        worse(name, current[name], baseline[name], slack=0)
+    for doc_id, digest in baseline["outputs"].items():
+        if current["outputs"].get(doc_id) != digest:
+            regressions.append(f"outputs.{doc_id}: final record differs from baseline")
+    return regressions
+
+
+async def run_bench(sources, cassettes, record=False, replay_latency=False, convert_workers=None,
+                    llm_concurrency=8, out_dir=None, expected=DEFAULT_EXPECTED):
+    """`expected=None` fails requests without a cassette instead of answering them."""
+    fixture = expected_fixture(expected) if expected else None
+    client = CassetteClient(cassettes, record=record, replay_latency=replay_latency,
+                            fixture=fixture)
+    with ZenskarStub() as stub, tempfile.TemporaryDirectory() as tmp:
+        out_dir = out_dir or tmp
+        summary = await run_batch(
+            sources,
+            out_dir,
+            convert_workers=convert_workers,
+            llm_concurrency=llm_concurrency,
+            llm=AsyncLLM(client, max_in_flight=llm_concurrency),
+            submitter=ZenskarSubmitter(stub.url),
+        )
+        records = [json.loads(p.read_text()) for p in sorted(Path(out_dir).glob("*.json"))
+                   if p.name != "summary.json"]
+    return report(summary, records), client
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline benchmark.")
+    parser.add_argument("--sample", default="./sample_contract.pdf")
+    parser.add_argument("--pages", type=int, nargs="*", default=list(PAGE_COUNTS),
+                        help="page counts of the synthetic variants")
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS)
+    parser.add_argument("--cassettes", default=DEFAULT_CASSETTES)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--record", action="store_true",
+                        help="send requests without a cassette to Azure and record them")
+    parser.add_argument("--expected", default=DEFAULT_EXPECTED,
+                        help="labelled fields that answer requests without a cassette")
+    parser.add_argument("--strict", action="store_true",
+                        help="fail requests without a cassette instead of using --expected")
+    parser.add_argument("--replay-latency", action="store_true",
+                        help="wait as long as each recorded request took")
+    parser.add_argument("--convert-workers", type=int, default=None)
+    parser.add_argument("--llm-concurrency", type=int, default=8)
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative slowdown/growth before failing (default 0.2)")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--out", default=None, help="keep per-document results here")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    sources = make_corpus(args.sample, args.corpus_dir, args.pages)
+    current, client = asyncio.run(run_bench(
+        sources, args.cassettes, record=args.record, replay_latency=args.replay_latency,
+        convert_workers=args.convert_workers, llm_concurrency=args.llm_concurrency,
+        out_dir=args.out, expected=None if args.strict else args.expected,
+    ))
+    print(json.dumps({k: v for k, v in current.items() if k != "outputs"}, indent=4))
+    print(f"cassettes: {client.hits} replayed, {client.recorded} recorded, "
+          f"{client.fixtures} answered from {args.expected}")
+
+    if current["succeeded"] < current["documents"]:
+        # A failed run is neither compared nor kept as the baseline
+        sys.exit(f"{current['documents'] - current['succeeded']} of {current['documents']} "
+                 f"documents failed; baseline left as it is")
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline or not baseline_path.exists():
+        # The first run on a machine sets the baseline the later runs are held to
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(current, indent=4))
+        print(f"baseline written to {baseline_path}")
+    else:
+        regressions = compare(current, json.loads(baseline_path.read_text()), args.tolerance)
+        if regressions:
+            print("REGRESSIONS against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("no regressions against baseline")
@@ -0,0 +1,72 @@
+"""Peak conversion memory per document, full vs. streaming conversion.
+
+Builds long variants of `sample_contract.pdf` (see bench.make_corpus) and
+converts each in a fresh single-worker pool, once with the default
+pipeline and once range by range (page_stream.py). Reports the worker's
+peak RSS for the document, the wall time and how much markdown reached
+extraction. Exits non-zero if a streamed document peaked above
+--rss-budget-mb.
+
+    python bench_memory.py --pages 100 500 --range-pages 10 --rss-budget-mb 1500
+"""
+import argparse
+import json
+import sys
+import time
+
+from bench import DEFAULT_CORPUS, make_corpus
+from conversion import ConversionPool
+from page_stream import StreamOptions
+
+
+def measure(sources, stream=None):
+    results = {}
+    for source in sources:
+        # A fresh worker per document so one document's peak does not carry over
+        with ConversionPool(workers=1, stream=stream) as pool:
+            start = time.perf_counter()
+            detail = pool.convert_pages(source)
+            wall = time.perf_counter() - start
+        results[source] = {
+            "wall_time": wall,
+            "peak_rss_mb": detail["peak_rss_kb"] / 1024,
+            "markdown_chars": len(detail["markdown"]),
+            "ranges": len(detail["stream"]["ranges"]) if detail["stream"] else None,
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare conversion peak RSS, full vs streaming.")
+    parser.add_argument("--sample", default="./sample_contract.pdf")
+    parser.add_argument("--pages", type=int, nargs="*", default=[100, 500])
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS)
+    parser.add_argument("--range-pages", type=int, default=10)
+    parser.add_argument("--rss-budget-mb", type=int, default=None)
+    parser.add_argument("--skip-full", action="store_true",
+                        help="only measure streaming (full conversion may not fit in memory)")
+    parser.add_argument("--json", default=None, help="save the results here")
+    args = parser.parse_args()
+
+    sources = [source for source in make_corpus(args.sample, args.corpus_dir, args.pages)
+               if source != args.sample]
+    stream = StreamOptions(min_pages=0, range_pages=args.range_pages,
+                           rss_budget_mb=args.rss_budget_mb)
+    results = {"stream": measure(sources, stream)}
+    if not args.skip_full:
+        results["full"] = measure(sources)
+    for source in sources:
+        line = f"{source}: stream {results['stream'][source]['peak_rss_mb']:.0f} MB " \
+               f"{results['stream'][source]['wall_time']:.1f}s"
+        if "full" in results:
+            line += f", full {results['full'][source]['peak_rss_mb']:.0f} MB " \
+                    f"{results['full'][source]['wall_time']:.1f}s"
+        print(line)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+    over = [source for source, result in results["stream"].items()
+            if args.rss_budget_mb and result["peak_rss_mb"] > args.rss_budget_mb]
+    if over:
+        print(f"over the {args.rss_budget_mb} MB budget: {', '.join(over)}")
+        sys.exit(1)
@@ -0,0 +1,130 @@
+"""Benchmark relevance-filtered context: token savings vs extraction accuracy.
+
+Corpus: a directory of contracts as .md (docling markdown) or .pdf, each
+optionally with a `<name>.truth.json` holding the expected PROMPT fields.
+
+Without --llm this is offline: it reports tokens sent per document and the
+context recall, i.e. the share of ground-truth values found verbatim in the
+full document that are still present in the selected context.
+
+With --llm it also extracts each document twice (full markdown and selected
+context) and reports per-field accuracy of both against the ground truth,
+or agreement with the full-context extraction when there is no truth file.
+
+    python bench_sections.py ./corpus --budget 3000
+    python bench_sections.py ./corpus --budget 3000 --llm
+"""
+import argparse
+import asyncio
+import json
+import re
+from pathlib import Path
+
+import main
+from cache import Cache
+from llm import AsyncLLM
+from sections import plan_context, reduce_extractions
+
+
+def normalize(value):
+    return re.sub(r"[^a-z0-9]", "", str(value).lower())
+
+
+def flat_fields(data):
+    for name, value in data.items():
+        if name == "Metadata" and isinstance(value, dict):
+            for sub_field, sub_value in value.items():
+                yield f"Metadata.{sub_field}", sub_value
+        else:
+            yield name, value
+
+
+def load_corpus(path):
+    documents = []
+    for source in sorted(Path(path).iterdir()):
+        if source.suffix.lower() not in {".md", ".pdf"}:
+            continue
+        markdown = source.read_text() if source.suffix == ".md" else main.convert_document(str(source))
+        truth_path = source.with_name(source.stem + ".truth.json")
+        truth = json.loads(truth_path.read_text()) if truth_path.exists() else None
+        documents.append({"name": source.name, "markdown": markdown, "truth": truth})
+    return documents
+
+
+def context_recall(markdown, context, truth):
+    full = normalize(markdown)
+    sent = normalize(context)
+    locatable = [normalize(v) for _, v in flat_fields(truth) if v and normalize(v) in full]
+    if not locatable:
+        return None
+    return sum(1 for v in locatable if v in sent) / len(locatable)
+
+
+def accuracy(extracted, expected):
+    expected = dict(flat_fields(expected))
+    extracted = dict(flat_fields(extracted))
+    return {name: normalize(extracted.get(name, "")) == normalize(value)
+            for name, value in expected.items()}
+
+
+async def extract(llm, prompt, chunks):
+    answers = await asyncio.gather(*(llm.chat(prompt, chunk) for chunk in chunks))
+    results = [main.parse_extraction(answer) for answer in answers]
+    return results[0] if len(results) == 1 else reduce_extractions(results)
+
+
+async def run(documents, budget, use_llm, prompt):
+    llm = AsyncLLM(cache=Cache()) if use_llm else None
+    rows = []
+    for document in documents:
+        markdown = document["markdown"]
+        plan = plan_context(markdown, budget)
+        row = {
+            "name": document["name"],
+            "mode": plan.mode,
+            "tokens_full": plan.tokens_full,
+            "tokens_sent": plan.tokens_sent,
+        }
+        if document["truth"]:
+            row["context_recall"] = context_recall(markdown, "\n".join(plan.chunks), document["truth"])
+        if llm is not None:
+            full, selected = await asyncio.gather(extract(llm, prompt, [markdown]),
+                                                  extract(llm, prompt, plan.chunks))
+            expected = document["truth"] or full
+            row["accuracy_full"] = accuracy(full, expected)
+            row["accuracy_selected"] = accuracy(selected, expected)
+        rows.append(row)
+    return rows
+
+
+def report(rows):
+    tokens_full = sum(r["tokens_full"] for r in rows)
+    tokens_sent = sum(r["tokens_sent"] for r in rows)
+    print(f"{'document':40} {'mode':11} {'full':>8} {'sent':>8} {'recall':>7}")
+    for r in rows:
+        recall = r.get("context_recall")
+        recall = f"{recall:.2f}" if recall is not None else "-"
+        print(f"{r['name'][:40]:40} {r['mode']:11} {r['tokens_full']:8} {r['tokens_sent']:8} {recall:>7}")
+    if tokens_full:
+        print(f"\ntokens: {tokens_full} -> {tokens_sent} ({100 * (1 - tokens_sent / tokens_full):.1f}% saved)")
+    if rows and "accuracy_full" in rows[0]:
+        fields = sorted({name for r in rows for name in r["accuracy_full"]})
+        print(f"\n{'field':32} {'full':>6} {'selected':>9}")
+        for name in fields:
+            full = [r["accuracy_full"][name] for r in rows if name in r["accuracy_full"]]
+            selected = [r["accuracy_selected"][name] for r in rows if name in r["accuracy_selected"]]
+            print(f"{name:32} {sum(full) / len(full):6.2f} {sum(selected) / len(selected):9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus", help="directory of .md/.pdf contracts")
+    parser.add_argument("--budget", type=int, default=6000, help="context token budget")
+    parser.add_argument("--llm", action="store_true", help="also measure extraction accuracy")
+    parser.add_argument("--prompt", choices=["PROMPT", "PROMPT1"], default="PROMPT")
+    parser.add_argument("--json", help="write the per-document rows to this file")
+    args = parser.parse_args()
+    rows = asyncio.run(run(load_corpus(args.corpus), args.budget, args.llm, getattr(main, args.prompt)))
+    report(rows)
+    if args.json:
+        Path(args.json).write_text(json.dumps(rows, indent=4))
@@ -0,0 +1,220 @@
+"""Vectorized validation of many extracted records at once.
+
+`main.validate_record` checks one dict at a time. For nightly re-validation
+of the whole contract store the records are loaded into one pandas
+DataFrame (one column per field, "Metadata.<sub field>" for metadata) and
+every rule is applied as a column operation:
+
+- dates: YYYY-MM-DD, reformatted (validate_date)
+- Contract Amount: "$25,000" / "25000.00" -> "25000.00" (validate_monetary)
+- Status: one of the allowed statuses, capitalized (validate_status)
+- Contract ID / Customer ID / Metadata: "unknown", "not specified" and the
+  like are flagged (handle_missing_or_ambiguous)
+- null values are flagged as missing
+
+The results match the per-record functions, including the log messages.
+Values that are not strings fail validation here, where the per-record
+functions would raise.
+
+    values, present = to_frame(records)
+    validated, log, invalid = validate_frame(values, present)
+    records = to_records(validated, present)
+
+    python bulk_validation.py ./results --out validated.jsonl --log validation_log.csv
+"""
+import argparse
+import json
+import re
+from pathlib import Path
+
+import pandas as pd
+
+from schema import flatten
+
+DATE_FIELDS = ["Contract Start Date", "Contract End Date"]
+ID_FIELDS = ["Contract ID", "Customer ID"]
+VALID_STATUSES = ["draft", "active", "paused", "expired", "disputed"]
+AMBIGUOUS_VALUES = ["(not specified)", "not specified", "(unknown)", "unknown"]
+
+# What strptime("%Y-%m-%d") accepts: 4-digit year, 1-2 digit month, 1-2 digit day
+# (or a space and one digit)
+_DATE_SHAPE = r"^\d{4}-(?:1[0-2]|0[1-9]|[1-9])-(?:3[01]|[12]\d|0[1-9]|[1-9]| [1-9])\Z"
+_MONETARY = re.compile(r"^\$?([\d,]+(\.\d{2})?)$")
+
+
+def to_frame(records):
+    """Records -> (values, present): object-dtype DataFrame plus a mask of the keys each record had.
+
+    The mask keeps absent fields apart from explicit nulls, which validate differently.
+    """
+    flat = [flatten(record, paths=None) for record in records]
+    columns = list(dict.fromkeys(key for record in flat for key in record))
+    values = pd.DataFrame({column: pd.Series([record.get(column) for record in flat], dtype=object)
+                           for column in columns})
+    present = pd.DataFrame({column: [column in record for record in flat] for column in columns})
+    return values, present
+
+
+def _strings(series):
+    """Boolean mask of the values that are str."""
+    if pd.api.types.infer_dtype(series, skipna=True) in {"string", "empty"}:
+        return series.notna()
+    return series.map(lambda value: isinstance(value, str)).astype(bool)
+
+
+def validate_dates(series):
+    is_str = _strings(series)
+    text = series.where(is_str, "")
+    shaped = is_str & text.str.match(_DATE_SHAPE)
+    parsed = pd.to_datetime(text.where(shaped, None), format="%Y-%m-%d", errors="coerce")
+    valid = shaped & parsed.notna()
+    return parsed.dt.strftime("%Y-%m-%d").where(valid).astype(object), valid
+
+
+def validate_amounts(series):
+    is_str = _strings(series)
+    text = series.where(is_str, "").str.replace(",", "", regex=False)
+    valid = is_str & text.str.match(_MONETARY)
+    # The matched group: no "$", and no newline (which "$" lets through)
+    number = text[valid].str.removeprefix("$").str.removesuffix("\n")
+    formatted = pd.Series(None, index=series.index, dtype=object)
+    formatted[valid] = number.astype(float).map("{:.2f}".format)
+    return formatted, valid
+
+
+def validate_statuses(series):
+    is_str = _strings(series)
+    text = series.where(is_str, "")
+    valid = is_str & text.str.lower().isin(VALID_STATUSES)
+    return text.str.capitalize().where(valid).astype(object), valid
+
+
+def flag_ambiguous(series, default=None):
+    is_str = _strings(series)
+    valid = is_str & ~series.where(is_str, "").str.lower().isin(AMBIGUOUS_VALUES)
+    return series.where(valid, default).astype(object), valid
+
+
+def validate_frame(values, present=None):
+    """Validate every record in `values` (see to_frame).
+
+    Returns (validated, log, invalid): the validated DataFrame, a long-form
+    log with one row per failing (row, field) and its message, and a boolean
+    DataFrame of failing cells.
+    """
+    if present is None:
+        present = values.notna()
+    validated = values.copy()
+    invalid = pd.DataFrame(False, index=values.index, columns=values.columns)
+    logs = []
+
+    for column in values.columns:
+        series = values[column]
+        null = present[column] & series.isna()
+        prefix = None
+        if column == "Metadata":
+            # Null or empty Metadata passes through, as in validate_record
+            result, valid = series, pd.Series(True, index=series.index)
+        elif column.startswith("Metadata."):
+            result, valid = flag_ambiguous(series)
+            prefix = f"Ambiguous data in Metadata field '{column.split('.', 1)[1]}'"
+            valid = valid & ~null
+        else:
+            if column in DATE_FIELDS:
+                result, valid = validate_dates(series)
+                prefix = f"Invalid date in field '{column}'"
+            elif column == "Contract Amount":
+                result, valid = validate_amounts(series)
+                prefix = f"Invalid monetary value in field '{column}'"
+            elif column == "Status":
+                result, valid = validate_statuses(series)
+                prefix = f"Invalid status in field '{column}'"
+            elif column in ID_FIELDS:
+                result, valid = flag_ambiguous(series, default="N/A")
+                prefix = f"Missing data in field '{column}'"
+            else:
+                result, valid = series, ~null
+            # Structured output uses null for fields it could not find
+            result = result.where(~null)
+            valid = valid & ~null
+        failing = present[column] & ~valid
+        validated[column] = result.where(present[column])
+        invalid[column] = failing
+
+        if failing.any():
+            shown = series[failing]
+            message = shown.map(lambda value: f"{prefix}: '{value}'")
+            if not column.startswith("Metadata."):
+                message[null[failing]] = f"Missing data in field '{column}': null"
+            logs.append(pd.DataFrame({"row": shown.index, "field": column,
+                                      "message": message.to_numpy()}))
+
+    columns = ["row", "field", "message"]
+    log = pd.concat(logs, ignore_index=True) if logs else pd.DataFrame(columns=columns)
+    log = log.sort_values("row", kind="stable", ignore_index=True)
+    return validated, log, invalid
+
+
+def to_records(validated, present):
+    """Validated DataFrame -> list of nested dicts shaped like the input records."""
+    records = []
+    columns = list(validated.columns)
+    for values, mask in zip(validated.itertuples(index=False, name=None),
+                            present.itertuples(index=False, name=None)):
+        record = {}
+        for column, value, has in zip(columns, values, mask):
+            if not has:
+                continue
+            if isinstance(value, float) and value != value:
+                value = None  # pandas fills rejected cells with NaN
+            if column.startswith("Metadata."):
+                record.setdefault("Metadata", {})[column.split(".", 1)[1]] = value
+            else:
+                record[column] = value
+        records.append(record)
+    return records
+
+
+def load_records(target):
+    """Extracted records from a batch results directory or a JSONL file.
+
+    Returns (ids, records).
+    """
+    path = Path(target)
+    ids, records = [], []
+    if path.is_dir():
+        for result in sorted(path.glob("*.json")):
+            data = json.loads(result.read_text())
+            if result.name == "summary.json" or "extracted" not in data:
+                continue
+            ids.append(data.get("id", result.stem))
+            records.append(data["extracted"])
+    else:
+        for n, line in enumerate(path.read_text().splitlines()):
+            if line.strip():
+                data = json.loads(line)
+                ids.append(data.get("id", n))
+                records.append(data.get("extracted", data))
+    return ids, records
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-validate extracted records in bulk.")
+    parser.add_argument("target", help="batch results directory or JSONL of extracted records")
+    parser.add_argument("--out", default="validated.jsonl", help="validated records (JSONL)")
+    parser.add_argument("--log", default="validation_log.csv", help="per-row, per-field log (CSV)")
+    args = parser.parse_args()
+
+    ids, records = load_records(args.target)
+    values, present = to_frame(records)
+    validated, log, invalid = validate_frame(values, present)
+    with open(args.out, "w") as f:
+        for doc_id, record, failing in zip(ids, to_records(validated, present),
+                                           invalid.itertuples(index=False, name=None)):
+            invalid_fields = [column for column, bad in zip(invalid.columns, failing) if bad]
+            f.write(json.dumps({"id": doc_id, "validated": record,
+                                "invalid_fields": invalid_fields}) + "\n")
+    log.insert(0, "id", [ids[row] for row in log["row"]])
+    log.to_csv(args.log, index=False)
+    print(f"{len(records)} records, {int(invalid.any(axis=1).sum())} with invalid fields, "
+          f"{len(log)} log entries")
@@ -0,0 +1,160 @@
+"""Content-addressed on-disk cache for docling markdown and LLM completions.
+
+Entries live in a single SQLite file and are evicted least-recently-used
+once the total stored size goes over `max_bytes`.
+
+- markdown:   sha256(PDF bytes) + converter settings -> export_to_markdown()
+- completion: sha256(markdown, system prompt, model, params) -> raw completion
+
+    cache = Cache("./.cache/extraction")
+    markdown = cache.get("markdown", key)
+    cache.put("markdown", key, markdown)
+    print(cache.stats())
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+DEFAULT_CACHE_DIR = "./.cache/extraction"
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+def _digest(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, (bytes, str)):
+            part = json.dumps(part, sort_keys=True, separators=(",", ":"))
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        h.update(len(part).to_bytes(8, "big"))
+        h.update(part)
+    return h.hexdigest()
+
+
+def file_hash(source):
+    """sha256 of a local file's bytes, or of the string itself for URLs."""
+    source = str(source)
+    if not os.path.isfile(source):
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+    h = hashlib.sha256()
+    with open(source, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def markdown_key(source, settings):
+    """Key for a document's markdown under the given converter settings."""
+    return _digest("markdown", file_hash(source), settings)
+
+
+def completion_key(user_content, system_prompt, model, params=None):
+    """Key for a chat completion of (content, system prompt, model, params)."""
+    return _digest("completion", user_content, system_prompt, model, params or {})
+
+
+class Cache:
+    def __init__(self, path=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES,
+                 enabled=True, refresh=False):
+        """`enabled=False` bypasses the cache entirely; `refresh=True` skips
+        reads but stores fresh results over the old ones."""
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.refresh = refresh
+        self.hits = Counter()
+        self.misses = Counter()
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if enabled:
+            os.makedirs(path, exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(path, "cache.sqlite3"),
+                                       check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " size INTEGER NOT NULL, accessed REAL NOT NULL,"
+                " PRIMARY KEY (kind, key))"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            self._db.commit()
+
+    def get(self, kind, key):
+        """Return the cached value or None, counting the hit or miss."""
+        if not self.enabled or self.refresh:
+            self.misses[kind] += 1
+            return None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM entries WHERE kind = ? AND key = ?", (kind, key)
+            ).fetchone()
+            if row is None:
+                self.misses[kind] += 1
+                return None
+            self._db.execute(
+                "UPDATE entries SET accessed = ? WHERE kind = ? AND key = ?",
+                (time.time(), kind, key),
+            )
+            self._db.commit()
+        self.hits[kind] += 1
+        return row[0]
+
+    def put(self, kind, key, value):
+        if not self.enabled:
+            return
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (kind, key, value, size, accessed)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (kind, key, value, size, time.time()),
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        (total,) = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if total <= self.max_bytes:
+            return
+        for kind, key, size in self._db.execute(
+            "SELECT kind, key, size FROM entries ORDER BY accessed"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM entries WHERE kind = ? AND key = ?", (kind, key))
+            total -= size
+            self.evictions += 1
+
+    def clear(self, kind=None):
+        """Invalidate every entry, or only entries of one kind."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if kind is None:
+                self._db.execute("DELETE FROM entries")
+            else:
+                self._db.execute("DELETE FROM entries WHERE kind = ?", (kind,))
+            self._db.commit()
+
+    def stats(self):
+        kinds = sorted(set(self.hits) | set(self.misses))
+        return {
+            "enabled": self.enabled,
+            "hits": dict(self.hits),
+            "misses": dict(self.misses),
+            "hit_rate": {
+                kind: self.hits[kind] / (self.hits[kind] + self.misses[kind]) for kind in kinds
+            },
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
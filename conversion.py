@@ -0,0 +1,235 @@
+"""Process pool for docling conversion with one warm DocumentConverter per worker.
+
+Each worker process builds its converter (and loads the layout/OCR models)
+once, then converts documents sent to it over a pipe and returns the
+`export_to_markdown()` string. A worker that crashes or exceeds the
+per-document timeout is killed and replaced, so one bad PDF only fails
+itself.
+
+With a `PageSelection` the workers convert only the selected pages and
+skip OCR on pages that have a text layer (see page_selection.py). With
+`StreamOptions`, long PDFs are converted range by range and only a digest
+of their relevant sections comes back (see page_stream.py); a worker whose
+RSS stays above the budget after a document is replaced.
+
+    pool = ConversionPool(workers=4, timeout=300)
+    markdown = pool.convert("./sample_contract.pdf")
+    pool.close()
+"""
+import multiprocessing
+import os
+import queue
+import time
+import traceback
+from dataclasses import asdict
+
+from page_selection import PageInfo, PageSelection, convert_selected, is_local_pdf, page_summary
+from page_stream import StreamOptions, convert_streaming, page_count
+from tracing import annotate, current_rss_kb, reset_peak_rss, window_peak_rss_kb
+
+
+class ConversionError(Exception):
+    """Docling raised while converting a document."""
+
+
+class ConversionTimeout(ConversionError):
+    """A document took longer than the per-document timeout."""
+
+
+class WorkerCrashed(ConversionError):
+    """The worker process died while converting a document."""
+
+
+def converter_settings(selection=None, stream=None):
+    """Settings that change the markdown a converter produces (part of the cache key)."""
+    try:
+        from importlib.metadata import version
+        docling_version = version("docling")
+    except Exception:
+        docling_version = None
+    settings = {"pipeline": "default"}
+    if selection is not None:
+        settings = selection.settings()
+    if stream is not None:
+        settings = {**settings, **stream.settings()}
+    return {**settings, "docling": docling_version}
+
+
+def make_converter(do_ocr=True):
+    from docling.document_converter import DocumentConverter
+    if do_ocr:
+        return DocumentConverter()
+    from docling.datamodel.base_models import InputFormat
+    from docling.datamodel.pipeline_options import PdfPipelineOptions
+    from docling.document_converter import PdfFormatOption
+    options = PdfPipelineOptions(do_ocr=False)
+    return DocumentConverter(format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=options)})
+
+
+def _worker_loop(conn, converter_factory):
+    try:
+        converters = {True: converter_factory()}
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+        return
+    conn.send(("ready", None))
+
+    def converter(ocr):
+        # The converter without OCR is only loaded once a text-layer page needs it
+        if ocr not in converters:
+            converters[ocr] = converter_factory(do_ocr=ocr)
+        return converters[ocr]
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        source, selection, stream = message
+        try:
+            cpu = time.process_time()
+            reset_peak_rss()
+            pages = streamed = None
+            total_pages = page_count(source) if stream is not None and is_local_pdf(source) else 0
+            if stream is not None and total_pages > stream["min_pages"]:
+                markdown, streamed = convert_streaming(source, converters[True],
+                                                       StreamOptions(**stream), total_pages)
+            elif selection is not None and is_local_pdf(source):
+                markdown, pages = convert_selected(source, converter, PageSelection(**selection))
+                pages = [asdict(info) for info in pages]
+            else:
+                result = converters[True].convert(source)
+                markdown = result.document.export_to_markdown()
+                del result
+            conn.send(("ok", {"markdown": markdown, "cpu_time": time.process_time() - cpu,
+                              "peak_rss_kb": window_peak_rss_kb(), "rss_kb": current_rss_kb(),
+                              "pages": pages, "stream": streamed}))
+        except Exception:
+            conn.send(("error", traceback.format_exc()))
+
+
+class _Worker:
+    def __init__(self, ctx, converter_factory):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_loop, args=(child_conn, converter_factory),
+                                   daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    def wait_ready(self):
+        if self.ready:
+            return
+        try:
+            status, detail = self.conn.recv()
+        except EOFError:
+            raise WorkerCrashed("conversion worker died while loading the converter")
+        if status != "ready":
+            raise ConversionError(f"conversion worker failed to start:\n{detail}")
+        self.ready = True
+
+    def stop(self, kill=False):
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class ConversionPool:
+    def __init__(self, workers=None, timeout=None, converter_factory=make_converter,
+                 start_method="spawn", selection=None, stream=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.selection = selection
+        self.stream = stream
+        self.recycled = 0
+        self.converter_factory = converter_factory
+        self._ctx = multiprocessing.get_context(start_method)
+        self._idle = queue.Queue()
+        self._all = []
+        for _ in range(self.workers):
+            self._add_worker()
+
+    def _add_worker(self):
+        worker = _Worker(self._ctx, self.converter_factory)
+        self._all.append(worker)
+        self._idle.put(worker)
+
+    def _replace(self, worker):
+        worker.stop(kill=True)
+        self._all.remove(worker)
+        self._add_worker()
+
+    def convert(self, source, timeout=None):
+        """Convert one document in a worker and return its markdown.
+
+        The worker's CPU time and peak RSS are recorded on the current trace span.
+        """
+        return self.convert_pages(source, timeout)["markdown"]
+
+    def convert_pages(self, source, timeout=None):
+        """The worker's result for one document: markdown, "pages" and "stream".
+
+        "pages" is the per-page report when pages were selected (a local PDF
+        and a `selection`), "stream" the per-range report of a streamed PDF;
+        both are None otherwise. Their totals are recorded on the current
+        trace span.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        selection = asdict(self.selection) if self.selection is not None else None
+        stream = asdict(self.stream) if self.stream is not None else None
+        worker = self._idle.get()
+        try:
+            worker.wait_ready()
+            worker.conn.send((str(source), selection, stream))
+            if not worker.conn.poll(timeout):
+                raise ConversionTimeout(f"conversion of {source} exceeded {timeout}s")
+            status, detail = worker.conn.recv()
+        except (ConversionTimeout, WorkerCrashed, EOFError, BrokenPipeError) as e:
+            self._replace(worker)
+            if isinstance(e, ConversionError):
+                raise
+            raise WorkerCrashed(f"conversion worker died while converting {source}") from e
+        except ConversionError:
+            self._replace(worker)
+            raise
+        if (status == "ok" and self.stream is not None and self.stream.rss_budget_mb
+                and detail["rss_kb"] > self.stream.rss_budget_mb * 1024):
+            # Freed memory is rarely returned to the OS: start a fresh worker instead
+            self.recycled += 1
+            self._replace(worker)
+        else:
+            self._idle.put(worker)
+        if status != "ok":
+            raise ConversionError(f"conversion of {source} failed:\n{detail}")
+        annotate(worker_cpu_time=detail["cpu_time"], worker_peak_rss_kb=detail["peak_rss_kb"])
+        if detail["pages"] is not None:
+            summary = page_summary([PageInfo(**info) for info in detail["pages"]])
+            annotate(pages=summary["pages"], pages_converted=summary["converted"],
+                     pages_ocr=summary["ocr"], probe_seconds=summary["probe_seconds"])
+        if detail["stream"] is not None:
+            annotate(pages=detail["stream"]["pages"], ranges=len(detail["stream"]["ranges"]),
+                     tokens_seen=detail["stream"]["tokens_seen"],
+                     tokens_kept=detail["stream"]["tokens_kept"])
+        return detail
+
+    def close(self):
+        for worker in self._all:
+            worker.stop()
+        self._all = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,273 @@
+"""Compare extraction prompts on a labelled corpus: accuracy, tokens and latency.
+
+Corpus: a directory of contracts as .md or .pdf, each with a
+`<name>.truth.json` holding the expected PROMPT fields (as for
+bench_sections.py; documents without one are skipped).
+
+Every variant extracts every document, all concurrently through one
+AsyncLLM. Completions come from cassettes keyed by request hash (see
+bench.py), so a rerun replays the recorded answers, token counts and
+latencies; misses go to the live deployment and are recorded, or fail
+with --offline.
+
+For each variant the report gives per-field exact-match accuracy (the
+value as returned equals the truth) and normalized accuracy (equal after
+the fast path's field normalization: ISO dates, plain amounts, currency
+codes, "Net N" terms; then case and punctuation folded). It also gives
+tokens per document and the latency distribution, and picks the fastest
+variant whose normalized accuracy meets --min-accuracy.
+
+    python eval_prompts.py ./corpus
+    python eval_prompts.py ./corpus --stable-prefix --variants prompts.json --offline
+"""
+import argparse
+import asyncio
+import json
+import re
+import sys
+import time
+from dataclasses import asdict, dataclass
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+import main
+from bench import CassetteClient
+from bench_sections import flat_fields, load_corpus, normalize
+from fastpath import normalize as normalize_field
+from llm import AsyncLLM, cached_tokens
+from prompt_layout import extraction_prefix
+from schema import EXTRACTION_FORMAT
+from sections import plan_context, reduce_extractions
+from tracing import percentile
+
+DEFAULT_CASSETTES = "./.cache/eval/cassettes"
+BUILTIN_PROMPTS = ["PROMPT", "PROMPT1"]
+
+
+@dataclass
+class Variant:
+    name: str
+    prompt: str
+    structured: bool = True        # constrain the answer to EXTRACTION_FORMAT
+    stable_prefix: bool = False    # send prompt_layout.extraction_prefix(prompt) as the system message
+    model: str = main.MODEL
+
+    def request(self, content):
+        """chat.completions.create kwargs for one piece of document content."""
+        system = extraction_prefix(self.prompt) if self.stable_prefix else self.prompt
+        params = {"response_format": EXTRACTION_FORMAT} if self.structured else {}
+        return {"model": self.model, "messages": main.build_messages(system, content), **params}
+
+
+def _prompt_text(value):
+    """A prompt given by name (an attribute of main such as "PROMPT1") or as text."""
+    return getattr(main, value) if isinstance(value, str) and hasattr(main, value) else value
+
+
+def load_variants(path):
+    """Variants from a JSON file: {name: prompt} or {name: {"prompt": ..., "model": ...}}."""
+    variants = []
+    for name, spec in json.loads(Path(path).read_text()).items():
+        if not isinstance(spec, dict):
+            spec = {"prompt": spec}
+        spec = dict(spec, prompt=_prompt_text(spec["prompt"]))
+        variants.append(Variant(name=name, **spec))
+    return variants
+
+
+def build_variants(prompts, stable_prefix=False, structured=True, variants_file=None):
+    variants = [Variant(name, getattr(main, name), structured=structured) for name in prompts]
+    if stable_prefix:
+        variants += [Variant(f"{v.name}+stable", v.prompt, v.structured, True, v.model)
+                     for v in list(variants)]
+    if variants_file:
+        variants += load_variants(variants_file)
+    names = [v.name for v in variants]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"duplicate variant names: {', '.join(duplicates)}")
+    return variants
+
+
+def exact_match(extracted, expected):
+    if not main.has_value(expected):
+        return not main.has_value(extracted)
+    return extracted == expected
+
+
+def normalized_match(path, extracted, expected):
+    if not main.has_value(expected) or not main.has_value(extracted):
+        return main.has_value(expected) == main.has_value(extracted)
+
+    def canonical(value):
+        value = str(value)
+        normalized, _ = normalize_field(path, value)
+        normalized = normalized if normalized is not None else value
+        if path == "Contract Amount":
+            # "1,200" and "1200.00" are the same amount
+            try:
+                return Decimal(re.sub(r"[^\d.]", "", normalized))
+            except InvalidOperation:
+                pass
+        return normalize(normalized)
+
+    return canonical(extracted) == canonical(expected)
+
+
+def score(extracted, truth):
+    """{field path: (exact match, normalized match)} for every field in the truth."""
+    values = dict(flat_fields(extracted or {}))
+    return {path: (exact_match(values.get(path), expected),
+                   normalized_match(path, values.get(path), expected))
+            for path, expected in flat_fields(truth)}
+
+
+async def evaluate_document(llm, variant, document, context_tokens):
+    """Extract one document with one variant; chunks of a long document go in parallel."""
+    markdown = document["markdown"]
+    chunks = plan_context(markdown, context_tokens).chunks if context_tokens else [markdown]
+    row = {"variant": variant.name, "name": document["name"], "requests": len(chunks),
+           "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "latency": None,
+           "error": None}
+
+    async def one(content):
+        start = time.perf_counter()
+        response = await llm.create(**variant.request(content))
+        # Replayed responses carry the recorded latency, not the replay's
+        latency = getattr(response, "latency", time.perf_counter() - start)
+        usage = response.usage
+        row["prompt_tokens"] += usage.prompt_tokens or 0
+        row["completion_tokens"] += usage.completion_tokens or 0
+        row["cached_tokens"] += cached_tokens(usage)
+        return latency, main.parse_extraction(response.choices[0].message.content)
+
+    try:
+        results = await asyncio.gather(*(one(chunk) for chunk in chunks))
+        extractions = [extracted for _, extracted in results]
+        extracted = extractions[0] if len(extractions) == 1 else reduce_extractions(extractions)
+        row["latency"] = max(latency for latency, _ in results)
+    except Exception as e:
+        # A failed document scores every field as wrong
+        row["error"] = f"{type(e).__name__}: {e}"
+        extracted = None
+    row["extracted"] = extracted
+    row["fields"] = score(extracted, document["truth"])
+    return row
+
+
+async def run(documents, variants, llm, context_tokens=0):
+    return await asyncio.gather(*(evaluate_document(llm, variant, document, context_tokens)
+                                  for variant in variants for document in documents))
+
+
+def _mean(values):
+    return sum(values) / len(values) if values else None
+
+
+def summarize(rows, variants, min_accuracy):
+    """Per-variant accuracy, token and latency summary, plus the recommended variant."""
+    summary = {}
+    for variant in variants:
+        variant_rows = [r for r in rows if r["variant"] == variant.name]
+        matches = [m for r in variant_rows for m in r["fields"].values()]
+        fields = {}
+        for r in variant_rows:
+            for path, (exact, normalized) in r["fields"].items():
+                counts = fields.setdefault(path, [0, 0, 0])
+                counts[0] += exact
+                counts[1] += normalized
+                counts[2] += 1
+        latencies = [r["latency"] for r in variant_rows if r["latency"] is not None]
+        summary[variant.name] = {
+            "settings": {k: v for k, v in asdict(variant).items() if k != "prompt"},
+            "documents": len(variant_rows),
+            "errors": sum(1 for r in variant_rows if r["error"]),
+            "exact_accuracy": _mean([exact for exact, _ in matches]),
+            "normalized_accuracy": _mean([normalized for _, normalized in matches]),
+            "fields": {path: {"exact": exact / n, "normalized": normalized / n}
+                       for path, (exact, normalized, n) in fields.items()},
+            "prompt_tokens": _mean([r["prompt_tokens"] for r in variant_rows]),
+            "completion_tokens": _mean([r["completion_tokens"] for r in variant_rows]),
+            "cached_tokens": _mean([r["cached_tokens"] for r in variant_rows]),
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            "latency_mean": _mean(latencies),
+        }
+    passing = [name for name, s in summary.items()
+               if s["normalized_accuracy"] is not None and s["normalized_accuracy"] >= min_accuracy
+               and s["latency_p50"] is not None]
+    # Fastest by median latency; fewer prompt tokens breaks ties
+    best = min(passing, key=lambda name: (summary[name]["latency_p50"],
+                                          summary[name]["prompt_tokens"]), default=None)
+    return {"min_accuracy": min_accuracy, "recommended": best, "variants": summary}
+
+
+def _fmt(value, spec):
+    width = int(spec.split(".")[0])
+    return "-".rjust(width) if value is None else format(value, spec)
+
+
+def report(result):
+    variants = result["variants"]
+    print(f"{'variant':24} {'docs':>5} {'errors':>6} {'exact':>6} {'norm':>6} {'prompt':>8} "
+          f"{'compl':>6} {'cached':>7} {'p50 s':>7} {'p95 s':>7}")
+    for name, s in variants.items():
+        print(f"{name[:24]:24} {s['documents']:5} {s['errors']:6} "
+              f"{_fmt(s['exact_accuracy'], '6.2f')} {_fmt(s['normalized_accuracy'], '6.2f')} "
+              f"{_fmt(s['prompt_tokens'], '8.0f')} {_fmt(s['completion_tokens'], '6.0f')} "
+              f"{_fmt(s['cached_tokens'], '7.0f')} {_fmt(s['latency_p50'], '7.2f')} "
+              f"{_fmt(s['latency_p95'], '7.2f')}")
+    paths = list(dict.fromkeys(path for s in variants.values() for path in s["fields"]))
+    print(f"\n{'field (exact/normalized)':32}" + "".join(f" {name[:12]:>12}" for name in variants))
+    for path in paths:
+        cells = []
+        for s in variants.values():
+            field = s["fields"].get(path)
+            cells.append(f"{field['exact']:.2f}/{field['normalized']:.2f}" if field else "-")
+        print(f"{path[:32]:32}" + "".join(f" {cell:>12}" for cell in cells))
+    if result["recommended"]:
+        print(f"\nfastest at normalized accuracy >= {result['min_accuracy']:.2f}: "
+              f"{result['recommended']}")
+    else:
+        print(f"\nno variant reaches normalized accuracy {result['min_accuracy']:.2f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus", help="directory of .md/.pdf contracts with .truth.json files")
+    parser.add_argument("--prompts", nargs="*", choices=BUILTIN_PROMPTS, default=BUILTIN_PROMPTS,
+                        help="prompts from main.py to evaluate")
+    parser.add_argument("--variants", help="JSON file of extra variants: "
+                                           '{name: prompt} or {name: {"prompt", "model", ...}}')
+    parser.add_argument("--stable-prefix", action="store_true",
+                        help="also evaluate each prompt in the cached-prefix layout")
+    parser.add_argument("--unstructured", action="store_true",
+                        help="send the prompts without the JSON-schema response format")
+    parser.add_argument("--context-tokens", type=int, default=0,
+                        help="send relevance-filtered context of this budget (0: full markdown)")
+    parser.add_argument("--concurrency", type=int, default=16, help="max requests in flight")
+    parser.add_argument("--cassettes", default=DEFAULT_CASSETTES)
+    parser.add_argument("--offline", action="store_true",
+                        help="replay only; a request without a cassette fails its document")
+    parser.add_argument("--min-accuracy", type=float, default=0.9,
+                        help="normalized accuracy a variant must reach to be recommended")
+    parser.add_argument("--json", help="write the summary and per-document rows to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    documents = [d for d in load_corpus(args.corpus) if d["truth"]]
+    if not documents:
+        sys.exit(f"no labelled documents (<name>.truth.json) in {args.corpus}")
+    variants = build_variants(args.prompts, args.stable_prefix, not args.unstructured, args.variants)
+    client = CassetteClient(args.cassettes, record=not args.offline)
+    llm = AsyncLLM(client=client, max_in_flight=args.concurrency)
+    rows = asyncio.run(run(documents, variants, llm, args.context_tokens))
+    result = summarize(rows, variants, args.min_accuracy)
+    report(result)
+    print(f"\n{len(documents)} documents, {len(variants)} variants: "
+          f"{client.hits} replayed, {client.recorded} recorded")
+    if args.json:
+        Path(args.json).write_text(json.dumps(dict(result, rows=rows), indent=4))
+    sys.exit(0 if result["recommended"] else 1)
@@ -0,0 +1,430 @@
+"""Deterministic fast-path extraction for templated contracts.
+
+Most contracts come from a handful of templates in which the Contract ID,
+dates, amount and currency sit in predictable key-value lines or table cells
+of the docling markdown. `fast_extract` tries, in order, the compiled
+patterns of the template the document matches, a lookup of labelled table
+cells, and generic "Label: value" lines (plus the document title as the
+contract name). Each value is normalized and run
+through the field's validator to get a confidence. Free text (names, the
+contract type) has no validator and is only trusted from a template's own
+pattern; slash dates that read either way (01/04/2025) are left to the LLM
+too. Only the fields that are
+missing or below the threshold are then asked of the LLM (`missing_prompt`
+plus `schema.partial_format`).
+
+    result = fast_extract(markdown)
+    result.fields      # {"Contract ID": "OF-1042", ..., "Metadata": {...}}
+    result.missing     # ["Customer ID", "Metadata.Contract Type"]
+
+Templates can also be loaded from a JSON list of
+{"name", "markers": [regex], "patterns": {field: [regex with one group]},
+"confidence"} with `load_templates`.
+
+    python fastpath.py ./contracts     # per-field hit rate over a corpus (.md or .pdf)
+"""
+import argparse
+import json
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+import main
+from schema import FIELD_PATHS, unflatten
+
+# Labels that introduce each field in key-value lines and table cells
+FIELD_LABELS = {
+    "Contract ID": ["contract id", "contract number", "contract no", "agreement number",
+                    "agreement id", "order form number", "order number"],
+    "Contract Name": ["contract name", "contract title", "agreement name", "agreement title"],
+    "Status": ["contract status", "status"],
+    "Currency": ["currency"],
+    "Customer ID": ["customer id", "customer number", "client id", "account id", "account number"],
+    "Customer Name": ["customer name", "client name", "client company name", "customer",
+                      "client", "bill to"],
+    "Contract Start Date": ["contract start date", "start date", "effective date",
+                            "commencement date", "service start date"],
+    "Contract End Date": ["contract end date", "end date", "expiration date", "expiry date",
+                          "termination date"],
+    "Payment Terms": ["payment terms", "terms of payment"],
+    "Contract Amount": ["contract amount", "contract value", "total contract value",
+                        "total amount", "grand total", "total"],
+    "Metadata.Billing Frequency": ["billing frequency", "billing cycle", "billing period",
+                                   "subscription billing"],
+    "Metadata.Contract Type": ["contract type", "agreement type"],
+}
+
+DATE_FORMATS = ["%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y", "%d.%m.%Y", "%B %d, %Y", "%b %d, %Y", "%d %B %Y",
+                "%d %b %Y", "%B %d %Y", "%b %d %Y"]
+CURRENCY_SYMBOLS = {"$": "USD", "€": "EUR", "£": "GBP", "₹": "INR", "¥": "JPY"}
+CURRENCY_CODES = {"USD", "EUR", "GBP", "INR", "JPY", "CAD", "AUD", "CHF", "SGD", "AED"}
+BILLING_FREQUENCIES = {"monthly": "Monthly", "quarterly": "Quarterly", "annually": "Annually",
+                       "annual": "Annually", "yearly": "Annually", "upfront": "Upfront",
+                       "one-time": "One-Time", "semi-annually": "Semi-Annually"}
+
+_MONEY = re.compile(r"([$€£₹¥])?\s?(?<![\d.,])(\d{1,3}(?:,\d{3})+|\d+)(\.\d{2})?(?![.,]?\d)"
+                    r"\s*([A-Z]{3})?")
+_DATE = re.compile(r"\d{4}-\d{2}-\d{2}|\d{1,2}/\d{1,2}/\d{4}|\d{1,2}\.\d{1,2}\.\d{4}"
+                   r"|[A-Z][a-z]{2,8}\.? \d{1,2}(?:st|nd|rd|th)?,? \d{4}"
+                   r"|\d{1,2}(?:st|nd|rd|th)? [A-Z][a-z]{2,8} \d{4}")
+_NET_TERMS = re.compile(r"\bnet\s*(\d{1,3})\b", re.IGNORECASE)
+_TITLE = re.compile(r"^#{1,2}[ \t]*(.*\b(?:agreement|contract|order form)\b.*?)[ \t]*$",
+                    re.IGNORECASE | re.MULTILINE)
+_TABLE_ROW = re.compile(r"^\s*\|(.*)\|\s*$")
+_TABLE_RULE = re.compile(r"^\s*\|?\s*:?-{3,}")
+
+DEFAULT_THRESHOLD = 0.7
+# Labels that also head unrelated lines (a line-item "Total", a "Client contact"): a
+# "Label: value" line with one of them is kept below the threshold, tables still count
+GENERIC_LABELS = {"customer", "client", "bill to", "total"}
+GENERIC_LINE_CONFIDENCE = 0.5
+# Fields without a validator or a fixed set of values
+FREE_TEXT_FIELDS = {"Contract Name", "Customer Name", "Payment Terms", "Metadata.Contract Type"}
+MAX_TEXT_LENGTH = 120
+
+
+@dataclass
+class Template:
+    name: str
+    markers: list                # regexes that must all match for the template to apply
+    patterns: dict               # field path -> regexes whose first group is the value
+    confidence: float = 0.95
+
+    def matches(self, markdown):
+        return all(marker.search(markdown) for marker in self.markers)
+
+
+def compile_template(name, markers, patterns, confidence=0.95):
+    flags = re.IGNORECASE | re.MULTILINE
+    return Template(
+        name,
+        [re.compile(marker, flags) for marker in markers],
+        {path: [re.compile(p, flags) for p in regexes] for path, regexes in patterns.items()},
+        confidence,
+    )
+
+
+def load_templates(path):
+    """Compile templates from a JSON file (see module docstring)."""
+    return [compile_template(t["name"], t["markers"], t["patterns"], t.get("confidence", 0.95))
+            for t in json.loads(Path(path).read_text())]
+
+
+TEMPLATES = [
+    # Order forms like sample_contract.pdf
+    compile_template(
+        "order_form",
+        markers=[r"^\W*order form\b"],
+        patterns={
+            "Contract ID": [r"order form (?:number|no\.?|#)[ \t]*[:|]?[ \t]*([A-Z0-9][\w/-]{2,})"],
+            "Contract Name": [r"^#+[ \t]*(order form)[ \t]*$"],
+            "Customer Name": [r"client company name[ \t]*[:|][ \t]*(.+?)(?:[ \t]*\||[ \t]+company name|$)"],
+            "Payment Terms": [r"payment terms[ \t]*[:|][ \t]*(net[ \t]*\d+)"],
+            "Metadata.Billing Frequency": [r"subscription billing[ \t]*[:|][ \t]*(\w+)"],
+        },
+    ),
+]
+
+
+@dataclass
+class FastPathResult:
+    template: str = None
+    values: dict = field(default_factory=dict)        # path -> normalized value
+    confidence: dict = field(default_factory=dict)    # path -> 0..1
+    sources: dict = field(default_factory=dict)       # path -> "template" | "table" | "line" | "generic"
+    threshold: float = DEFAULT_THRESHOLD
+
+    @property
+    def accepted(self):
+        return {path: value for path, value in self.values.items()
+                if self.confidence[path] >= self.threshold}
+
+    @property
+    def missing(self):
+        return [path for path in FIELD_PATHS if path not in self.accepted]
+
+    @property
+    def fields(self):
+        """Accepted values as a PROMPT-shaped record (missing fields left out)."""
+        return unflatten(self.accepted)
+
+
+def _clean(value):
+    return value.strip().strip("*|:").strip()
+
+
+def _label_pattern(label):
+    return re.escape(label).replace(r"\ ", r"[ \t]+")
+
+
+# Generic "Label: value" lines as (label, pattern), most specific label first
+_LINE_PATTERNS = {
+    path: [(label,
+            re.compile(rf"^[^\w\n]*{_label_pattern(label)}[^\w\n:]*:[ \t]*(\S.*?)[ \t]*$",
+                       re.IGNORECASE | re.MULTILINE))
+           for label in sorted(labels, key=len, reverse=True)]
+    for path, labels in FIELD_LABELS.items()
+}
+
+
+def parse_tables(markdown):
+    """Markdown pipe tables as lists of rows of stripped cell strings."""
+    tables, current = [], []
+    for line in markdown.splitlines():
+        match = _TABLE_ROW.match(line)
+        if match and not _TABLE_RULE.match(line):
+            current.append([_clean(cell) for cell in match.group(1).split("|")])
+        elif not match:
+            if current:
+                tables.append(current)
+            current = []
+    if current:
+        tables.append(current)
+    return tables
+
+
+def _label_of(cell):
+    return re.sub(r"[^a-z0-9 ]", "", cell.lower()).strip()
+
+
+def table_candidates(tables):
+    """Labelled values from tables: key/value rows, and header columns of single-row tables."""
+    label_paths = {label: path for path, labels in FIELD_LABELS.items() for label in labels}
+    candidates = {}
+    for rows in tables:
+        for row in rows:
+            for i, cell in enumerate(row[:-1]):
+                path = label_paths.get(_label_of(cell))
+                value = next((c for c in row[i + 1:] if c), None)
+                if path and value:
+                    candidates.setdefault(path, []).append(value)
+        if len(rows) == 2:
+            header, values = rows
+            for name, value in zip(header, values):
+                path = label_paths.get(_label_of(name))
+                if path and value:
+                    candidates.setdefault(path, []).append(value)
+    return candidates
+
+
+def normalize_date(value):
+    match = _DATE.search(value)
+    if match is None:
+        return None
+    text = re.sub(r"(\d)(st|nd|rd|th)\b", r"\1", match.group(0))
+    # "Sept. 5, 2023" -> "Sep 5, 2023"
+    text = re.sub(r"^([A-Z][a-z]{2})[a-z]?\.", r"\1", text)
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+
+def ambiguous_date(value):
+    """True for a slash date whose day and month could be swapped (01/04/2025)."""
+    match = _DATE.search(value)
+    parts = re.fullmatch(r"(\d{1,2})/(\d{1,2})/\d{4}", match.group(0)) if match else None
+    return (parts is not None and int(parts.group(1)) <= 12 and int(parts.group(2)) <= 12
+            and parts.group(1).lstrip("0") != parts.group(2).lstrip("0"))
+
+
+def normalize_amount(value):
+    match = _MONEY.search(value)
+    if match is None:
+        return None
+    # The symbol goes to Currency; validate_monetary only takes plain or $ amounts
+    return f"{match.group(2)}{match.group(3) or ''}"
+
+
+def detect_currency(value):
+    for code in re.findall(r"\b[A-Z]{3}\b", value):
+        if code in CURRENCY_CODES:
+            return code
+    for symbol, code in CURRENCY_SYMBOLS.items():
+        if symbol in value:
+            return code
+    return None
+
+
+def normalize(path, value):
+    """(normalized value, valid) for one raw candidate."""
+    value = _clean(value)
+    if not value:
+        return None, False
+    if path in {"Contract Start Date", "Contract End Date"}:
+        date = normalize_date(value)
+        return date, date is not None and not ambiguous_date(value)
+    if path == "Contract Amount":
+        amount = normalize_amount(value)
+        if amount is None:
+            return None, False
+        canonical, valid = main.validate_monetary(amount)
+        return (canonical, True) if valid else (amount, False)
+    if path == "Currency":
+        code = detect_currency(value) or (value.upper() if value.upper() in CURRENCY_CODES else None)
+        return code, code is not None
+    if path == "Status":
+        status, valid = main.validate_status(value)
+        return status, valid
+    if path == "Payment Terms":
+        match = _NET_TERMS.search(value)
+        if match:
+            return f"Net {match.group(1)}", True
+        return value, False
+    if path == "Metadata.Billing Frequency":
+        word = value.split()[0].lower()
+        frequency = BILLING_FREQUENCIES.get(word)
+        return frequency, frequency is not None
+    if path in {"Contract ID", "Customer ID"}:
+        value, valid = main.handle_missing_or_ambiguous(path, value)
+        # Identifiers are short, unbroken and contain a digit
+        return value, (valid and len(value) <= 64 and " " not in value.strip()
+                       and any(ch.isdigit() for ch in value))
+    # Free text: nothing to check it against
+    return value, False
+
+
+def trusted_text(path, value):
+    """Free text that a template pattern or a learned location vouches for."""
+    return path in FREE_TEXT_FIELDS and value is not None and len(value) <= MAX_TEXT_LENGTH
+
+
+def fast_extract(markdown, templates=TEMPLATES, threshold=DEFAULT_THRESHOLD):
+    """Extract what can be found deterministically, with a confidence per field.
+
+    Template patterns are trusted at the template's confidence, table cells
+    at 0.85 and key-value lines at 0.75, or 0.5 behind one of the
+    GENERIC_LABELS. A value that fails its validator counts for 40% of
+    that, as does free text not matched by a template pattern; conflicting
+    candidates for 60%.
+    """
+    result = FastPathResult(threshold=threshold)
+    template = next((t for t in templates if t.matches(markdown)), None)
+    candidates = {}
+    if template is not None:
+        result.template = template.name
+        for path, patterns in template.patterns.items():
+            for pattern in patterns:
+                for match in pattern.finditer(markdown):
+                    candidates.setdefault(path, []).append(("template", template.confidence,
+                                                            match.group(1)))
+    for path, values in table_candidates(parse_tables(markdown)).items():
+        candidates.setdefault(path, []).extend(("table", 0.85, value) for value in values)
+    for path, patterns in _LINE_PATTERNS.items():
+        for label, pattern in patterns:
+            for match in pattern.finditer(markdown):
+                if label in GENERIC_LABELS:
+                    candidate = ("generic", GENERIC_LINE_CONFIDENCE, match.group(1))
+                else:
+                    candidate = ("line", 0.75, match.group(1))
+                candidates.setdefault(path, []).append(candidate)
+
+    title = _TITLE.search(markdown)
+    if title is not None:
+        # The document title doubles as the contract name
+        candidates.setdefault("Contract Name", []).append(("line", 0.75, title.group(1)))
+
+    if "Currency" not in candidates:
+        # The currency is usually only implied by the amounts
+        amounts = candidates.get("Contract Amount", [])
+        for source, confidence, value in amounts:
+            if detect_currency(value):
+                candidates["Currency"] = [(source, confidence, value)]
+                break
+
+    for path, found in candidates.items():
+        scored = []
+        for source, confidence, raw in found:
+            value, valid = normalize(path, raw)
+            valid = valid or (source == "template" and trusted_text(path, value))
+            if value is not None:
+                scored.append((source, confidence if valid else confidence * 0.4, value))
+        if not scored:
+            continue
+        source, confidence, value = max(scored, key=lambda item: item[1])
+        # Disagreement among equally trusted candidates lowers confidence
+        rivals = {v for s, c, v in scored if s == source and v != value}
+        if rivals:
+            confidence *= 0.6
+        result.values[path] = value
+        result.confidence[path] = round(confidence, 3)
+        result.sources[path] = source
+    return result
+
+
+def missing_prompt(paths):
+    """PROMPT-style instruction asking only for the given fields."""
+    names = []
+    metadata = [path.split(".", 1)[1] for path in paths if path.startswith("Metadata.")]
+    for path in paths:
+        if not path.startswith("Metadata."):
+            names.append(path)
+    if metadata:
+        names.append(f"Metadata: {' and '.join(metadata)}.")
+    lines = "\n".join(f"- {name}" for name in names)
+    return ("Extract the following fields from the contract and give them as output in json:\n"
+            f"{lines}\n\nUse null for a field the contract does not state.\n")
+
+
+def merge_fast_path(fast_fields, llm_fields):
+    """Fast-path values win; the LLM fills the rest. Returns a full PROMPT-shaped record."""
+    merged = {}
+    for path in FIELD_PATHS:
+        if path.startswith("Metadata."):
+            sub_field = path.split(".", 1)[1]
+            fast = (fast_fields.get("Metadata") or {}).get(sub_field)
+            llm = (llm_fields.get("Metadata") or {}).get(sub_field)
+            merged.setdefault("Metadata", {})[sub_field] = fast if fast is not None else llm
+        else:
+            fast = fast_fields.get(path)
+            merged[path] = fast if fast is not None else llm_fields.get(path)
+    return merged
+
+
+def hit_rates(results):
+    """Share of documents per field that the fast path answered."""
+    total = len(results)
+    return {
+        path: {
+            "hits": sum(1 for r in results if path in r.accepted),
+            "hit_rate": sum(1 for r in results if path in r.accepted) / total if total else None,
+        }
+        for path in FIELD_PATHS
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fast-path extraction hit rate over a corpus.")
+    parser.add_argument("corpus", help="directory of docling .md files or PDFs")
+    parser.add_argument("--templates", default=None, help="JSON templates to use as well")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--show", action="store_true", help="print each document's fields")
+    args = parser.parse_args()
+
+    templates = TEMPLATES + (load_templates(args.templates) if args.templates else [])
+    results = []
+    for source in sorted(Path(args.corpus).iterdir()):
+        if source.suffix.lower() == ".md":
+            markdown = source.read_text()
+        elif source.suffix.lower() == ".pdf":
+            markdown = main.convert_document(str(source))
+        else:
+            continue
+        result = fast_extract(markdown, templates, args.threshold)
+        results.append(result)
+        if args.show:
+            print(f"{source.name} [{result.template or 'generic'}]")
+            for path in FIELD_PATHS:
+                if path in result.values:
+                    mark = "ok" if path in result.accepted else "low"
+                    print(f"    {path}: {result.values[path]!r} "
+                          f"({result.sources[path]}, {result.confidence[path]}, {mark})")
+    full = sum(1 for r in results if not r.missing)
+    print(json.dumps({
+        "documents": len(results),
+        "documents_without_llm": full,
+        "fields": hit_rates(results),
+    }, indent=4))
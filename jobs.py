@@ -0,0 +1,315 @@
+"""Durable, resumable job queue for batch extraction.
+
+A crash in docling, an LLM call or the Zenskar POST loses the work done on
+that document, and a crashed batch loses all of it. `JobStore` keeps one
+row per document in SQLite. Each row holds the last stage the document
+completed (converted, extracted, validated, corrected, submitted), the
+record built so far and the converted markdown. A worker claims a job
+under a lease and checkpoints after every stage. When a job is claimed
+again (after a crash, a failed attempt or `requeue`), the worker resumes
+from the last checkpoint instead of starting over.
+
+A claim is a single UPDATE inside an IMMEDIATE transaction, so several
+worker processes on one host can drain the same store without taking the
+same job twice. A job whose lease runs out because its worker died or hung
+is claimed by the next worker, up to `max_attempts` attempts. A worker
+whose lease was taken over can no longer checkpoint or finish that job.
+
+    store = JobStore("./.cache/jobs.sqlite3")
+    store.enqueue(sources, doc_id_for)
+    job = store.claim("worker-1", lease_seconds=300)
+    job.checkpoint("converted", record, markdown=markdown)
+    job.finish(record)
+
+    # Queue state, and retrying failed jobs from their last checkpoint
+    python jobs.py status
+    python jobs.py requeue
+"""
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+DEFAULT_JOBS = "./.cache/jobs.sqlite3"
+DEFAULT_LEASE = 300
+DEFAULT_MAX_ATTEMPTS = 3
+# Stages a job can have completed, in pipeline order
+STATES = ["pending", "converted", "extracted", "validated", "corrected", "submitted"]
+
+
+class LeaseLost(Exception):
+    """The job's lease ran out and another worker claimed it."""
+
+
+def default_worker():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class Job:
+    """A claimed job: where it got to last time and how to checkpoint it."""
+
+    def __init__(self, store, worker, lease, job_id, source, state, attempts, record):
+        self.store = store
+        self.worker = worker
+        self.lease = lease
+        self.job_id = job_id
+        self.source = source
+        self.state = state
+        self.attempts = attempts
+        self.record = record
+
+    def reached(self, state):
+        return STATES.index(self.state) >= STATES.index(state)
+
+    def artifact(self, name):
+        return self.store.artifact(self.job_id, name)
+
+    def restart(self):
+        """Forget earlier progress (e.g. the source changed since it was saved)."""
+        self.state = "pending"
+        self.record = {}
+
+    def checkpoint(self, state, record, **artifacts):
+        self.store.checkpoint(self, state, record, artifacts)
+        self.state = state
+
+    def finish(self, record):
+        return self.store.finish(self, record)
+
+
+class JobStore:
+    def __init__(self, path=DEFAULT_JOBS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY, source TEXT NOT NULL UNIQUE,"
+            " state TEXT NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL,"
+            " owner TEXT, lease TEXT, lease_until REAL, record TEXT, error TEXT,"
+            " created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_until)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS artifacts ("
+            " job_id TEXT NOT NULL, name TEXT NOT NULL, value TEXT NOT NULL,"
+            " PRIMARY KEY (job_id, name))"
+        )
+        self._db.commit()
+
+    def _transaction(self):
+        # Take the write lock up front so concurrent processes serialize here
+        self._db.execute("BEGIN IMMEDIATE")
+
+    def enqueue(self, sources, name):
+        """Add sources not already queued; `name(source, seen)` picks a unique job id.
+
+        Returns {source: job id} for every source, old and new.
+        """
+        now = time.time()
+        with self._lock:
+            self._transaction()
+            try:
+                ids = dict(self._db.execute("SELECT source, job_id FROM jobs").fetchall())
+                seen = set(ids.values())
+                for n, source in enumerate(sources):
+                    if source in ids:
+                        continue
+                    ids[source] = name(source, seen)
+                    # created keeps the given order among jobs enqueued together
+                    self._db.execute(
+                        "INSERT INTO jobs (job_id, source, state, status, attempts, created,"
+                        " updated) VALUES (?, ?, 'pending', 'queued', 0, ?, ?)",
+                        (ids[source], source, now + n * 1e-6, now),
+                    )
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        return {source: ids[source] for source in sources}
+
+    def claim(self, worker, lease_seconds=DEFAULT_LEASE):
+        """Lease the next queued (or abandoned) job to `worker`; None if there is none."""
+        lease = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._transaction()
+            try:
+                # Abandoned on its last allowed attempt: give up rather than crash another worker
+                self._db.execute(
+                    "UPDATE jobs SET status = 'failed', owner = NULL, lease = NULL, error = ?,"
+                    " updated = ? WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                    (f"lease expired on attempt {self.max_attempts}", now, now, self.max_attempts),
+                )
+                self._db.execute(
+                    "UPDATE jobs SET status = 'running', owner = ?, lease = ?, lease_until = ?,"
+                    " attempts = attempts + 1, updated = ? WHERE job_id = ("
+                    "  SELECT job_id FROM jobs WHERE status = 'queued'"
+                    "  OR (status = 'running' AND lease_until < ?)"
+                    "  ORDER BY attempts, created LIMIT 1)",
+                    (worker, lease, now + lease_seconds, now, now),
+                )
+                row = self._db.execute(
+                    "SELECT job_id, source, state, attempts, record FROM jobs WHERE lease = ?",
+                    (lease,),
+                ).fetchone()
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        if row is None:
+            return None
+        job_id, source, state, attempts, record = row
+        return Job(self, worker, lease, job_id, source, state, attempts,
+                   json.loads(record) if record else {})
+
+    def renew(self, worker, lease_seconds=DEFAULT_LEASE):
+        """Extend the leases of every job `worker` still holds."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status = 'running'",
+                (time.time() + lease_seconds, worker),
+            )
+            self._db.commit()
+
+    def checkpoint(self, job, state, record, artifacts=None):
+        """Save the completed stage, the record so far and any artifacts.
+
+        Raises LeaseLost if the job has been claimed by another worker.
+        """
+        with self._lock:
+            self._transaction()
+            try:
+                updated = self._db.execute(
+                    "UPDATE jobs SET state = ?, record = ?, updated = ?"
+                    " WHERE job_id = ? AND lease = ? AND status = 'running'",
+                    (state, json.dumps(record), time.time(), job.job_id, job.lease),
+                ).rowcount
+                if not updated:
+                    raise LeaseLost(job.job_id)
+                for name, value in (artifacts or {}).items():
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO artifacts (job_id, name, value) VALUES (?, ?, ?)",
+                        (job.job_id, name, value),
+                    )
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+
+    def finish(self, job, record):
+        """Mark the job done, or queue it again (failed once attempts run out).
+
+        The record is kept either way. Returns False if the lease was lost.
+        """
+        if record["status"] == "ok":
+            status, error = "done", None
+        else:
+            status = "queued" if job.attempts < self.max_attempts else "failed"
+            error = json.dumps({k: v for k, v in record["error"].items() if k != "traceback"})
+        with self._lock:
+            updated = self._db.execute(
+                "UPDATE jobs SET status = ?, error = ?, record = ?, owner = NULL, lease = NULL,"
+                " lease_until = NULL, updated = ? WHERE job_id = ? AND lease = ?",
+                (status, error, json.dumps(record), time.time(), job.job_id, job.lease),
+            ).rowcount
+            self._db.commit()
+        return bool(updated)
+
+    def release(self, worker):
+        """Put back every job `worker` holds without counting the attempt (clean shutdown)."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL, lease = NULL, lease_until = NULL,"
+                " attempts = MAX(attempts - 1, 0), updated = ?"
+                " WHERE owner = ? AND status = 'running'",
+                (time.time(), worker),
+            )
+            self._db.commit()
+
+    def requeue(self, restart=False):
+        """Queue failed jobs again, from their last checkpoint or (restart) from scratch."""
+        with self._lock:
+            self._transaction()
+            try:
+                if restart:
+                    self._db.execute(
+                        "DELETE FROM artifacts WHERE job_id IN"
+                        " (SELECT job_id FROM jobs WHERE status = 'failed')"
+                    )
+                count = self._db.execute(
+                    "UPDATE jobs SET status = 'queued', attempts = 0, error = NULL, updated = ?"
+                    + (", state = 'pending', record = NULL" if restart else "")
+                    + " WHERE status = 'failed'",
+                    (time.time(),),
+                ).rowcount
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        return count
+
+    def artifact(self, job_id, name):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM artifacts WHERE job_id = ? AND name = ?", (job_id, name)
+            ).fetchone()
+        return row[0] if row else None
+
+    def remaining(self):
+        """Jobs not yet done or failed, held by any worker."""
+        with self._lock:
+            (count,) = self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchone()
+        return count
+
+    def stats(self):
+        with self._lock:
+            statuses = dict(self._db.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            states = dict(self._db.execute(
+                "SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+            (retried,) = self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE attempts > 1").fetchone()
+        return {
+            "jobs": sum(statuses.values()),
+            "status": statuses,
+            "state": {state: states[state] for state in STATES if state in states},
+            "retried": retried,
+        }
+
+    def failures(self):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT job_id, source, state, attempts, error FROM jobs"
+                " WHERE status = 'failed' ORDER BY job_id"
+            ).fetchall()
+        return [{"id": job_id, "source": source, "state": state, "attempts": attempts,
+                 "error": json.loads(error) if error and error.startswith("{") else error}
+                for job_id, source, state, attempts, error in rows]
+
+    def close(self):
+        self._db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and manage the batch job queue.")
+    parser.add_argument("command", choices=["status", "requeue"])
+    parser.add_argument("--jobs", default=DEFAULT_JOBS)
+    parser.add_argument("--restart", action="store_true",
+                        help="requeue failed jobs from scratch instead of their last checkpoint")
+    args = parser.parse_args()
+
+    store = JobStore(args.jobs)
+    if args.command == "requeue":
+        print(f"requeued {store.requeue(args.restart)} failed jobs")
+    else:
+        print(json.dumps({**store.stats(), "failures": store.failures()}, indent=4))
+    store.close()
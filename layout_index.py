@@ -0,0 +1,285 @@
+"""Layout fingerprints and a learned index of where each field sits.
+
+Contracts from the same vendor template share a layout: the same heading
+sequence, the same table shapes, the same key-value labels. `fingerprint`
+reduces a document's docling markdown to that skeleton (values stripped)
+and hashes it. After a successful extraction, `LayoutIndex.learn` records,
+per fingerprint and field, which section the final value was found in and
+the label in front of it. For a new document with a known (or near-identical)
+fingerprint, `lookup` reads the value straight from the same label, or at
+least returns the section text so only that region goes to the LLM.
+
+The index is a SQLite file that persists across runs; every learned document
+updates the hit/miss counts of its locations.
+
+    index = LayoutIndex()
+    match = index.lookup(markdown, fields=["Contract ID", "Contract Amount"])
+    match.values, match.regions
+    index.learn(markdown, final_record)
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+
+from fastpath import normalize, trusted_text
+from schema import FIELD_PATHS, flatten
+from sections import index_markdown
+
+DEFAULT_INDEX = "./.cache/layout_index.sqlite3"
+DEFAULT_SIMILARITY = 0.85
+
+_CELL_SPLIT = re.compile(r"\s*\|\s*")
+_LABEL_LINE = re.compile(r"^[^\w\n]*([A-Za-z][\w /&().'#-]{0,60}?)[^\w\n:]*:[ \t]*(.*?)[ \t]*$")
+
+
+def _norm(text):
+    """Lowercase, digits and punctuation dropped: what stays the same across a template."""
+    return re.sub(r"[^a-z]+", " ", text.lower()).strip()
+
+
+def _text(text):
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+def _cells(line):
+    return [cell.strip() for cell in _CELL_SPLIT.split(line.strip().strip("|"))]
+
+
+def _table_rows(text):
+    return [_cells(line) for line in text.splitlines()
+            if line.strip().startswith("|") and not re.match(r"^\s*\|?\s*:?-{3,}", line)]
+
+
+def skeleton(sections):
+    """Ordered layout features of a document, free of its values."""
+    features = []
+    for section in sections:
+        heading = _norm(section.heading)
+        if section.kind == "table":
+            rows = _table_rows(section.text)
+            header = " ".join(_norm(cell) for cell in rows[0]) if rows else ""
+            features.append(f"t:{heading}:{len(rows[0]) if rows else 0}:{header}")
+        elif section.kind == "key_value":
+            features.extend(f"kv:{heading}:{_norm(m.group(1))}"
+                            for m in map(_LABEL_LINE.match, section.text.splitlines()) if m)
+        else:
+            features.append(f"h:{heading}")
+    return features
+
+
+def fingerprint(markdown):
+    """(fingerprint, skeleton, sections) for a document's markdown."""
+    sections = index_markdown(markdown)
+    features = skeleton(sections)
+    digest = hashlib.sha256("\n".join(features).encode("utf-8")).hexdigest()[:16]
+    return digest, features, sections
+
+
+def addresses(sections):
+    """Stable address per section: heading, kind and position among its namesakes."""
+    seen = {}
+    result = []
+    for section in sections:
+        base = f"{_norm(section.heading)}|{section.kind}"
+        seen[base] = seen.get(base, 0) + 1
+        result.append(f"{base}|{seen[base]}")
+    return result
+
+
+def labelled_values(section):
+    """(label, raw value) pairs of a section: its heading, "Label: value" lines and table rows."""
+    pairs = [("heading", section.heading)] if section.heading else []
+    if section.kind == "table":
+        for row in _table_rows(section.text):
+            for i, cell in enumerate(row[:-1]):
+                value = next((c for c in row[i + 1:] if c), None)
+                if cell and value:
+                    pairs.append((f"cell:{_norm(cell)}", value))
+    for line in section.text.splitlines():
+        match = _LABEL_LINE.match(line)
+        if match and match.group(2):
+            pairs.append((f"line:{_norm(match.group(1))}", match.group(2)))
+    return pairs
+
+
+def _canonical(path, raw):
+    value, valid = normalize(path, raw)
+    return value if valid else None
+
+
+def _same(path, found, expected):
+    value = _canonical(path, found)
+    if value is not None and value == _canonical(path, str(expected)):
+        return True
+    return _text(found) == _text(str(expected)) != ""
+
+
+def locate(sections, record):
+    """{path: (section position, label)} of the section holding each value of `record`.
+
+    The label is "" when the value occurs in the section's text but not
+    behind a recognizable label.
+    """
+    found = {}
+    for path, value in flatten(record).items():
+        if value is None or value == "":
+            continue
+        for i, section in enumerate(sections):
+            label = next((lbl for lbl, raw in labelled_values(section)
+                          if _same(path, raw, value)), None)
+            if label is not None:
+                found[path] = (i, label)
+                break
+            if _text(str(value)) and _text(str(value)) in _text(section.render()):
+                found.setdefault(path, (i, ""))
+    return found
+
+
+@dataclass
+class IndexMatch:
+    fingerprint: str
+    known: str = None                                  # matched fingerprint in the index
+    similarity: float = 0.0
+    values: dict = field(default_factory=dict)         # path -> value read at the learned label
+    confidence: dict = field(default_factory=dict)     # path -> agreement of past documents
+    regions: dict = field(default_factory=dict)        # path -> section text holding the field
+
+    def context(self, paths):
+        """The sections holding `paths`, each once, for a narrowed LLM request."""
+        texts = []
+        for path in paths:
+            text = self.regions.get(path)
+            if text is not None and text not in texts:
+                texts.append(text)
+        return "\n\n".join(texts)
+
+
+class LayoutIndex:
+    def __init__(self, path=DEFAULT_INDEX, similarity=DEFAULT_SIMILARITY):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS layouts ("
+            " fingerprint TEXT PRIMARY KEY, skeleton TEXT NOT NULL,"
+            " documents INTEGER NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS locations ("
+            " fingerprint TEXT NOT NULL, field TEXT NOT NULL, address TEXT NOT NULL,"
+            " label TEXT NOT NULL, hits INTEGER NOT NULL, misses INTEGER NOT NULL,"
+            " PRIMARY KEY (fingerprint, field, address, label))"
+        )
+        self._db.commit()
+        # Skeletons are kept in memory for near-match search
+        self._skeletons = {
+            fp: set(json.loads(features))
+            for fp, features in self._db.execute("SELECT fingerprint, skeleton FROM layouts")
+        }
+        self.counters = {"lookups": 0, "exact": 0, "near": 0, "values": 0, "regions": 0,
+                         "learned": 0}
+
+    def _match(self, fp, features):
+        if fp in self._skeletons:
+            return fp, 1.0
+        features = set(features)
+        best, best_score = None, 0.0
+        for known, known_features in self._skeletons.items():
+            union = len(features | known_features)
+            score = len(features & known_features) / union if union else 0.0
+            if score > best_score:
+                best, best_score = known, score
+        if best_score >= self.similarity:
+            return best, best_score
+        return None, best_score
+
+    def _locations(self, fp):
+        rows = self._db.execute(
+            "SELECT field, address, label, hits, misses FROM locations WHERE fingerprint = ?"
+            " ORDER BY hits - misses DESC",
+            (fp,),
+        ).fetchall()
+        locations = {}
+        for path, address, label, hits, misses in rows:
+            locations.setdefault(path, []).append((address, label, hits, misses))
+        return locations
+
+    def lookup(self, markdown, fields=FIELD_PATHS):
+        """Values and regions for `fields` learned from documents with the same layout."""
+        fp, features, sections = fingerprint(markdown)
+        with self._lock:
+            self.counters["lookups"] += 1
+            known, score = self._match(fp, features)
+            match = IndexMatch(fp, known, score)
+            if known is None:
+                return match
+            self.counters["exact" if known == fp else "near"] += 1
+            locations = self._locations(known)
+        by_address = dict(zip(addresses(sections), sections))
+        for path in fields:
+            for address, label, hits, misses in locations.get(path, []):
+                section = by_address.get(address)
+                if section is None:
+                    continue
+                match.regions[path] = section.render()
+                if label:
+                    raw = next((v for lbl, v in labelled_values(section) if lbl == label), None)
+                    value, valid = normalize(path, raw) if raw else (None, False)
+                    # A learned location vouches for free text, as a template pattern does
+                    if valid or trusted_text(path, value):
+                        match.values[path] = value
+                        # One agreeing document gives 0.5, three give 0.75
+                        match.confidence[path] = round(hits / (hits + misses + 1), 3)
+                break
+        self.counters["values"] += len(match.values)
+        self.counters["regions"] += len(match.regions)
+        return match
+
+    def learn(self, markdown, record):
+        """Record where each value of a successful extraction sits in this layout."""
+        fp, features, sections = fingerprint(markdown)
+        section_addresses = addresses(sections)
+        found = {path: (section_addresses[i], label)
+                 for path, (i, label) in locate(sections, record).items()}
+        with self._lock:
+            # Near-identical layouts accumulate under the fingerprint they matched
+            known, _ = self._match(fp, features)
+            fp = known or fp
+            self._db.execute(
+                "INSERT INTO layouts (fingerprint, skeleton, documents, updated) VALUES (?, ?, 1, ?)"
+                " ON CONFLICT(fingerprint) DO UPDATE SET documents = documents + 1,"
+                " updated = excluded.updated",
+                (fp, json.dumps(features), time.time()),
+            )
+            self._skeletons.setdefault(fp, set(features))
+            for path, (address, label) in found.items():
+                # The location that held the value gains a hit, the others a miss
+                self._db.execute(
+                    "UPDATE locations SET misses = misses + 1 WHERE fingerprint = ? AND field = ?"
+                    " AND NOT (address = ? AND label = ?)",
+                    (fp, path, address, label),
+                )
+                self._db.execute(
+                    "INSERT INTO locations (fingerprint, field, address, label, hits, misses)"
+                    " VALUES (?, ?, ?, ?, 1, 0)"
+                    " ON CONFLICT(fingerprint, field, address, label) DO UPDATE SET hits = hits + 1",
+                    (fp, path, address, label),
+                )
+            self._db.commit()
+            self.counters["learned"] += 1
+        return fp
+
+    def stats(self):
+        with self._lock:
+            (layouts,) = self._db.execute("SELECT COUNT(*) FROM layouts").fetchone()
+        return {"layouts": layouts, **self.counters}
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,526 @@
+"""Async Azure OpenAI layer with rate-limit-aware scheduling and retries.
+
+Requests are admitted through two token buckets sized from the deployment's
+quota (requests per minute and tokens per minute), with a cap on requests in
+flight. 429s, timeouts, connection errors and 5xx responses are retried,
+honouring `retry-after` headers and otherwise backing off exponentially with
+full jitter.
+
+In-flight slots are handed out by prompt prefix (`PrefixScheduler`):
+requests sharing the prefix of the last request sent go first, and the
+first request with a new cacheable prefix is sent alone, so that the rest
+of its group can hit the provider's prompt cache. Cached prompt tokens
+from `usage.prompt_tokens_details` are reported per prefix.
+
+    llm = AsyncLLM(rpm=300, tpm=50_000, max_in_flight=16)
+    answer = await llm.chat(main.PROMPT, markdown)
+    print(llm.stats())
+
+With stream=True, `create` returns a `HeldStream` that keeps its in-flight
+slot, and counts its usage, until the stream is read to the end or closed.
+
+`FakeAsyncClient` stands in for `AsyncAzureOpenAI` when testing.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import time
+from collections import deque
+from types import SimpleNamespace
+
+import openai
+
+import main
+from cache import completion_key
+from tracing import count, count_usage
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+def estimate_tokens(messages):
+    """Rough prompt token count for admission control (about 4 chars per token)."""
+    chars = sum(len(message.get("content") or "") for message in messages)
+    return chars // 4 + 4 * len(messages) + 3
+
+
+def request_prefix(kwargs):
+    """(key, estimated tokens) of what a request shares with others: everything but its
+    last message (the document), i.e. model, response_format, tools and earlier messages."""
+    shared = {key: value for key, value in kwargs.items()
+              if key in ("model", "response_format", "tools")}
+    shared["messages"] = kwargs["messages"][:-1]
+    text = json.dumps(shared, sort_keys=True)
+    tokens = estimate_tokens(shared["messages"]) + len(
+        json.dumps(shared.get("response_format") or shared.get("tools") or "")) // 4
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12], tokens
+
+
+def cached_tokens(usage):
+    details = getattr(usage, "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", None) or 0
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait, from retry-after(-ms) headers."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+class TokenBucket:
+    """Refills `capacity` units per minute; waiters block until enough are available."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.available = per_minute
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount):
+        """Wait until `amount` units are available and take them. Returns seconds waited."""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return waited
+                delay = (amount - self.available) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+    def consume(self, amount):
+        """Charge units after the fact (may go negative, delaying later requests)."""
+        self._refill()
+        self.available -= amount
+
+    def pause(self, seconds):
+        """Empty the bucket so nothing is admitted for roughly `seconds`."""
+        self._refill()
+        self.available = min(self.available, -seconds * self.rate)
+
+
+class PrefixScheduler:
+    """In-flight slots handed out grouped by prompt prefix.
+
+    Waiting requests with the prefix of the last request admitted go first
+    (at most `max_run` in a row while other prefixes wait), so requests that
+    share a prefix reach the provider back to back. A prefix long enough to
+    be cached (`min_cached_tokens`) that has not completed a request within
+    `ttl` seconds is sent by one request alone. The rest of its group waits
+    until that request finishes and the provider has the prefix cached.
+    With `group=False` requests are admitted first come, first served.
+    """
+
+    def __init__(self, slots, group=True, min_cached_tokens=1024, ttl=300.0, max_run=32):
+        self.free = slots
+        self.group = group
+        self.min_cached_tokens = min_cached_tokens
+        self.ttl = ttl
+        self.max_run = max_run
+        self.arrivals = 0
+        self.waiting = {}    # prefix -> deque of (arrival, future)
+        self.tokens = {}     # prefix -> estimated tokens
+        self.warm = {}       # prefix -> time its last request completed
+        self.warming = set()
+        self.last = None
+        self.run = 0
+
+    def _cold(self, prefix):
+        if not self.group or self.tokens[prefix] < self.min_cached_tokens:
+            return False
+        return time.monotonic() - self.warm.get(prefix, float("-inf")) > self.ttl
+
+    def _ready(self, prefix):
+        return not (self._cold(prefix) and prefix in self.warming)
+
+    async def acquire(self, prefix, tokens):
+        self.tokens[prefix] = tokens
+        future = asyncio.get_running_loop().create_future()
+        entry = (self.arrivals, future)
+        self.arrivals += 1
+        self.waiting.setdefault(prefix, deque()).append(entry)
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(prefix, ok=False)
+            elif entry in self.waiting.get(prefix, ()):
+                self.waiting[prefix].remove(entry)
+                if not self.waiting[prefix]:
+                    del self.waiting[prefix]
+            raise
+
+    def release(self, prefix, ok):
+        self.free += 1
+        self.warming.discard(prefix)
+        if ok:
+            self.warm[prefix] = time.monotonic()
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.free > 0:
+            ready = [prefix for prefix, queue in self.waiting.items()
+                     if queue and self._ready(prefix)]
+            if not ready:
+                return
+            if not self.group:
+                prefix = min(ready, key=lambda p: self.waiting[p][0][0])
+            elif self.last in ready and (self.run < self.max_run or ready == [self.last]):
+                prefix = self.last
+            else:
+                others = [p for p in ready if p != self.last] or ready
+                prefix = max(others, key=lambda p: len(self.waiting[p]))
+            _, future = self.waiting[prefix].popleft()
+            if not self.waiting[prefix]:
+                del self.waiting[prefix]
+            self.free -= 1
+            self.run = self.run + 1 if prefix == self.last else 1
+            self.last = prefix
+            if self._cold(prefix):
+                self.warming.add(prefix)
+            future.set_result(None)
+
+
+def make_async_client():
+    return openai.AsyncAzureOpenAI(
+        api_key=main.AZURE_API_KEY,
+        azure_endpoint=main.AZURE_API_BASE,
+        api_version=main.AZURE_API_VERSION,
+        max_retries=0,
+    )
+
+
+class AsyncLLM:
+    def __init__(self, client=None, rpm=None, tpm=None, max_in_flight=16, max_retries=6,
+                 base_delay=1.0, max_delay=60.0, completion_reserve=1000, cache=None,
+                 group_prefixes=True):
+        """`rpm`/`tpm` are the deployment quota; None disables that bucket.
+
+        `completion_reserve` is the number of completion tokens charged up front
+        when the request does not set max_tokens. `group_prefixes=False`
+        admits requests first come, first served.
+        """
+        self.client = client
+        self.requests_bucket = TokenBucket(rpm) if rpm else None
+        self.tokens_bucket = TokenBucket(tpm) if tpm else None
+        self.scheduler = PrefixScheduler(max_in_flight, group=group_prefixes)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.completion_reserve = completion_reserve
+        self.cache = cache
+        self.queued = 0
+        self.in_flight = 0
+        self.counters = {
+            "requests": 0,
+            "retries": 0,
+            "throttled": 0,
+            "errors": 0,
+            "throttle_wait": 0.0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_tokens": 0,
+        }
+        # Per prompt prefix: requests, estimated prefix size and prompt tokens served from cache
+        self.prefixes = {}
+        # Per deployment: completions, their wall time (retries included) and tokens
+        self.models = {}
+
+    def _client(self):
+        if self.client is None:
+            self.client = make_async_client()
+        return self.client
+
+    def _backoff(self, attempt, error):
+        delay = retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return delay
+
+    async def _admit(self, cost):
+        waited = 0.0
+        if self.requests_bucket is not None:
+            waited += await self.requests_bucket.acquire(1)
+        if self.tokens_bucket is not None:
+            waited += await self.tokens_bucket.acquire(cost)
+        self.counters["throttle_wait"] += waited
+
+    async def create(self, **kwargs):
+        """chat.completions.create with admission control and retries."""
+        messages = kwargs["messages"]
+        cost = estimate_tokens(messages) + kwargs.get("max_tokens", self.completion_reserve)
+        prefix, prefix_tokens = request_prefix(kwargs)
+        self.queued += 1
+        admitted = False
+        try:
+            await self.scheduler.acquire(prefix, prefix_tokens)
+            self.queued -= 1
+            admitted = True
+            self.in_flight += 1
+            ok = held = False
+            start = time.perf_counter()
+            try:
+                response = await self._create_with_retries(cost, kwargs)
+                ok = True
+                if kwargs.get("stream"):
+                    # The slot stays taken until the stream is read to the end or closed
+                    held = True
+                    return HeldStream(response, lambda usage: self._stream_done(
+                        kwargs.get("model"), prefix, prefix_tokens, cost, start, usage))
+                self._count_prefix(prefix, prefix_tokens, getattr(response, "usage", None))
+                return response
+            finally:
+                if not held:
+                    self.in_flight -= 1
+                    self.scheduler.release(prefix, ok)
+        finally:
+            if not admitted:
+                self.queued -= 1
+
+    async def _create_with_retries(self, cost, kwargs):
+        attempt = 0
+        while True:
+            await self._admit(cost)
+            self.counters["requests"] += 1
+            try:
+                response = await self._client().chat.completions.create(**kwargs)
+            except RETRYABLE_ERRORS as e:
+                if isinstance(e, openai.RateLimitError):
+                    self.counters["throttled"] += 1
+                    count(throttled=1)
+                if attempt >= self.max_retries:
+                    self.counters["errors"] += 1
+                    raise
+                delay = self._backoff(attempt, e)
+                if isinstance(e, openai.RateLimitError) and self.tokens_bucket is not None:
+                    # Stop admitting anything else until the server's window has passed
+                    self.tokens_bucket.pause(delay)
+                attempt += 1
+                self.counters["retries"] += 1
+                count(retries=1)
+                await asyncio.sleep(delay)
+                continue
+            count(llm_calls=1)
+            self._count_usage(getattr(response, "usage", None), cost)
+            return response
+
+    def _count_usage(self, usage, cost):
+        if usage is None:
+            return
+        self.counters["prompt_tokens"] += usage.prompt_tokens or 0
+        self.counters["completion_tokens"] += usage.completion_tokens or 0
+        self.counters["cached_tokens"] += cached_tokens(usage)
+        count_usage(usage)
+        if self.tokens_bucket is not None:
+            self.tokens_bucket.consume(max(0, (usage.total_tokens or 0) - cost))
+
+    def _stream_done(self, model, prefix, prefix_tokens, cost, start, usage):
+        """Release a streamed request's slot and count the usage from its last chunk."""
+        self.in_flight -= 1
+        self.scheduler.release(prefix, True)
+        self._count_usage(usage, cost)
+        self._count_prefix(prefix, prefix_tokens, usage)
+        self._count_model(model, time.perf_counter() - start, usage)
+
+    async def chat(self, system_prompt, user_content, model=main.MODEL, **params):
+        """Async counterpart of main.chat: returns the completion text."""
+        if self.cache is not None:
+            key = completion_key(user_content, system_prompt, model, params)
+            answer = self.cache.get("completion", key)
+            if answer is not None:
+                count(cache_hit=1)
+                return answer
+        start = time.perf_counter()
+        response = await self.create(
+            model=model, messages=main.build_messages(system_prompt, user_content), **params
+        )
+        self._count_model(model, time.perf_counter() - start, getattr(response, "usage", None))
+        answer = response.choices[0].message.content
+        if self.cache is not None and answer is not None:
+            self.cache.put("completion", key, answer)
+        return answer
+
+    def _count_model(self, model, seconds, usage):
+        counters = self.models.setdefault(model, {"completions": 0, "seconds": 0.0,
+                                                  "prompt_tokens": 0, "completion_tokens": 0,
+                                                  "cached_tokens": 0})
+        counters["completions"] += 1
+        counters["seconds"] += seconds
+        if usage is not None:
+            counters["prompt_tokens"] += usage.prompt_tokens or 0
+            counters["completion_tokens"] += usage.completion_tokens or 0
+            counters["cached_tokens"] += cached_tokens(usage)
+
+    def _count_prefix(self, prefix, prefix_tokens, usage):
+        counters = self.prefixes.setdefault(prefix, {"requests": 0, "prefix_tokens": prefix_tokens,
+                                                     "prompt_tokens": 0, "cached_tokens": 0,
+                                                     "cache_hits": 0})
+        counters["requests"] += 1
+        if usage is not None:
+            counters["prompt_tokens"] += usage.prompt_tokens or 0
+            counters["cached_tokens"] += cached_tokens(usage)
+            counters["cache_hits"] += cached_tokens(usage) > 0
+
+    def stats(self):
+        models = {model: {**counters, "mean_seconds": counters["seconds"] / counters["completions"]}
+                  for model, counters in self.models.items()}
+        prompt_tokens = self.counters["prompt_tokens"]
+        return {"queue_depth": self.queued, "in_flight": self.in_flight, **self.counters,
+                "cached_tokens_pct": (100 * self.counters["cached_tokens"] / prompt_tokens
+                                      if prompt_tokens else None),
+                "models": models, "prefixes": self.prefixes}
+
+
+class HeldStream:
+    """A streamed response that holds its in-flight slot until it ends.
+
+    `done(usage)` is called once, with the usage of the last chunk (None
+    without stream_options={"include_usage": True}), when the stream is
+    exhausted, fails, or is closed.
+    """
+
+    def __init__(self, stream, done):
+        self.stream = stream
+        self.usage = None
+        self._done = done
+        self._iterator = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._iterator is None:
+            self._iterator = self.stream.__aiter__()
+        try:
+            chunk = await self._iterator.__anext__()
+        except BaseException:
+            self._finish()
+            raise
+        if getattr(chunk, "usage", None):
+            self.usage = chunk.usage
+        return chunk
+
+    async def aclose(self):
+        try:
+            close = getattr(self.stream, "aclose", None) or getattr(self.stream, "close", None)
+            if close is not None:
+                await close()
+        finally:
+            self._finish()
+
+    close = aclose
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    def _finish(self):
+        if self._done is not None:
+            done, self._done = self._done, None
+            done(self.usage)
+
+    def __del__(self):
+        # A stream dropped without being read or closed still gives its slot back
+        self._finish()
+
+
+class FakeAsyncClient:
+    """Drop-in for AsyncAzureOpenAI in tests.
+
+    `responder(messages, **params)` returns the completion text. `failures`
+    is a list of HTTP status codes to fail the first requests with (e.g.
+    [429, 500]); `latency` adds an artificial delay per request. With
+    stream=True the text comes back in `chunk_size` character deltas,
+    `chunk_delay` seconds apart. With `prompt_cache`, a request whose prefix
+    (see request_prefix) is 1024+ tokens and was completed before reports it
+    as cached_tokens, in 128-token steps, like the provider.
+    """
+
+    def __init__(self, responder=None, failures=(), latency=0.0, retry_after=None,
+                 chunk_size=8, chunk_delay=0.0, prompt_cache=False):
+        self.responder = responder or (lambda messages, **params: json.dumps({}))
+        self.failures = list(failures)
+        self.latency = latency
+        self.retry_after = retry_after
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.prompt_cache = prompt_cache
+        self.cached_prefixes = set()
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _error(self, status):
+        import httpx
+
+        headers = {"retry-after": str(self.retry_after)} if self.retry_after is not None else {}
+        request = httpx.Request("POST", "https://fake.openai.azure.com/chat/completions")
+        response = httpx.Response(status, headers=headers, request=request)
+        if status == 429:
+            return openai.RateLimitError("rate limited", response=response, body=None)
+        return openai.InternalServerError("server error", response=response, body=None)
+
+    async def _create(self, **kwargs):
+        self.calls.append(kwargs)
+        prefix, prefix_tokens = request_prefix(kwargs)
+        cached = 0
+        if self.prompt_cache and prefix_tokens >= 1024 and prefix in self.cached_prefixes:
+            cached = prefix_tokens // 128 * 128
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.prompt_cache:
+            self.cached_prefixes.add(prefix)
+        if self.failures:
+            raise self._error(self.failures.pop(0))
+        messages = kwargs["messages"]
+        params = {k: v for k, v in kwargs.items()
+                  if k not in {"messages", "stream", "stream_options"}}
+        content = self.responder(messages, **params)
+        prompt_tokens = estimate_tokens(messages)
+        completion_tokens = len(content or "") // 4
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens,
+                                completion_tokens=completion_tokens,
+                                total_tokens=prompt_tokens + completion_tokens,
+                                prompt_tokens_details=SimpleNamespace(
+                                    cached_tokens=min(cached, prompt_tokens)))
+        if kwargs.get("stream"):
+            return self._stream(content or "", usage)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content, tool_calls=None),
+                                     finish_reason="stop")],
+            usage=usage,
+        )
+
+    async def _stream(self, content, usage):
+        for i in range(0, len(content), self.chunk_size):
+            if self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            delta = SimpleNamespace(content=content[i:i + self.chunk_size])
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=None)],
+                                  usage=None)
+        yield SimpleNamespace(choices=[], usage=usage)
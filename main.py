@@ -7,22 +7,11 @@ AZURE_API_KEY = os.getenv("AZURE_API_KEY")
 AZURE_API_VERSION = os.getenv("AZURE_API_VERSION")
 AZURE_API_BASE = os.getenv("AZURE_API_BASE")
 AZURE_DEPLOYMENT_NAME = os.getenv("AZURE_DEPLOYMENT_NAME")
+# Deployment that low-confidence answers are escalated to (see routing.py)
+AZURE_STRONG_DEPLOYMENT_NAME = os.getenv("AZURE_STRONG_DEPLOYMENT_NAME")
 
-from openai import AzureOpenAI
-
-az_client = AzureOpenAI(
-  api_key=AZURE_API_KEY,
-  azure_endpoint=AZURE_API_BASE,
-  api_version=AZURE_API_VERSION
-)
-
-from docling.document_converter import DocumentConverter
-
-source = "./sample_contract.pdf"  # document per local path or URL
-converter = DocumentConverter()
-result = converter.convert(source)
-
-# print(result.document.export_to_markdown()) 
+MODEL = AZURE_DEPLOYMENT_NAME or "ak-gpt-4o-mini"
+STRONG_MODEL = AZURE_STRONG_DEPLOYMENT_NAME or "ak-gpt-4o"
 
 PROMPT = """Extract the following fields from the contract and give them as output in json:
 - Contract ID
@@ -62,71 +51,179 @@ Prioritize identifying contextual information or implied terms for missing field
 Maintain consistent formatting and ensure the extracted data is ready for further automated processing.
 """
 
-result=result.document.export_to_markdown()
+VALID_PROMPT="""
+You are a data transformation expert tasked with correcting invalid fields in extracted contract data. Your goal is to process the validated data and validation log, identify fields marked as invalid, and transform them into the proper format. Use the following rules to correct each field type:
 
-output = az_client.chat.completions.create(
-    model="ak-gpt-4o-mini",
-    messages=[
-        {
-            "role": "system",
-            "content": PROMPT
-        },
-        {
-            "role": "user",
-            "content": result
-        }
-    ]
-)
+Rules for Data Transformation:
+Dates:
 
-answer =output.choices[0].message.content
+Ensure all dates are in the YYYY-MM-DD format.
+Try to correct the field on the basis of contextual information in () if available.
+And Ensure that after updating or retaining the field on the basis of contextual information in (), remove the () and its data from corrected field.
+If a valid transformation is not possible, set the date to same as start date (or a provided default).
+Monetary Values:
 
-import markdown2
-from rich.console import Console
-from rich.markdown import Markdown
+Ensure monetary values are formatted as decimals with two places (e.g., 25000.00).
+Remove any non-numeric characters (e.g., $, ,) and properly format the value.
+If the value cannot be determined, set it to 0.00.
+Missing Fields:
 
-def print_pretty_markdown(markdown_text: str):
-    # Convert markdown to HTML (if needed) or process raw markdown
-    html_content = markdown2.markdown(markdown_text)
+For fields flagged as "missing" or "not specified," use the following defaults:
+Contract ID: UNKNOWN_CONTRACT_ID
+Customer ID: UNKNOWN_CUSTOMER_ID
+If another field is ambiguous or missing, provide a best-effort transformation or leave it as "N/A."
+Metadata:
 
-    # Create a Console object to display rich output
-    console = Console()
+Ensure all nested metadata fields are properly formatted and not ambiguous.
+Use default values or corrections where necessary.
+Behavior Guidelines:
+Be transparent in the transformations you apply. Log the changes you make to the data and explain your reasoning.
+Do not modify fields that are already valid.
+Return the fully corrected data in the same structure as the input.
+Input Format:
+You will receive two inputs:
 
-    # Use the Markdown class from the rich library to format and print markdown
-    md = Markdown(markdown_text)
+Validated Data: A dictionary containing the data extracted from the contract, with potential invalid fields.
+Validation Log: A list of logs specifying fields that are invalid, ambiguous, or missing.
+Output Format:
+Return a single JSON object with:
 
-    # Print the formatted markdown
-    console.print(md)
+Corrected Data: The fully corrected version of the validated data.
+Correction Log: A list explaining how each invalid field was corrected or why it was left as-is.
 
-# Example usage
-markdown_content = answer
-print_pretty_markdown(markdown_content)
+"""
 
 import re
-import pandas as pd
 import json
+from datetime import datetime
 
-# Input text
-text = answer
-# Step 1: Extract the JSON portion of the string
-start = text.find("{")
-end = text.rfind("}") + 1  # Include the closing brace
-json_text = text[start:end]
+from cache import completion_key, markdown_key
+from schema import CORRECTION_FORMAT, EXTRACTION_FORMAT, salvage_json
+from tracing import count, count_usage
 
-# Step 2: Parse the extracted JSON
-data = json.loads(json_text)
+# API details
+ZENSKAR_URL = "https://api.zenskar.com/contract_v2"
+ZENSKAR_HEADERS = {
+    "accept": "application/json",
+    "content-type": "application/json"
+}
 
-# Output: Pretty print the JSON
-print(json.dumps(data, indent=4))
 
-# Convert to JSON
-json_data = json.dumps(data, indent=4)
+# openai, docling and requests take seconds to import between them, so they
+# are imported on first use rather than at startup.
+_client = None
+_converter = None
+
+def get_client():
+    """Build the Azure OpenAI client once and reuse its connection pool."""
+    global _client
+    if _client is None:
+        from openai import AzureOpenAI
+        _client = AzureOpenAI(
+            api_key=AZURE_API_KEY,
+            azure_endpoint=AZURE_API_BASE,
+            api_version=AZURE_API_VERSION
+        )
+    return _client
 
-import re
-import json
-from datetime import datetime
 
-# Sample extracted data
-extracted_data = json.loads(json_data)
+def get_converter():
+    """Build the DocumentConverter once and reuse its loaded models."""
+    global _converter
+    if _converter is None:
+        from docling.document_converter import DocumentConverter
+        _converter = DocumentConverter()
+    return _converter
+
+
+def convert_document(source, converter=None, cache=None):
+    """Convert a PDF (local path or URL) to markdown with docling."""
+    if cache is not None:
+        from conversion import converter_settings
+
+        key = markdown_key(source, converter_settings())
+        markdown = cache.get("markdown", key)
+        if markdown is not None:
+            return markdown
+    converter = converter or get_converter()
+    result = converter.convert(source)
+    markdown = result.document.export_to_markdown()
+    if cache is not None:
+        cache.put("markdown", key, markdown)
+    return markdown
+
+
+def build_messages(system_prompt, user_content):
+    return [
+        {
+            "role": "system",
+            "content": system_prompt
+        },
+        {
+            "role": "user",
+            "content": user_content
+        }
+    ]
+
+
+def chat(system_prompt, user_content, client=None, model=MODEL, cache=None, **params):
+    """Send a system + user message pair and return the completion text.
+
+    Extra keyword arguments (e.g. response_format) go to chat.completions.create.
+    """
+    if cache is not None:
+        key = completion_key(user_content, system_prompt, model, params)
+        answer = cache.get("completion", key)
+        if answer is not None:
+            count(cache_hit=1)
+            return answer
+    client = client or get_client()
+    output = client.chat.completions.create(
+        model=model,
+        messages=build_messages(system_prompt, user_content),
+        **params
+    )
+    count(llm_calls=1)
+    if getattr(output, "usage", None) is not None:
+        count_usage(output.usage)
+    answer = output.choices[0].message.content
+    if cache is not None and answer is not None:
+        cache.put("completion", key, answer)
+    return answer
+
+
+def extract_fields(markdown, prompt=PROMPT, client=None, model=MODEL, cache=None, structured=True):
+    """Run the extraction prompt over the contract markdown.
+
+    With `structured` the answer is constrained to CONTRACT_SCHEMA.
+    """
+    params = {"response_format": EXTRACTION_FORMAT} if structured else {}
+    return chat(prompt, markdown, client=client, model=model, cache=cache, **params)
+
+
+def parse_json_answer(answer):
+    """Parse a JSON answer: a bare object, an object embedded in prose or
+    fences, or, for truncated output, whichever members closed."""
+    try:
+        return json.loads(answer)
+    except json.JSONDecodeError:
+        pass
+    # Extract the JSON portion of the string
+    start = answer.find("{")
+    end = answer.rfind("}") + 1  # Include the closing brace
+    try:
+        return json.loads(answer[start:end])
+    except json.JSONDecodeError as e:
+        salvaged = salvage_json(answer)
+        if not salvaged:
+            raise e
+        return salvaged
+
+
+def parse_extraction(answer):
+    """Pull the JSON object out of the extraction answer."""
+    return parse_json_answer(answer)
+
 
 # Define validation functions
 def validate_date(date_str):
@@ -162,165 +259,232 @@ def handle_missing_or_ambiguous(field, value, default=None):
         return default, False  # Ambiguous or missing data
     return value, True
 
-# Validate each field
-validated_data = {}
-validation_log = []
 
-for field, value in extracted_data.items():
-    if field in {"Contract Start Date", "Contract End Date"}:
-        validated_value, is_valid = validate_date(value)
+def has_value(value):
+    """Whether an extracted value is present: not null, empty, "N/A" or flagged
+    as missing/ambiguous by handle_missing_or_ambiguous."""
+    if value is None:
+        return False
+    if not isinstance(value, str):
+        return True
+    value = value.strip()
+    return value not in ("", "N/A") and handle_missing_or_ambiguous(None, value)[1]
+
+
+def validate_record(extracted_data):
+    """Validate each extracted field.
+
+    Returns (validated_data, validation_log, invalid_fields), where
+    invalid_fields names the failing fields ("Metadata.<sub field>" for
+    metadata).
+    """
+    validated_data = {}
+    validation_log = []
+    invalid_fields = []
+
+    for field, value in extracted_data.items():
+        if value is None and field != "Metadata":
+            # Structured output uses null for fields it could not find
+            validated_value, is_valid = None, False
+            validation_log.append(f"Missing data in field '{field}': null")
+        elif field in {"Contract Start Date", "Contract End Date"}:
+            validated_value, is_valid = validate_date(value)
+            if not is_valid:
+                validation_log.append(f"Invalid date in field '{field}': '{value}'")
+        elif field == "Contract Amount":
+            validated_value, is_valid = validate_monetary(value)
+            if not is_valid:
+                validation_log.append(f"Invalid monetary value in field '{field}': '{value}'")
+        elif field == "Status":
+            validated_value, is_valid = validate_status(value)
+            if not is_valid:
+                validation_log.append(f"Invalid status in field '{field}': '{value}'")
+        elif field in {"Contract ID", "Customer ID"}:
+            validated_value, is_valid = handle_missing_or_ambiguous(field, value, default="N/A")
+            if not is_valid:
+                validation_log.append(f"Missing data in field '{field}': '{value}'")
+        else:
+            validated_value, is_valid = value, True  # No special validation needed
+
+        # Update validated data
+        validated_data[field] = validated_value
         if not is_valid:
-            validation_log.append(f"Invalid date in field '{field}': '{value}'")
-    elif field == "Contract Amount":
-        validated_value, is_valid = validate_monetary(value)
-        if not is_valid:
-            validation_log.append(f"Invalid monetary value in field '{field}': '{value}'")
-    elif field == "Status":
-        validated_value, is_valid = validate_status(value)
-        if not is_valid:
-            validation_log.append(f"Invalid status in field '{field}': '{value}'")
-    elif field in {"Contract ID", "Customer ID"}:
-        validated_value, is_valid = handle_missing_or_ambiguous(field, value, default="N/A")
-        if not is_valid:
-            validation_log.append(f"Missing data in field '{field}': '{value}'")
-    else:
-        validated_value, is_valid = value, True  # No special validation needed
-
-    # Update validated data
-    validated_data[field] = validated_value
-
-# Process nested Metadata
-if "Metadata" in extracted_data:
-    validated_data["Metadata"] = {}
-    for sub_field, sub_value in extracted_data["Metadata"].items():
-        validated_data["Metadata"][sub_field], is_valid = handle_missing_or_ambiguous(
-            sub_field, sub_value
-        )
-        if not is_valid:
-            validation_log.append(f"Ambiguous data in Metadata field '{sub_field}': '{sub_value}'")
-
-# Output validated data and logs
-print("Validated Data:")
-print(json.dumps(validated_data, indent=4))
-
-print("\nValidation Log:")
-for log in validation_log:
-    print(log)
-
-result = f"""
+            invalid_fields.append(field)
+
+    # Process nested Metadata
+    if extracted_data.get("Metadata") is not None:
+        validated_data["Metadata"] = {}
+        for sub_field, sub_value in extracted_data["Metadata"].items():
+            if sub_value is None:
+                validated_data["Metadata"][sub_field], is_valid = None, False
+            else:
+                validated_data["Metadata"][sub_field], is_valid = handle_missing_or_ambiguous(
+                    sub_field, sub_value
+                )
+            if not is_valid:
+                validation_log.append(f"Ambiguous data in Metadata field '{sub_field}': '{sub_value}'")
+                invalid_fields.append(f"Metadata.{sub_field}")
+
+    return validated_data, validation_log, invalid_fields
+
+
+def failing_subset(extracted_data, invalid_fields):
+    """The raw values of the failing fields, for the correction call.
+
+    The start date is kept as context for an invalid end date, since
+    VALID_PROMPT falls back to it.
+    """
+    subset = {}
+    for path in invalid_fields:
+        if path.startswith("Metadata."):
+            sub_field = path[len("Metadata."):]
+            subset.setdefault("Metadata", {})[sub_field] = extracted_data["Metadata"][sub_field]
+        else:
+            subset[path] = extracted_data[path]
+    if "Contract End Date" in subset and "Contract Start Date" in extracted_data:
+        subset.setdefault("Contract Start Date", extracted_data["Contract Start Date"])
+    return subset
+
+
+def merge_corrections(validated_data, corrected_data, invalid_fields):
+    """Copy the corrected values of the failing fields into the validated record."""
+    merged = dict(validated_data)
+    if "Metadata" in merged:
+        merged["Metadata"] = dict(merged["Metadata"])
+    corrected_metadata = corrected_data.get("Metadata") or {}
+    for path in invalid_fields:
+        if path.startswith("Metadata."):
+            sub_field = path[len("Metadata."):]
+            if sub_field in corrected_metadata:
+                merged["Metadata"][sub_field] = corrected_metadata[sub_field]
+        elif path in corrected_data:
+            merged[path] = corrected_data[path]
+    return merged
+
+
+def correction_input(extracted_data, validation_log):
+    """User message for the VALID_PROMPT correction call."""
+    return f"""
 Validated Data:
-{json.dumps(json_data, indent=4)}
+{json.dumps(extracted_data, indent=4)}
 
 Validation Log:
 {json.dumps(validation_log, indent=4)}
 """
 
-VALID_PROMPT="""
-You are a data transformation expert tasked with correcting invalid fields in extracted contract data. Your goal is to process the validated data and validation log, identify fields marked as invalid, and transform them into the proper format. Use the following rules to correct each field type:
-
-Rules for Data Transformation:
-Dates:
 
-Ensure all dates are in the YYYY-MM-DD format.
-Try to correct the field on the basis of contextual information in () if available.
-And Ensure that after updating or retaining the field on the basis of contextual information in (), remove the () and its data from corrected field.
-If a valid transformation is not possible, set the date to same as start date (or a provided default).
-Monetary Values:
+def correct_record(extracted_data, validation_log, invalid_fields, client=None, model=MODEL,
+                   cache=None, structured=True):
+    """Ask the LLM to fix the fields flagged in the validation log.
+
+    Only the failing fields are sent. Returns None without calling the LLM
+    when nothing failed.
+    """
+    if not invalid_fields:
+        return None
+    params = {"response_format": CORRECTION_FORMAT} if structured else {}
+    return chat(VALID_PROMPT,
+                correction_input(failing_subset(extracted_data, invalid_fields), validation_log),
+                client=client, model=model, cache=cache, **params)
+
+
+def parse_correction(corrected):
+    """Pull the corrected data out of the correction answer (bare or fenced JSON)."""
+    json_match = re.search(r"```json\n(.*)\n```", corrected, re.S)
+    text = json_match.group(1) if json_match else corrected
+    if "{" not in text:
+        return None
+    data = parse_json_answer(text)
+    # VALID_PROMPT asks for {"Corrected Data": ..., "Correction Log": ...}
+    if "Corrected Data" in data:
+        return data["Corrected Data"]
+    if "Correction Log" in data:
+        return None
+    return data
+
+
+def build_payload(validated_data):
+    """Map validated data to the API's expected payload structure."""
+    return {
+        "name": validated_data.get("Contract Name", "string"),
+        "description": validated_data.get("Description", "string"),
+        "status": (validated_data.get("Status") or "string").lower(),
+        "currency": validated_data.get("Currency", "string"),
+        "start_date": validated_data.get("Contract Start Date", "2024-12-06T14:24:48.532Z"),
+        "end_date": validated_data.get("Contract End Date", "2024-12-06T14:24:48.532Z"),
+        "customer_id": validated_data.get("Customer ID", "string"),
+        "anchor_date": validated_data.get("Anchor Date", "string"),
+        "plan_id": validated_data.get("Plan ID", "string")
+    }
+
+
+def submit_contract(payload, url=ZENSKAR_URL, timeout=30):
+    """POST the payload to Zenskar and return the response."""
+    import requests
+    return requests.post(url, json=payload, headers=ZENSKAR_HEADERS, timeout=timeout)
 
-Ensure monetary values are formatted as decimals with two places (e.g., 25000.00).
-Remove any non-numeric characters (e.g., $, ,) and properly format the value.
-If the value cannot be determined, set it to 0.00.
-Missing Fields:
 
-For fields flagged as "missing" or "not specified," use the following defaults:
-Contract ID: UNKNOWN_CONTRACT_ID
-Customer ID: UNKNOWN_CUSTOMER_ID
-If another field is ambiguous or missing, provide a best-effort transformation or leave it as "N/A."
-Metadata:
-
-Ensure all nested metadata fields are properly formatted and not ambiguous.
-Use default values or corrections where necessary.
-Behavior Guidelines:
-Be transparent in the transformations you apply. Log the changes you make to the data and explain your reasoning.
-Do not modify fields that are already valid.
-Return the fully corrected data in the same structure as the input.
-Input Format:
-You will receive two inputs:
+def print_pretty_markdown(markdown_text: str):
+    from rich.console import Console
+    from rich.markdown import Markdown
 
-Validated Data: A dictionary containing the data extracted from the contract, with potential invalid fields.
-Validation Log: A list of logs specifying fields that are invalid, ambiguous, or missing.
-Output Format:
-Return a single JSON object with:
+    # Create a Console object to display rich output
+    console = Console()
 
-Corrected Data: The fully corrected version of the validated data.
-Correction Log: A list explaining how each invalid field was corrected or why it was left as-is.
+    # Use the Markdown class from the rich library to format and print markdown
+    md = Markdown(markdown_text)
 
-"""
+    # Print the formatted markdown
+    console.print(md)
 
-valid_output = az_client.chat.completions.create(
-    model="ak-gpt-4o-mini",
-    messages=[
-        {
-            "role": "system",
-            "content": VALID_PROMPT
-        },
-        {
-            "role": "user",
-            "content": result
-        }
-    ]
-)
-print(valid_output.choices[0].message.content)
 
-# json_data
+def main(source="./sample_contract.pdf"):
+    markdown = convert_document(source)
 
-corrected = valid_output.choices[0].message.content
+    answer = extract_fields(markdown)
+    print_pretty_markdown(answer)
 
-json_match = re.search(r"```json\n(.*)\n```", corrected, re.S)
-if json_match:
-    json_data_str = json_match.group(1)  # Extract json string
-    try:
-        # Parse the json string into a Python dictionary
-        extracted_data = json.loads(json_data_str)
-        print("Extracted JSON:")
-        print(json.dumps(extracted_data, indent=4))
-    except json.JSONDecodeError as e:
-        print("Failed to parse JSON:", e)
-else:
-    print("No JSON found in the response.")
+    extracted_data = parse_extraction(answer)
+    print(json.dumps(extracted_data, indent=4))
 
-import requests
-import json
+    validated_data, validation_log, invalid_fields = validate_record(extracted_data)
 
-# Validated data (use the output of your validation script)
-validated_data = extracted_data
-# Map validated data to the API's expected payload structure
-payload = {
-     "name": validated_data.get("Contract Name", "string"),
-    "description": validated_data.get("Description", "string"),
-    "status": validated_data.get("Status", "string").lower(),
-    "currency": validated_data.get("Contract Name", "string"),
-    "start_date":validated_data.get("Contract Start Date", "2024-12-06T14:24:48.532Z"),
-    "end_date": validated_data.get("Contract End Date", "2024-12-06T14:24:48.532Z"),
-    "customer_id": validated_data.get("Customer ID", "2024-12-06T14:24:48.532Z"),
-    "anchor_date": validated_data.get("Anchor Date", "string"),
-    "plan_id": validated_data.get("Plan ID", "string")
+    # Output validated data and logs
+    print("Validated Data:")
+    print(json.dumps(validated_data, indent=4))
 
-}
+    print("\nValidation Log:")
+    for log in validation_log:
+        print(log)
 
-# API details
-url = "https://api.zenskar.com/contract_v2"
-headers = {
-    "accept": "application/json",
-    "content-type": "application/json"
-}
+    if not invalid_fields:
+        print("All fields valid, skipping correction.")
+    else:
+        corrected = correct_record(extracted_data, validation_log, invalid_fields)
+        print(corrected)
+
+        try:
+            corrected_data = parse_correction(corrected)
+        except json.JSONDecodeError as e:
+            print("Failed to parse JSON:", e)
+            corrected_data = None
+        if corrected_data is None:
+            print("No JSON found in the response.")
+        else:
+            validated_data = merge_corrections(validated_data, corrected_data, invalid_fields)
+            print("Extracted JSON:")
+            print(json.dumps(validated_data, indent=4))
+
+    # Make the POST request
+    response = submit_contract(build_payload(validated_data))
+
+    # Output the response
+    if response.status_code == 200:
+        print("Contract successfully created.")
+    else:
+        print(f"Failed to create contract: {response.status_code}")
+        print("Response:", response.text)
 
-# Make the POST request
-response = requests.post(url, json=payload, headers=headers)
 
-# Output the response
-if response.status_code == 200:
-    print("Contract successfully created.")
-else:
-    print(f"Failed to create contract: {response.status_code}")
-    print("Response:", response.text)
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,25 @@
-from dotenv import load_dotenv
-import os
-load_dotenv()
-
-# Azure OpenAI setup
-AZURE_API_KEY = os.getenv("AZURE_API_KEY")
-AZURE_API_VERSION = os.getenv("AZURE_API_VERSION")
-AZURE_API_BASE = os.getenv("AZURE_API_BASE")
-AZURE_DEPLOYMENT_NAME = os.getenv("AZURE_DEPLOYMENT_NAME")
-
-from openai import AzureOpenAI
-
-az_client = AzureOpenAI(
-    api_key=AZURE_API_KEY,
-    azure_endpoint=AZURE_API_BASE,
-    api_version=AZURE_API_VERSION
+import json
+import sys
+
+from main import (
+    MODEL,
+    build_payload,
+    chat,
+    convert_document,
+    extract_fields,
+    failing_subset,
+    get_client,
+    handle_missing_or_ambiguous,
+    merge_corrections,
+    parse_correction,
+    parse_extraction,
+    print_pretty_markdown,
+    submit_contract,
+    validate_date,
+    validate_monetary,
+    validate_status,
 )
+from schema import CORRECTION_FORMAT
 
 # Tool definitions for validation
 tools = [
@@ -46,12 +51,6 @@ tools = [
     }
 ]
 
-from docling.document_converter import DocumentConverter
-
-source = "./sample_contract.pdf"
-converter = DocumentConverter()
-result = converter.convert(source)
-
 PROMPT = """Extract the following fields from the contract and give them as output in json:
 - Contract ID
 - Contract Name
@@ -90,105 +89,6 @@ Prioritize identifying contextual information or implied terms for missing field
 Maintain consistent formatting and ensure the extracted data is ready for further automated processing.
 """
 
-result = result.document.export_to_markdown()
-
-output = az_client.chat.completions.create(
-    model="ak-gpt-4o-mini",
-    messages=[
-        {
-            "role": "system",
-            "content": PROMPT
-        },
-        {
-            "role": "user",
-            "content": result
-        }
-    ]
-)
-
-answer = output.choices[0].message.content
-
-import markdown2
-from rich.console import Console
-from rich.markdown import Markdown
-
-def print_pretty_markdown(markdown_text: str):
-    # Convert markdown to HTML (if needed) or process raw markdown
-    html_content = markdown2.markdown(markdown_text)
-
-    # Create a Console object to display rich output
-    console = Console()
-
-    # Use the Markdown class from the rich library to format and print markdown
-    md = Markdown(markdown_text)
-
-    # Print the formatted markdown
-    console.print(md)
-
-# Example usage
-markdown_content = answer
-print_pretty_markdown(markdown_content)
-
-import re
-import pandas as pd
-import json
-
-# Input text
-text = answer
-# Step 1: Extract the JSON portion of the string
-start = text.find("{")
-end = text.rfind("}") + 1  # Include the closing brace
-json_text = text[start:end]
-
-# Step 2: Parse the extracted JSON
-data = json.loads(json_text)
-
-# Output: Pretty print the JSON
-print(json.dumps(data, indent=4))
-
-# Convert to JSON
-json_data = json.dumps(data, indent=4)
-
-# Initial validation using tool calling
-validation_results = []
-validation_log = []
-
-for field, value in data.items():
-    if field == "Metadata":
-        for sub_field, sub_value in value.items():
-            tool_call = az_client.chat.completions.create(
-                model="ak-gpt-4o-mini",
-                messages=[{"role": "user", "content": f"Validate {sub_field}: {sub_value}"}],
-                tools=tools
-            )
-            if tool_call.choices[0].message.tool_calls:
-                result = json.loads(tool_call.choices[0].message.tool_calls[0].function.arguments)
-                validation_results.append(result)
-                if "error" in result:
-                    validation_log.append(f"Metadata.{sub_field}: {result['error']}")
-    else:
-        field_type = "date" if "Date" in field else \
-                    "monetary" if "Amount" in field else \
-                    "status" if field == "Status" else \
-                    "id" if "ID" in field else "general"
-        
-        tool_call = az_client.chat.completions.create(
-            model="ak-gpt-4o-mini",
-            messages=[{"role": "user", "content": f"Validate {field}: {value}"}],
-            tools=tools
-        )
-        if tool_call.choices[0].message.tool_calls:
-            result = json.loads(tool_call.choices[0].message.tool_calls[0].function.arguments)
-            validation_results.append(result)
-            if "error" in result:
-                validation_log.append(f"{field}: {result['error']}")
-
-# Prepare validation result for LLM
-validation_input = {
-    "extracted_data": data,
-    "validation_log": validation_log
-}
-
 VALID_PROMPT = """
 You are a data transformation expert tasked with correcting invalid fields in extracted contract data. Your goal is to process the validated data and validation log, identify fields marked as invalid, and transform them into the proper format. Use the following rules:
 
@@ -217,62 +117,200 @@ Metadata:
 Return the corrected data in JSON format with a correction log.
 """
 
-valid_output = az_client.chat.completions.create(
-    model="ak-gpt-4o-mini",
-    messages=[
-        {
-            "role": "system",
-            "content": VALID_PROMPT
-        },
-        {
-            "role": "user",
-            "content": json.dumps(validation_input)
-        }
-    ]
-)
-print(valid_output.choices[0].message.content)
-
-corrected = valid_output.choices[0].message.content
-
-# Extract JSON from corrected output
-json_match = re.search(r"```json\n(.*)\n```", corrected, re.S)
-if json_match:
-    json_data_str = json_match.group(1)
-    try:
-        extracted_data = json.loads(json_data_str)
-        print("Extracted JSON:")
-        print(json.dumps(extracted_data, indent=4))
-    except json.JSONDecodeError as e:
-        print("Failed to parse JSON:", e)
-else:
-    print("No JSON found in the response.")
-
-import requests
-
-# Prepare API payload
-payload = {
-    "name": extracted_data.get("Contract Name", "string"),
-    "description": extracted_data.get("Description", "string"),
-    "status": extracted_data.get("Status", "string").lower(),
-    "currency": extracted_data.get("Currency", "string"),
-    "start_date": extracted_data.get("Contract Start Date", "2024-12-06T14:24:48.532Z"),
-    "end_date": extracted_data.get("Contract End Date", "2024-12-06T14:24:48.532Z"),
-    "customer_id": extracted_data.get("Customer ID", "string"),
-    "anchor_date": extracted_data.get("Anchor Date", "string"),
-    "plan_id": extracted_data.get("Plan ID", "string")
+TOOL_PROMPT = """You validate fields extracted from a contract.
+Call validate_field once for every field in the user message, all in this turn.
+Pick field_type from: date, monetary, status, id, general.
+Pass field_name and field_value exactly as given."""
+
+# Field types for the PROMPT field set; these never need the LLM to classify them
+FIELD_TYPES = {
+    "Contract ID": "id",
+    "Contract Name": "general",
+    "Status": "status",
+    "Currency": "general",
+    "Customer ID": "id",
+    "Customer Name": "general",
+    "Contract Start Date": "date",
+    "Contract End Date": "date",
+    "Payment Terms": "general",
+    "Contract Amount": "monetary",
+    "Billing Frequency": "general",
+    "Contract Type": "general",
 }
 
-# API call
-url = "https://api.zenskar.com/contract_v2"
-headers = {
-    "accept": "application/json",
-    "content-type": "application/json"
-}
 
-response = requests.post(url, json=payload, headers=headers)
+def guess_field_type(field):
+    """Classify a field by name when it is not in FIELD_TYPES."""
+    return "date" if "Date" in field else \
+        "monetary" if "Amount" in field else \
+        "status" if field == "Status" else \
+        "id" if "ID" in field else "general"
+
+
+def validate_field(field_name, field_value, field_type):
+    """Local implementation of the validate_field tool."""
+    if field_value is None:
+        return {"field_name": field_name, "field_type": field_type, "value": None,
+                "error": "missing value"}
+    value = str(field_value)
+    if field_type == "date":
+        validated_value, is_valid = validate_date(value)
+        error = f"invalid date '{value}'"
+    elif field_type == "monetary":
+        validated_value, is_valid = validate_monetary(value)
+        error = f"invalid monetary value '{value}'"
+    elif field_type == "status":
+        validated_value, is_valid = validate_status(value)
+        error = f"invalid status '{value}'"
+    elif field_type == "id":
+        validated_value, is_valid = handle_missing_or_ambiguous(field_name, value, default="N/A")
+        error = f"missing data '{value}'"
+    else:
+        validated_value, is_valid = handle_missing_or_ambiguous(field_name, value)
+        error = f"ambiguous data '{value}'"
+    result = {"field_name": field_name, "field_type": field_type, "value": validated_value}
+    if not is_valid:
+        result["error"] = error
+    return result
+
+
+def flatten_fields(data):
+    """Yield (path, name, value) for top-level fields and Metadata sub-fields."""
+    for field, value in data.items():
+        if field == "Metadata" and isinstance(value, dict):
+            for sub_field, sub_value in value.items():
+                yield f"Metadata.{sub_field}", sub_field, sub_value
+        else:
+            yield field, field, value
+
+
+def validated_record(validation_results):
+    """Rebuild the record from the validated (normalized) value of each field."""
+    record = {}
+    for result in validation_results:
+        path = result["field_name"]
+        if path.startswith("Metadata."):
+            record.setdefault("Metadata", {})[path[len("Metadata."):]] = result["value"]
+        else:
+            record[path] = result["value"]
+    return record
+
+
+def classify_with_tools(fields, client=None, model=MODEL):
+    """Ask for all field types in one request answered with parallel tool calls.
+
+    Returns {path: field_type} for every tool call the model made.
+    """
+    client = client or get_client()
+    tool_call = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": TOOL_PROMPT},
+            {"role": "user", "content": json.dumps(
+                [{"field_name": path, "field_value": value} for path, _, value in fields]
+            )},
+        ],
+        tools=tools,
+        tool_choice="required",
+        parallel_tool_calls=True,
+    )
+    field_types = {}
+    for call in tool_call.choices[0].message.tool_calls or []:
+        if call.function.name != "validate_field":
+            continue
+        try:
+            arguments = json.loads(call.function.arguments)
+        except json.JSONDecodeError:
+            continue
+        field_types[arguments.get("field_name")] = arguments.get("field_type")
+    return field_types
+
+
+def validate_with_tools(data, mode="batched", client=None, model=MODEL):
+    """Validate every extracted field with the local validate_field tool.
+
+    Fields in FIELD_TYPES are decided locally. In "batched" mode the rest are
+    classified by a single LLM request whose parallel tool calls are then
+    executed locally; in "local" mode they are classified by name instead.
+    Returns (validation_results, validation_log, llm_calls).
+    """
+    fields = list(flatten_fields(data))
+    field_types = {path: FIELD_TYPES[name] for path, name, _ in fields if name in FIELD_TYPES}
+    undecided = [field for field in fields if field[0] not in field_types]
+
+    llm_calls = 0
+    if undecided and mode == "batched":
+        undecided_paths = {path for path, _, _ in undecided}
+        valid_types = set(tools[0]["function"]["parameters"]["properties"]["field_type"]["enum"])
+        for path, field_type in classify_with_tools(undecided, client=client, model=model).items():
+            if path in undecided_paths and field_type in valid_types:
+                field_types[path] = field_type
+        llm_calls += 1
+
+    validation_results = []
+    validation_log = []
+    for path, name, value in fields:
+        field_type = field_types.get(path) or guess_field_type(name)
+        result = validate_field(path, value, field_type)
+        validation_results.append(result)
+        if "error" in result:
+            validation_log.append(f"{path}: {result['error']}")
+    return validation_results, validation_log, llm_calls
+
+
+def main(source="./sample_contract.pdf", mode="batched"):
+    result = convert_document(source)
+
+    answer = extract_fields(result, PROMPT)
+    print_pretty_markdown(answer)
+
+    data = parse_extraction(answer)
+    print(json.dumps(data, indent=4))
+
+    # Initial validation using tool calling
+    validation_results, validation_log, llm_calls = validate_with_tools(data, mode=mode)
+    print(f"Validated {len(validation_results)} fields with {llm_calls} LLM call(s)")
+    for log in validation_log:
+        print(log)
+
+    validated_data = validated_record(validation_results)
+    invalid_fields = [result["field_name"] for result in validation_results if "error" in result]
+    if not invalid_fields:
+        print("All fields valid, skipping correction.")
+    else:
+        # Prepare validation result for LLM: only the failing fields
+        validation_input = {
+            "extracted_data": failing_subset(data, invalid_fields),
+            "validation_log": validation_log
+        }
+
+        corrected = chat(VALID_PROMPT, json.dumps(validation_input),
+                         response_format=CORRECTION_FORMAT)
+        print(corrected)
+
+        # Extract JSON from corrected output
+        try:
+            corrected_data = parse_correction(corrected)
+        except json.JSONDecodeError as e:
+            print("Failed to parse JSON:", e)
+            corrected_data = None
+        if corrected_data is None:
+            print("No JSON found in the response.")
+        else:
+            validated_data = merge_corrections(validated_data, corrected_data, invalid_fields)
+            print("Extracted JSON:")
+            print(json.dumps(validated_data, indent=4))
+
+    response = submit_contract(build_payload(validated_data))
+
+    if response.status_code == 200:
+        print("Contract successfully created.")
+    else:
+        print(f"Failed to create contract: {response.status_code}")
+        print("Response:", response.text)
+
 
-if response.status_code == 200:
-    print("Contract successfully created.")
-else:
-    print(f"Failed to create contract: {response.status_code}")
-    print("Response:", response.text)
+if __name__ == "__main__":
+    # python main_withTool.py [source] [--local]
+    args = [arg for arg in sys.argv[1:] if arg != "--local"]
+    main(*args[:1], mode="local" if "--local" in sys.argv else "batched")
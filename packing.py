@@ -0,0 +1,202 @@
+"""Extract several small contracts in one LLM request.
+
+For 1-3 page order forms the fixed system prompt is a large share of each
+request, and per-request overhead dominates latency. The `Packer` collects
+small documents as they reach the extract stage, up to a token budget, a
+document count or a short wait, and sends them as one completion:
+
+    <<<DOCUMENT doc1>>>
+    ...markdown...
+    <<<END doc1>>>
+
+The answer is a list of {"id", "fields"} records constrained by
+`schema.PACKED_FORMAT`, the same for every pack so it stays in the cached
+prompt prefix, and each document gets its own record back. If the
+request fails or the answer is malformed or misses documents, those
+documents are retried in smaller packs (halves), and a document left on its
+own is extracted with the usual single-document request, so an error only
+reaches the documents that also fail on their own.
+
+    packer = Packer(send, single, prompt=main.PROMPT, budget_tokens=6000)
+    record, pack_size = await packer.extract(markdown)
+    packer.stats()
+"""
+import asyncio
+import contextvars
+import json
+
+import main
+from fastpath import missing_prompt
+from schema import PACKED_FORMAT, select_fields
+from sections import count_tokens
+
+PACKED_INSTRUCTIONS = """
+The input holds several contracts, each between a "<<<DOCUMENT id>>>" line and an "<<<END id>>>" line.
+Extract each contract on its own, using only the text between its markers.
+Answer with one JSON object whose "documents" list holds, for every document, its id and the fields extracted from that contract.
+When a document starts with a "Fields:" line, extract only those fields for it and give null for every other field.
+"""
+
+
+def packed_prompt(prompt):
+    return prompt.rstrip() + "\n" + PACKED_INSTRUCTIONS
+
+
+def render_pack(items):
+    """User content for a pack of (doc id, content, fields) items."""
+    parts = []
+    for doc_id, content, fields in items:
+        header = f"<<<DOCUMENT {doc_id}>>>"
+        if fields is not None:
+            header += "\nFields: " + ", ".join(fields)
+        parts.append(f"{header}\n{content.strip()}\n<<<END {doc_id}>>>")
+    return "\n\n".join(parts)
+
+
+def split_packed(answer, doc_ids):
+    """{doc id: record} for the documents the answer covers; the rest are left out."""
+    try:
+        data = main.parse_json_answer(answer or "")
+    except json.JSONDecodeError:
+        return {}
+    documents = data.get("documents") if isinstance(data, dict) else None
+    if not isinstance(documents, list):
+        return {}
+    records = {}
+    for document in documents:
+        if (isinstance(document, dict) and document.get("id") in doc_ids
+                and isinstance(document.get("fields"), dict)):
+            records.setdefault(document["id"], document["fields"])
+    return records
+
+
+class _Item:
+    def __init__(self, content, fields):
+        self.content = content
+        self.fields = fields
+        self.tokens = count_tokens(content)
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class Packer:
+    """Groups small documents into packed extraction requests.
+
+    `send(system_prompt, user_content, response_format)` returns the answer
+    text of one completion; `single(content, fields)` extracts one document
+    the usual way and returns its record.
+    """
+
+    def __init__(self, send, single, prompt=main.PROMPT, budget_tokens=6000, max_docs=8,
+                 wait=0.2, system_prompt=None, single_prompt=None):
+        """`system_prompt` replaces packed_prompt(prompt); `single_prompt(fields)`
+        is the system prompt `single` sends, to count the tokens packing saves."""
+        self.send = send
+        self.single = single
+        self.prompt = prompt
+        self.system_prompt = system_prompt or packed_prompt(prompt)
+        self.single_prompt = single_prompt or (
+            lambda fields: prompt if fields is None else missing_prompt(fields))
+        self.budget_tokens = budget_tokens
+        # Small enough that at least two documents share a request
+        self.max_doc_tokens = budget_tokens // 2
+        self.max_docs = max_docs
+        self.wait = wait
+        self._pending = []
+        self._timer = None
+        self.counters = {"requests": 0, "documents": 0, "splits": 0, "single": 0, "errors": 0,
+                         "prompt_tokens_packed": 0, "prompt_tokens_unpacked": 0}
+
+    def fits(self, content):
+        return count_tokens(content) <= self.max_doc_tokens
+
+    async def extract(self, content, fields=None):
+        """Extracted record for one document and the size of the request that answered it."""
+        item = _Item(content, list(fields) if fields is not None else None)
+        self.counters["prompt_tokens_unpacked"] += (count_tokens(self.single_prompt(item.fields))
+                                                    + item.tokens)
+        if self._pending and (sum(i.tokens for i in self._pending) + item.tokens
+                              > self.budget_tokens):
+            self._flush()
+        self._pending.append(item)
+        if len(self._pending) >= self.max_docs:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.wait, self._flush)
+        return await item.future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, self._pending = self._pending, []
+        if items:
+            # Run outside the caller's trace span: the request is shared by every document in it
+            asyncio.get_running_loop().create_task(self._run(items),
+                                                   context=contextvars.Context())
+
+    async def _run(self, items):
+        # A caller that was cancelled no longer waits for its record
+        items = [item for item in items if not item.future.done()]
+        if not items:
+            return
+        if len(items) == 1:
+            await self._run_single(items[0])
+            return
+        doc_ids = [f"doc{n}" for n in range(1, len(items) + 1)]
+        packed = list(zip(doc_ids, items))
+        user_content = render_pack([(doc_id, item.content, item.fields) for doc_id, item in packed])
+        self.counters["requests"] += 1
+        self.counters["prompt_tokens_packed"] += (count_tokens(self.system_prompt)
+                                                  + count_tokens(user_content))
+        try:
+            answer = await self.send(self.system_prompt, user_content, PACKED_FORMAT)
+            records = split_packed(answer, doc_ids)
+        except Exception:
+            # Timeout, context overflow, 5xx after retries: split like a malformed answer
+            self.counters["errors"] += 1
+            records = {}
+        failed = []
+        for doc_id, item in packed:
+            if item.future.done():
+                continue
+            if doc_id in records:
+                self.counters["documents"] += 1
+                record = records[doc_id]
+                if item.fields is not None:
+                    record = select_fields(record, item.fields)
+                item.future.set_result((record, len(items)))
+            else:
+                failed.append(item)
+        if not failed:
+            return
+        # Failed, malformed or incomplete answer: retry the missing documents in smaller packs
+        self.counters["splits"] += 1
+        if len(failed) < len(items):
+            await self._run(failed)
+        else:
+            half = len(failed) // 2
+            await asyncio.gather(self._run(failed[:half]), self._run(failed[half:]))
+
+    async def _run_single(self, item):
+        self.counters["single"] += 1
+        self.counters["prompt_tokens_packed"] += (count_tokens(self.single_prompt(item.fields))
+                                                  + item.tokens)
+        try:
+            record = await self.single(item.content, item.fields)
+        except Exception as e:
+            if not item.future.done():
+                item.future.set_exception(e)
+            return
+        if not item.future.done():
+            item.future.set_result((record, 1))
+
+    def stats(self):
+        requests = self.counters["requests"] + self.counters["single"]
+        documents = self.counters["documents"] + self.counters["single"]
+        packed = self.counters["prompt_tokens_packed"]
+        unpacked = self.counters["prompt_tokens_unpacked"]
+        return {
+            **self.counters,
+            "documents_per_request": documents / requests if requests else None,
+            "tokens_saved_pct": 100 * (1 - packed / unpacked) if unpacked else None,
+        }
@@ -0,0 +1,187 @@
+"""Text-layer-first, page-selective PDF conversion.
+
+The default docling pipeline runs layout analysis and OCR on every page.
+Born-digital contracts already have a text layer, and appendices such as
+SOW exhibits or signature pages hold none of the fields. A cheap pypdfium2
+pre-pass (`probe_pages`) reads each page's text layer; `select_pages` then
+keeps the first `max_pages` pages and, with keywords, only pages mentioning
+one of them (the first page and pages without a text layer are always
+kept). `convert_selected` converts the kept pages in contiguous runs,
+sending only pages without a usable text layer through OCR, and reports
+per-page timing.
+
+    selection = PageSelection(max_pages=10, keywords=DEFAULT_KEYWORDS)
+    markdown, pages = convert_selected(source, converters, selection)
+
+    # Per-page probe and timing of selective vs full conversion
+    python page_selection.py contract.pdf --max-pages 10 --keywords default --convert
+"""
+import argparse
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+
+DEFAULT_KEYWORDS = [
+    "contract", "agreement", "order form", "customer", "client", "effective", "term",
+    "fee", "price", "amount", "total", "payment", "billing", "invoice", "currency",
+    "renewal", "expir",
+]
+OCR_MODES = ["auto", "all", "none"]
+
+
+@dataclass
+class PageSelection:
+    max_pages: int = None       # convert at most the first N pages
+    keywords: list = None       # keep only pages mentioning one of these
+    ocr: str = "auto"           # "auto": OCR pages without a text layer; "all"; "none"
+    min_chars: int = 100        # fewer readable characters than this counts as no text layer
+
+    def settings(self):
+        """What changes the produced markdown (part of the markdown cache key)."""
+        return {"pipeline": "selective", **asdict(self)}
+
+
+@dataclass
+class PageInfo:
+    page: int                   # 1-based
+    chars: int = 0
+    has_text: bool = False
+    keyword_hits: list = field(default_factory=list)
+    selected: bool = False
+    ocr: bool = False
+    probe_seconds: float = 0.0
+    convert_seconds: float = 0.0
+
+
+def probe_pages(path, keywords=None, min_chars=100):
+    """Read each page's text layer with pypdfium2 (no layout model, no OCR)."""
+    import pypdfium2
+
+    keywords = [keyword.lower() for keyword in keywords or []]
+    pages = []
+    pdf = pypdfium2.PdfDocument(str(path))
+    try:
+        for i in range(len(pdf)):
+            start = time.perf_counter()
+            page = pdf[i]
+            textpage = page.get_textpage()
+            text = textpage.get_text_bounded()
+            textpage.close()
+            page.close()
+            # Scans sometimes carry a layer of junk glyphs: count only readable characters
+            readable = sum(1 for ch in text if ch.isalnum())
+            lowered = text.lower()
+            pages.append(PageInfo(
+                page=i + 1,
+                chars=readable,
+                has_text=readable >= min_chars,
+                keyword_hits=[keyword for keyword in keywords if keyword in lowered],
+                probe_seconds=time.perf_counter() - start,
+            ))
+    finally:
+        pdf.close()
+    return pages
+
+
+def select_pages(pages, selection):
+    """Mark the pages to convert and the ones that need OCR."""
+    for info in pages:
+        keep = selection.max_pages is None or info.page <= selection.max_pages
+        if keep and selection.keywords:
+            keep = info.page == 1 or not info.has_text or bool(info.keyword_hits)
+        info.selected = keep
+        info.ocr = keep and (selection.ocr == "all"
+                             or (selection.ocr == "auto" and not info.has_text))
+    return pages
+
+
+def page_runs(pages):
+    """Contiguous runs of selected pages with the same OCR setting: [(first, last, ocr)]."""
+    runs = []
+    for info in pages:
+        if not info.selected:
+            continue
+        if runs and runs[-1][1] == info.page - 1 and runs[-1][2] == info.ocr:
+            runs[-1][1] = info.page
+        else:
+            runs.append([info.page, info.page, info.ocr])
+    return [tuple(run) for run in runs]
+
+
+def is_local_pdf(source):
+    return str(source).lower().endswith(".pdf") and os.path.isfile(str(source))
+
+
+def convert_selected(source, converters, selection):
+    """Markdown of the selected pages and the per-page report.
+
+    `converters(ocr)` returns a DocumentConverter with OCR on or off.
+    """
+    pages = select_pages(probe_pages(source, selection.keywords, selection.min_chars), selection)
+    parts = []
+    for first, last, ocr in page_runs(pages):
+        start = time.perf_counter()
+        result = converters(ocr).convert(source, page_range=(first, last))
+        parts.append(result.document.export_to_markdown())
+        # docling converts a run as one unit: spread its time over the run's pages
+        seconds = (time.perf_counter() - start) / (last - first + 1)
+        for info in pages[first - 1:last]:
+            info.convert_seconds = seconds
+    return "\n\n".join(part for part in parts if part.strip()), pages
+
+
+def page_summary(pages):
+    """Totals of a per-page report."""
+    return {
+        "pages": len(pages),
+        "converted": sum(1 for info in pages if info.selected),
+        "ocr": sum(1 for info in pages if info.ocr),
+        "text_layer": sum(1 for info in pages if info.has_text),
+        "probe_seconds": sum(info.probe_seconds for info in pages),
+        "convert_seconds": sum(info.convert_seconds for info in pages),
+    }
+
+
+if __name__ == "__main__":
+    from conversion import make_converter
+
+    parser = argparse.ArgumentParser(description="Probe a PDF's pages and time selective conversion.")
+    parser.add_argument("source")
+    parser.add_argument("--max-pages", type=int, default=None)
+    parser.add_argument("--keywords", default=None,
+                        help='comma-separated keywords, or "default" for DEFAULT_KEYWORDS')
+    parser.add_argument("--ocr", choices=OCR_MODES, default="auto")
+    parser.add_argument("--min-chars", type=int, default=100)
+    parser.add_argument("--convert", action="store_true",
+                        help="also convert, selectively and in full, and compare the times")
+    args = parser.parse_args()
+
+    keywords = None
+    if args.keywords:
+        keywords = DEFAULT_KEYWORDS if args.keywords == "default" else args.keywords.split(",")
+    selection = PageSelection(args.max_pages, keywords, args.ocr, args.min_chars)
+    if args.convert:
+        converters = {}
+
+        def converter(ocr):
+            if ocr not in converters:
+                converters[ocr] = make_converter(do_ocr=ocr)
+            return converters[ocr]
+
+        markdown, pages = convert_selected(args.source, converter, selection)
+        start = time.perf_counter()
+        converter(True).convert(args.source)
+        full_seconds = time.perf_counter() - start
+    else:
+        pages = select_pages(probe_pages(args.source, keywords, args.min_chars), selection)
+    for info in pages:
+        print(f"page {info.page:4d}  {info.chars:6d} chars  "
+              f"{'text' if info.has_text else 'scan'}  "
+              f"{'ocr' if info.ocr else 'convert' if info.selected else 'skip':7s}  "
+              f"probe {info.probe_seconds * 1000:7.1f}ms  convert {info.convert_seconds:7.3f}s")
+    summary = page_summary(pages)
+    if args.convert:
+        summary["full_convert_seconds"] = full_seconds
+        summary["markdown_chars"] = len(markdown)
+    print(json.dumps(summary, indent=4))
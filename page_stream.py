@@ -0,0 +1,169 @@
+"""Memory-bounded conversion of very large PDFs.
+
+For a 500+ page contract the default path holds the whole DoclingDocument,
+its full `export_to_markdown()` string and the prompt built from it at
+once. In streaming mode the conversion worker converts the PDF in page
+ranges (`stream_markdown`, a generator); each range's markdown is fed to a
+`ContextDigest` and dropped before the next range is converted. The
+digest keeps only the sections most relevant to each field, within the
+extraction token budget, and that digest is what the worker sends back.
+The full markdown never exists.
+
+If the worker's RSS exceeds the budget after a range, the following ranges
+are converted at half the size. A worker left above the budget after a
+document is replaced (see ConversionPool).
+
+    options = StreamOptions(min_pages=50, range_pages=10, rss_budget_mb=1500)
+    markdown, stats = convert_streaming(source, converter, options)
+"""
+import gc
+import math
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass
+
+from sections import BM25, FIELD_QUERIES, FIELDS, count_tokens, index_markdown, tokenize
+from tracing import current_rss_kb
+
+
+@dataclass
+class StreamOptions:
+    min_pages: int = 50            # documents with more pages than this are streamed
+    range_pages: int = 10          # pages converted per docling call
+    rss_budget_mb: int = None      # halve the range size (and recycle the worker) above this
+    budget_tokens: int = 6000      # tokens of sections kept for extraction
+
+    def settings(self):
+        """What changes the produced markdown (part of the markdown cache key)."""
+        return {"stream_min_pages": self.min_pages, "stream_range_pages": self.range_pages,
+                "stream_budget_tokens": self.budget_tokens}
+
+
+def page_count(path):
+    import pypdfium2
+
+    pdf = pypdfium2.PdfDocument(str(path))
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def stream_markdown(source, converter, total_pages, range_pages=10, rss_budget_kb=None):
+    """Yield (first page, last page, markdown) for consecutive page ranges."""
+    first = 1
+    size = range_pages
+    while first <= total_pages:
+        last = min(total_pages, first + size - 1)
+        result = converter.convert(source, page_range=(first, last))
+        markdown = result.document.export_to_markdown()
+        # Drop this range's document before converting the next one
+        del result
+        gc.collect()
+        yield first, last, markdown
+        if rss_budget_kb and size > 1 and current_rss_kb() > rss_budget_kb:
+            size = max(1, size // 2)
+        first = last + 1
+
+
+class RunningBM25(BM25):
+    """BM25 whose statistics accumulate over a stream of sections."""
+
+    def __init__(self, k1=1.5, b=0.75):
+        super().__init__([], k1, b)
+        self.df = Counter()
+        self.n = 0
+        self.total_length = 0
+
+    def add(self, sections):
+        for section in sections:
+            self.n += 1
+            self.total_length += len(section.tokens)
+            self.df.update(set(section.tokens))
+        self.avg_length = self.total_length / self.n if self.n else 0
+
+    def term_idf(self, term):
+        count = self.df.get(term, 0)
+        return math.log(1 + (self.n - count + 0.5) / (count + 0.5))
+
+
+class ContextDigest:
+    """The sections most relevant to each field, over markdown fed in pieces.
+
+    Each field keeps a bounded pool of candidates (`pool` times `per_field`),
+    rescored with the final statistics when the digest is rendered.
+    """
+
+    def __init__(self, budget_tokens=6000, fields=FIELDS, per_field=2, pool=3):
+        self.budget_tokens = budget_tokens
+        self.per_field = per_field
+        self.keep = per_field * pool
+        self.ranker = RunningBM25()
+        self.queries = {name: tokenize(FIELD_QUERIES.get(name, name)) for name in fields}
+        self.candidates = {name: [] for name in fields}   # name -> [(section, freq)]
+        self.first = None
+        self.sections_seen = 0
+        self.tokens_seen = 0
+
+    def _score(self, candidate, terms):
+        section, freq = candidate
+        return self.ranker.score(freq, len(section.tokens), terms)
+
+    def add(self, markdown):
+        sections = index_markdown(markdown)
+        for section in sections:
+            section.order = self.sections_seen
+            self.sections_seen += 1
+        self.tokens_seen += count_tokens(markdown)
+        self.ranker.add(sections)
+        if self.first is None and sections:
+            self.first = sections[0]
+        new = [(section, Counter(section.tokens)) for section in sections]
+        for name, terms in self.queries.items():
+            ranked = sorted(self.candidates[name] + new, key=lambda c: -self._score(c, terms))
+            self.candidates[name] = [c for c in ranked[:self.keep] if self._score(c, terms) > 0]
+
+    def markdown(self):
+        """The kept sections in document order, best-ranked first when trimming to budget."""
+        ranked = {name: sorted(candidates, key=lambda c: -self._score(c, self.queries[name]))
+                  for name, candidates in self.candidates.items()}
+        chosen = {}
+        size = 0
+        if self.first is not None:
+            chosen[self.first.order] = self.first
+            size += count_tokens(self.first.render())
+        # Every field's best section before any field's second best
+        for rank in range(self.per_field):
+            for candidates in ranked.values():
+                if rank >= len(candidates):
+                    continue
+                section = candidates[rank][0]
+                tokens = count_tokens(section.render())
+                if section.order in chosen or size + tokens > self.budget_tokens:
+                    continue
+                chosen[section.order] = section
+                size += tokens
+        return "\n\n".join(chosen[order].render() for order in sorted(chosen))
+
+
+def convert_streaming(source, converter, options, total_pages=None):
+    """(digest markdown, stats) for a PDF converted range by range."""
+    total_pages = total_pages or page_count(source)
+    rss_budget_kb = options.rss_budget_mb * 1024 if options.rss_budget_mb else None
+    digest = ContextDigest(options.budget_tokens)
+    ranges = []
+    for first, last, markdown in stream_markdown(source, converter, total_pages,
+                                                 options.range_pages, rss_budget_kb):
+        start = time.perf_counter()
+        digest.add(markdown)
+        ranges.append({"first": first, "last": last, "rss_kb": current_rss_kb(),
+                       "digest_seconds": time.perf_counter() - start})
+    markdown = digest.markdown()
+    return markdown, {
+        "pages": total_pages,
+        "ranges": ranges,
+        "sections_seen": digest.sections_seen,
+        "tokens_seen": digest.tokens_seen,
+        "tokens_kept": count_tokens(markdown),
+        "options": asdict(options),
+    }
@@ -0,0 +1,130 @@
+"""Byte-stable prompt prefixes for provider-side prompt caching.
+
+Azure OpenAI caches the longest prefix of a request it has recently seen
+(from 1024 tokens on, in 128-token steps). The response_format schema comes
+first, then the messages. A request only reuses the cache if its schema and
+system message are byte-identical to an earlier request's, with everything
+that varies placed after them.
+
+In this layout every extraction request has the same system message: the
+prompt, the JSON schema, the notes for field-restricted and packed
+requests, and few-shot examples, all rendered deterministically. Every
+single-document request also uses the full EXTRACTION_FORMAT, and every
+packed request the same PACKED_FORMAT whatever the pack. What varies goes
+into the user message: a "Fields:" line when only some fields are wanted,
+then the document content last. A field-restricted answer carries null for
+the other fields, and `schema.select_fields` drops them. Corrections get the same
+treatment with VALID_PROMPT.
+
+    messages = extraction_messages(main.PROMPT, markdown, fields=["Contract Amount"])
+    chat(extraction_prefix(main.PROMPT), fields_content(markdown, fields),
+         response_format=EXTRACTION_FORMAT)
+"""
+import json
+from functools import lru_cache
+
+import main
+from packing import PACKED_INSTRUCTIONS
+from schema import CONTRACT_SCHEMA, CORRECTION_SCHEMA, FIELD_PATHS, unflatten
+
+FIELDS_INSTRUCTIONS = """
+When the input starts with a "Fields:" line, extract only the fields it lists and give null for every other field.
+"""
+
+# (contract excerpt, answer) pairs shown after the instructions; never edit them in place,
+# every change invalidates the cached prefix of every request
+EXAMPLES = [
+    (
+        "# Order Form OF-2291\n\n"
+        "Customer: Northwind Traders (Customer No. NW-118)\n\n"
+        "| Item | Term | Fee |\n| --- | --- | --- |\n"
+        "| Analytics Platform | 12 months | $48,000.00 |\n\n"
+        "Subscription Start: January 1, 2024. Subscription End: December 31, 2024.\n"
+        "Invoices are issued quarterly and payable within 30 days (Net 30).\n",
+        {
+            "Contract ID": "OF-2291", "Contract Name": "Order Form", "Status": "Active",
+            "Currency": "USD", "Customer ID": "NW-118", "Customer Name": "Northwind Traders",
+            "Contract Start Date": "2024-01-01", "Contract End Date": "2024-12-31",
+            "Payment Terms": "Net 30", "Contract Amount": "48000.00",
+            "Metadata": {"Billing Frequency": "Quarterly", "Contract Type": "Subscription"},
+        },
+    ),
+    (
+        "## Professional Services Agreement\n\n"
+        "This agreement between Fabrikam GmbH and the Provider takes effect on 1 March 2023.\n"
+        "Fees: EUR 15.000,00 for the implementation project, invoiced on completion.\n",
+        {
+            "Contract ID": None, "Contract Name": "Professional Services Agreement",
+            "Status": None, "Currency": "EUR", "Customer ID": None,
+            "Customer Name": "Fabrikam GmbH", "Contract Start Date": "2023-03-01",
+            "Contract End Date": None, "Payment Terms": None, "Contract Amount": "15000.00",
+            "Metadata": {"Billing Frequency": "One-Time", "Contract Type": "Services"},
+        },
+    ),
+    (
+        "### Renewal Notice - Contract MSA-7740\n\n"
+        "- Customer Name: Contoso Ltd\n- Customer ID: CT-5521\n- Status: Renewed\n"
+        "- Renewal Term: 01/04/2025 to 31/03/2026\n- Annual Fee: GBP 9,600 billed monthly\n"
+        "- Payment: due on receipt of invoice\n",
+        {
+            "Contract ID": "MSA-7740", "Contract Name": "Renewal Notice", "Status": "Active",
+            "Currency": "GBP", "Customer ID": "CT-5521", "Customer Name": "Contoso Ltd",
+            "Contract Start Date": "2025-04-01", "Contract End Date": "2026-03-31",
+            "Payment Terms": "Due on receipt", "Contract Amount": "9600.00",
+            "Metadata": {"Billing Frequency": "Monthly", "Contract Type": "Subscription"},
+        },
+    ),
+]
+
+CORRECTION_EXAMPLE = (
+    {"Contract End Date": "31st Dec 2025 (end of initial term)", "Contract Amount": "USD 12,500"},
+    ["Invalid date in field 'Contract End Date': '31st Dec 2025 (end of initial term)'",
+     "Invalid monetary value in field 'Contract Amount': 'USD 12,500'"],
+    # The schema wants every field: the ones not being corrected are null
+    {"Corrected Data": unflatten({**dict.fromkeys(FIELD_PATHS), "Contract End Date": "2025-12-31",
+                                  "Contract Amount": "12500.00"}),
+     "Correction Log": ["Contract End Date: reformatted to YYYY-MM-DD",
+                        "Contract Amount: removed currency code and thousands separator"]},
+)
+
+
+def _json(value):
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+@lru_cache(maxsize=None)
+def extraction_prefix(prompt=main.PROMPT):
+    """The system message shared by every extraction request made with `prompt`."""
+    parts = [
+        prompt.strip(),
+        "The answer is a JSON object matching this JSON schema:\n" + _json(CONTRACT_SCHEMA),
+        FIELDS_INSTRUCTIONS.strip(),
+        PACKED_INSTRUCTIONS.strip(),
+    ]
+    for n, (excerpt, answer) in enumerate(EXAMPLES, 1):
+        parts.append(f"Example {n} input:\n{excerpt.strip()}\n\nExample {n} answer:\n{_json(answer)}")
+    return "\n\n".join(parts) + "\n"
+
+
+@lru_cache(maxsize=None)
+def correction_prefix(prompt=main.VALID_PROMPT):
+    """The system message shared by every correction request."""
+    extracted, validation_log, answer = CORRECTION_EXAMPLE
+    example_input = main.correction_input(extracted, validation_log).strip()
+    return "\n\n".join([
+        prompt.strip(),
+        "The answer is a JSON object matching this JSON schema:\n" + _json(CORRECTION_SCHEMA),
+        f"Example input:\n{example_input}\n\nExample answer:\n{_json(answer)}",
+    ]) + "\n"
+
+
+def fields_content(content, fields=None):
+    """User message: the "Fields:" line (if any) first, the document last."""
+    if fields is None:
+        return content
+    return "Fields: " + ", ".join(fields) + "\n\n" + content
+
+
+def extraction_messages(prompt, content, fields=None):
+    return main.build_messages(extraction_prefix(prompt), fields_content(content, fields))
+
@@ -0,0 +1,161 @@
+"""Incremental re-extraction of amended contracts.
+
+An amendment usually arrives as a new PDF that is mostly identical to a
+revision already processed. `RevisionStore` keeps, per Contract ID, the
+docling markdown and final record of the latest revision (and the Zenskar
+contract it was submitted as). For a new revision, `plan_revision` diffs
+the two documents section by section and keeps every previous value whose
+source section is unchanged; only fields whose sections changed, or that
+cannot be traced to a section, are re-extracted, from the changed sections
+only. `change_set` gives the field-level differences that are sent to
+Zenskar as an update instead of a new contract.
+
+    store = RevisionStore()
+    previous = store.latest("MSA-2024-0193")
+    plan = plan_revision(previous["markdown"], previous["final"], markdown)
+    extracted = plan.merge(llm_answer_for(plan.fields, plan.context))
+    store.record("MSA-2024-0193", document_hash, markdown, final, zenskar_id)
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+
+from layout_index import labelled_values, locate
+from main import has_value
+from schema import FIELD_PATHS, flatten, unflatten
+from sections import index_markdown
+
+DEFAULT_REVISIONS = "./.cache/revisions.sqlite3"
+
+
+def change_set(previous, current):
+    """{path: {"old": ..., "new": ...}} for every field that differs."""
+    old, new = flatten(previous), flatten(current)
+    return {path: {"old": old[path], "new": new[path]}
+            for path in FIELD_PATHS if old[path] != new[path]}
+
+
+@dataclass
+class RevisionPlan:
+    previous: dict = field(default_factory=dict)  # path -> value in the previous revision
+    reuse: dict = field(default_factory=dict)    # path -> previous value, source unchanged
+    fields: list = field(default_factory=list)   # paths to re-extract
+    keep: set = field(default_factory=set)       # old value stands if none is found
+    context: str = ""                            # what the re-extraction reads
+    sections_total: int = 0
+    sections_changed: int = 0
+    sections_removed: int = 0
+
+    def merge(self, extracted):
+        """Full PROMPT-shaped record: reused values plus the re-extracted ones."""
+        values = dict(self.reuse)
+        new = flatten(extracted)
+        for path in self.fields:
+            if has_value(new[path]) or path not in self.keep:
+                values[path] = new[path]
+            else:
+                values[path] = self.previous[path]
+        return unflatten(values)
+
+
+def plan_revision(previous_markdown, previous_final, markdown):
+    """Which previous values still hold for `markdown`, and what to re-extract."""
+    old_sections = index_markdown(previous_markdown)
+    new_sections = index_markdown(markdown)
+    matcher = SequenceMatcher(None, [s.render() for s in old_sections],
+                              [s.render() for s in new_sections], autojunk=False)
+    unchanged = set()
+    changed = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            unchanged.update(range(i1, i2))
+        else:
+            changed.extend(new_sections[j1:j2])
+    removed = len(old_sections) - len(unchanged)
+
+    plan = RevisionPlan(flatten(previous_final), sections_total=len(new_sections),
+                        sections_changed=len(changed), sections_removed=removed)
+    if not changed and not removed:
+        plan.reuse = dict(plan.previous)
+        return plan
+
+    sources = locate(old_sections, previous_final)
+    # A label that now also appears in a changed section may carry an amended value
+    changed_labels = {label for section in changed
+                      for label, _ in labelled_values(section) if label != "heading"}
+    for path, value in plan.previous.items():
+        if path in sources:
+            i, label = sources[path]
+            if i in unchanged and label not in changed_labels:
+                plan.reuse[path] = value
+                continue
+        else:
+            # Not traceable to a section: look for it in what changed, else keep it
+            plan.keep.add(path)
+        plan.fields.append(path)
+    # Sections only removed: nothing new to read but the whole revision
+    plan.context = ("\n\n".join(section.render() for section in changed) if changed
+                    else markdown)
+    return plan
+
+
+class RevisionStore:
+    def __init__(self, path=DEFAULT_REVISIONS):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS revisions ("
+            " contract_id TEXT NOT NULL, revision INTEGER NOT NULL,"
+            " document_hash TEXT NOT NULL, markdown TEXT NOT NULL, final TEXT NOT NULL,"
+            " zenskar_id TEXT, created REAL NOT NULL,"
+            " PRIMARY KEY (contract_id, revision))"
+        )
+        self._db.commit()
+
+    def latest(self, contract_id):
+        """The latest revision of a contract as a dict, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT revision, document_hash, markdown, final, zenskar_id FROM revisions"
+                " WHERE contract_id = ? ORDER BY revision DESC LIMIT 1",
+                (contract_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        revision, document_hash, markdown, final, zenskar_id = row
+        return {"contract_id": contract_id, "revision": revision, "document_hash": document_hash,
+                "markdown": markdown, "final": json.loads(final), "zenskar_id": zenskar_id}
+
+    def record(self, contract_id, document_hash, markdown, final, zenskar_id=None):
+        """Store a new revision (or refresh the latest if it is the same document).
+
+        Returns the revision number.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT revision, document_hash, zenskar_id FROM revisions"
+                " WHERE contract_id = ? ORDER BY revision DESC LIMIT 1",
+                (contract_id,),
+            ).fetchone()
+            revision = 1
+            if row is not None:
+                revision = row[0] if row[1] == document_hash else row[0] + 1
+                zenskar_id = zenskar_id or row[2]
+            self._db.execute(
+                "INSERT OR REPLACE INTO revisions"
+                " (contract_id, revision, document_hash, markdown, final, zenskar_id, created)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (contract_id, revision, document_hash, markdown, json.dumps(final), zenskar_id,
+                 time.time()),
+            )
+            self._db.commit()
+        return revision
+
+    def close(self):
+        self._db.close()
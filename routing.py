@@ -0,0 +1,85 @@
+"""Adaptive model routing: fast deployment first, strong deployment on failure.
+
+Every extraction goes to the fast deployment (`AZURE_DEPLOYMENT_NAME`,
+main.MODEL). Its answer is scored with the local validators: the number of
+`validation_log` entries and the share of schema fields that came back with
+a value. A document within the policy's limits is done. Otherwise the
+failing fields (or, with scope "document", the whole document) are asked
+again of the strong deployment (`AZURE_STRONG_DEPLOYMENT_NAME`,
+main.STRONG_MODEL). Its values replace the fast ones wherever it found
+one. Fields still invalid afterwards go to the usual correction pass.
+
+    policy = RoutingPolicy(max_log_entries=0, min_completeness=0.8)
+    escalation = assess(extracted, validation_log, invalid_fields, policy)
+    if escalation.fields:
+        extracted = merge_escalated(extracted, strong_answer, escalation.fields)
+"""
+from dataclasses import asdict, dataclass, field
+
+import main
+from schema import FIELD_PATHS, flatten
+
+SCOPES = ["fields", "document"]
+
+
+@dataclass
+class RoutingPolicy:
+    fast: str = main.MODEL
+    strong: str = main.STRONG_MODEL
+    max_log_entries: int = 0        # more validation_log entries than this escalates
+    min_completeness: float = 0.8   # share of fields with a value below which missing ones escalate
+    scope: str = "fields"           # "fields": only failing fields; "document": every field
+    correct_with: str = "strong"    # deployment for the correction pass: "fast" or "strong"
+
+    def settings(self):
+        return asdict(self)
+
+
+@dataclass
+class Escalation:
+    fields: list = field(default_factory=list)   # paths to ask the strong deployment for
+    log_entries: int = 0
+    completeness: float = 1.0
+    reasons: list = field(default_factory=list)
+
+
+def completeness(extracted):
+    """Share of the schema's fields (metadata sub fields included) that have a value."""
+    values = flatten(extracted)
+    return sum(1 for path in FIELD_PATHS if main.has_value(values[path])) / len(FIELD_PATHS)
+
+
+def assess(extracted, validation_log, invalid_fields, policy):
+    """Whether the fast answer stands, and which fields to escalate if not."""
+    escalation = Escalation(log_entries=len(validation_log),
+                            completeness=completeness(extracted))
+    paths = []
+    if escalation.log_entries > policy.max_log_entries:
+        escalation.reasons.append("validation")
+        paths.extend(invalid_fields)
+    if escalation.completeness < policy.min_completeness:
+        escalation.reasons.append("completeness")
+        values = flatten(extracted)
+        paths.extend(path for path in FIELD_PATHS if not main.has_value(values[path]))
+    if not escalation.reasons:
+        return escalation
+    if policy.scope == "document":
+        escalation.fields = list(FIELD_PATHS)
+    else:
+        escalation.fields = [path for path in FIELD_PATHS if path in set(paths)]
+    return escalation
+
+
+def merge_escalated(extracted, strong, fields):
+    """The fast record with the strong deployment's values for `fields` where it has one."""
+    merged = dict(extracted)
+    strong_values = flatten(strong)
+    for path in fields:
+        if not main.has_value(strong_values[path]):
+            continue
+        if path.startswith("Metadata."):
+            merged["Metadata"] = {**(merged.get("Metadata") or {}),
+                                  path.split(".", 1)[1]: strong_values[path]}
+        else:
+            merged[path] = strong_values[path]
+    return merged
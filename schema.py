@@ -0,0 +1,263 @@
+"""Typed contract schema, strict JSON-schema response formats and an incremental JSON parser.
+
+The records use the same keys as PROMPT ("Contract ID", "Metadata", ...)
+so the validators and payload mapping work on them unchanged.
+
+    chat(PROMPT, markdown, response_format=EXTRACTION_FORMAT)
+    parser = IncrementalJSONParser()
+    for chunk in stream:
+        for name, value in parser.feed(chunk):
+            ...
+"""
+import json
+from dataclasses import dataclass, field, fields
+from typing import Optional
+
+
+def _key(name):
+    return field(default=None, metadata={"key": name})
+
+
+@dataclass(slots=True)
+class Metadata:
+    billing_frequency: Optional[str] = _key("Billing Frequency")
+    contract_type: Optional[str] = _key("Contract Type")
+
+
+@dataclass(slots=True)
+class ContractRecord:
+    contract_id: Optional[str] = _key("Contract ID")
+    contract_name: Optional[str] = _key("Contract Name")
+    status: Optional[str] = _key("Status")
+    currency: Optional[str] = _key("Currency")
+    customer_id: Optional[str] = _key("Customer ID")
+    customer_name: Optional[str] = _key("Customer Name")
+    contract_start_date: Optional[str] = _key("Contract Start Date")
+    contract_end_date: Optional[str] = _key("Contract End Date")
+    payment_terms: Optional[str] = _key("Payment Terms")
+    contract_amount: Optional[str] = _key("Contract Amount")
+    metadata: Optional[Metadata] = _key("Metadata")
+
+    @classmethod
+    def from_dict(cls, data):
+        values = {}
+        for f in fields(cls):
+            value = data.get(f.metadata["key"])
+            if f.name == "metadata" and isinstance(value, dict):
+                value = Metadata(**{m.name: value.get(m.metadata["key"]) for m in fields(Metadata)})
+            values[f.name] = value
+        return cls(**values)
+
+    def to_dict(self):
+        data = {}
+        for f in fields(self):
+            value = getattr(self, f.name)
+            if isinstance(value, Metadata):
+                value = {m.metadata["key"]: getattr(value, m.name) for m in fields(Metadata)}
+            data[f.metadata["key"]] = value
+        return data
+
+
+def _object_schema(cls, keys=None):
+    properties = {}
+    for f in fields(cls):
+        key = f.metadata["key"]
+        if keys is not None and key not in keys:
+            continue
+        if f.name == "metadata":
+            sub_keys = keys[key] if keys is not None else None
+            properties[key] = _object_schema(Metadata, sub_keys)
+        else:
+            properties[f.metadata["key"]] = {"type": ["string", "null"]}
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+CONTRACT_SCHEMA = _object_schema(ContractRecord)
+
+# Field paths use the validate_record convention: "Metadata.<sub field>"
+FIELD_PATHS = [f.metadata["key"] for f in fields(ContractRecord) if f.name != "metadata"] + [
+    f"Metadata.{f.metadata['key']}" for f in fields(Metadata)]
+
+CORRECTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "Corrected Data": CONTRACT_SCHEMA,
+        "Correction Log": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["Corrected Data", "Correction Log"],
+    "additionalProperties": False,
+}
+
+EXTRACTION_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "contract", "strict": True, "schema": CONTRACT_SCHEMA},
+}
+
+CORRECTION_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "contract_correction", "strict": True, "schema": CORRECTION_SCHEMA},
+}
+
+# One record per document of a pack. The same for every pack, whatever its size or fields,
+# so that it stays part of the cached prompt prefix
+PACKED_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "documents": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"id": {"type": "string"}, "fields": CONTRACT_SCHEMA},
+                "required": ["id", "fields"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["documents"],
+    "additionalProperties": False,
+}
+
+PACKED_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "contracts", "strict": True, "schema": PACKED_SCHEMA},
+}
+
+
+def partial_format(paths):
+    """EXTRACTION_FORMAT restricted to some fields ("Metadata.<sub field>" for metadata)."""
+    keys = {}
+    for path in paths:
+        if path.startswith("Metadata."):
+            keys.setdefault("Metadata", set()).add(path.split(".", 1)[1])
+        else:
+            keys.setdefault(path, None)
+    schema = _object_schema(ContractRecord, keys)
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": "contract_fields", "strict": True, "schema": schema},
+    }
+
+
+def select_fields(record, fields):
+    """Only the given fields ("Metadata.<sub field>" paths) of a full record."""
+    selected = {}
+    for path in fields:
+        if path.startswith("Metadata."):
+            sub_field = path.split(".", 1)[1]
+            selected.setdefault("Metadata", {})[sub_field] = (record.get("Metadata") or {}).get(
+                sub_field)
+        else:
+            selected[path] = record.get(path)
+    return selected
+
+
+def flatten(record, paths=FIELD_PATHS):
+    """{path: value} of a record, "Metadata.<sub field>" for metadata.
+
+    Every path in `paths` is given, None where the record lacks it. With
+    `paths=None` the record's own keys are kept instead: absent fields stay
+    absent, and a null or empty Metadata stays "Metadata".
+    """
+    if paths is not None:
+        metadata = record.get("Metadata") or {}
+        return {path: metadata.get(path.split(".", 1)[1]) if path.startswith("Metadata.")
+                else record.get(path) for path in paths}
+    flat = {}
+    for key, value in record.items():
+        if key == "Metadata" and isinstance(value, dict) and value:
+            for sub_field, sub_value in value.items():
+                flat[f"Metadata.{sub_field}"] = sub_value
+        else:
+            flat[key] = value
+    return flat
+
+
+def unflatten(values):
+    """The record of {path: value} pairs, as flatten() gives them."""
+    record = {}
+    for path, value in values.items():
+        if path.startswith("Metadata."):
+            record.setdefault("Metadata", {})[path.split(".", 1)[1]] = value
+        else:
+            record[path] = value
+    return record
+
+
+class IncrementalJSONParser:
+    """Parse a JSON object as it streams in, one top-level member at a time.
+
+    `feed()` returns the (key, value) pairs whose values closed in that
+    chunk. Text before the opening brace (prose, code fences) is skipped.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.done = False
+        self._started = False
+        self._stack = []
+        self._member = []
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk):
+        emitted = []
+        for ch in chunk:
+            if self.done:
+                break
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._stack.append("}")
+                continue
+            if self._in_string:
+                self._member.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._stack.append("}" if ch == "{" else "]")
+            elif ch in "}]":
+                self._stack.pop()
+                if not self._stack:
+                    emitted += self._emit()
+                    self.done = True
+                    continue
+            elif ch == "," and len(self._stack) == 1:
+                emitted += self._emit()
+                continue
+            self._member.append(ch)
+        return emitted
+
+    def _emit(self):
+        text = "".join(self._member).strip()
+        self._member = []
+        if not text:
+            return []
+        try:
+            pair = json.loads("{" + text + "}")
+        except json.JSONDecodeError:
+            return []
+        self.fields.update(pair)
+        return list(pair.items())
+
+    def salvage(self):
+        """Every member that closed, even if the object itself never did."""
+        return dict(self.fields)
+
+
+def salvage_json(text):
+    """Best-effort parse of a truncated or malformed JSON answer."""
+    parser = IncrementalJSONParser()
+    parser.feed(text)
+    return parser.salvage()
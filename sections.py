@@ -0,0 +1,218 @@
+"""Section index and relevance-filtered prompt context for long contracts.
+
+The document is split into sections (heading text, tables and key-value
+regions) and each requested field is matched against them with a small
+BM25 ranker. Only the best sections for each field are sent to the LLM.
+Documents that still exceed the token budget are split into chunks for
+map-reduce extraction.
+
+    plan = plan_context(markdown, budget_tokens=6000)
+    for chunk in plan.chunks:
+        answer = chat(PROMPT, chunk)
+"""
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+
+from main import has_value
+
+# Words likely to sit near each PROMPT field
+FIELD_QUERIES = {
+    "Contract ID": "contract agreement order form number id no reference",
+    "Contract Name": "contract agreement order form title name",
+    "Status": "status effective active executed signed draft expired",
+    "Currency": "currency usd eur gbp price fees total amount $",
+    "Customer ID": "customer client account id number",
+    "Customer Name": "customer client company name party bill",
+    "Contract Start Date": "start effective commence date term go live signing",
+    "Contract End Date": "end expiration expire terminate term renewal date",
+    "Payment Terms": "payment terms net days invoice due",
+    "Contract Amount": "total amount fees price value payment $",
+    "Billing Frequency": "billing monthly quarterly annually annual invoice schedule frequency",
+    "Contract Type": "subscription services professional order form agreement type license",
+}
+
+FIELDS = list(FIELD_QUERIES)
+
+_WORD = re.compile(r"[a-z0-9$]+")
+_HEADING = re.compile(r"^(#{1,6})\s+(.*)$")
+_KEY_VALUE = re.compile(r"^\s*[-*]?\s*\**[A-Za-z][\w /&().'-]{0,40}\**\s*:\s*\S")
+
+
+def tokenize(text):
+    return _WORD.findall(text.lower())
+
+
+def count_tokens(text):
+    """Same ~4 chars per token estimate the LLM scheduler uses."""
+    return len(text) // 4
+
+
+@dataclass
+class Section:
+    order: int
+    heading: str
+    kind: str  # "text", "table" or "key_value"
+    text: str
+    tokens: list = field(default_factory=list, repr=False)
+
+    def render(self):
+        return f"## {self.heading}\n{self.text}" if self.heading else self.text
+
+
+def _finish(sections):
+    for section in sections:
+        section.text = section.text.strip()
+        section.tokens = tokenize(section.heading) * 2 + tokenize(section.text)
+    return [section for section in sections if section.text or section.heading]
+
+
+def index_markdown(markdown):
+    """Split docling markdown into heading, table and key-value sections."""
+    sections = []
+    heading = ""
+    current = None
+
+    def start(kind):
+        nonlocal current
+        current = Section(len(sections), heading, kind, "")
+        sections.append(current)
+
+    for line in markdown.splitlines():
+        match = _HEADING.match(line)
+        if match:
+            heading = match.group(2).strip()
+            start("text")
+            continue
+        if line.lstrip().startswith("|"):
+            kind = "table"
+        elif _KEY_VALUE.match(line):
+            kind = "key_value"
+        elif not line.strip() and current is not None:
+            current.text += "\n"
+            continue
+        else:
+            kind = "text"
+        if current is None or current.kind != kind:
+            start(kind)
+        current.text += line + "\n"
+    return _finish(sections)
+
+
+class BM25:
+    def __init__(self, sections, k1=1.5, b=0.75):
+        self.sections = sections
+        self.k1 = k1
+        self.b = b
+        self.freqs = [Counter(section.tokens) for section in sections]
+        lengths = [len(section.tokens) for section in sections]
+        self.avg_length = sum(lengths) / len(lengths) if lengths else 0
+        df = Counter(term for freq in self.freqs for term in freq)
+        n = len(sections)
+        self.idf = {term: math.log(1 + (n - count + 0.5) / (count + 0.5)) for term, count in df.items()}
+
+    def term_idf(self, term):
+        return self.idf[term]
+
+    def score(self, freq, length, terms):
+        """BM25 score of one section (term frequencies and token count) for query terms."""
+        score = 0.0
+        for term in terms:
+            tf = freq.get(term)
+            if not tf:
+                continue
+            norm = self.k1 * (1 - self.b + self.b * length / (self.avg_length or 1))
+            score += self.term_idf(term) * tf * (self.k1 + 1) / (tf + norm)
+        return score
+
+    def scores(self, query):
+        terms = tokenize(query)
+        return [self.score(freq, len(section.tokens), terms)
+                for section, freq in zip(self.sections, self.freqs)]
+
+    def top(self, query, k):
+        ranked = sorted(zip(self.scores(query), self.sections), key=lambda pair: -pair[0])
+        return [section for score, section in ranked[:k] if score > 0]
+
+
+@dataclass
+class ContextPlan:
+    chunks: list
+    mode: str  # "full", "selected" or "map_reduce"
+    sections_total: int
+    sections_sent: int
+    tokens_full: int
+    tokens_sent: int
+
+
+def select_sections(sections, fields=FIELDS, per_field=2):
+    """Best-scoring sections for each field, in document order."""
+    ranker = BM25(sections)
+    chosen = {}
+    for name in fields:
+        for section in ranker.top(FIELD_QUERIES.get(name, name), per_field):
+            chosen[section.order] = section
+    # The opening section usually names the parties and the contract
+    if sections:
+        chosen.setdefault(sections[0].order, sections[0])
+    return [chosen[order] for order in sorted(chosen)]
+
+
+def chunk_sections(sections, budget_tokens):
+    """Greedily pack sections into chunks of at most budget_tokens (long sections are split)."""
+    chunks = []
+    current = []
+    size = 0
+    for section in sections:
+        text = section.render()
+        pieces = [text]
+        if count_tokens(text) > budget_tokens:
+            step = budget_tokens * 4
+            pieces = [text[i:i + step] for i in range(0, len(text), step)]
+        for piece in pieces:
+            tokens = count_tokens(piece)
+            if current and size + tokens > budget_tokens:
+                chunks.append("\n\n".join(current))
+                current, size = [], 0
+            current.append(piece)
+            size += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def plan_context(markdown, budget_tokens=6000, fields=FIELDS, per_field=2):
+    """Decide what to send for one document.
+
+    Documents within budget go in full; larger ones send only the sections
+    ranked relevant to the fields; if those still do not fit they are
+    chunked for map-reduce.
+    """
+    tokens_full = count_tokens(markdown)
+    sections = index_markdown(markdown)
+    if tokens_full <= budget_tokens:
+        return ContextPlan([markdown], "full", len(sections), len(sections), tokens_full, tokens_full)
+    selected = select_sections(sections, fields, per_field) or sections
+    context = "\n\n".join(section.render() for section in selected)
+    if count_tokens(context) <= budget_tokens:
+        chunks, mode = [context], "selected"
+    else:
+        chunks, mode = chunk_sections(selected, budget_tokens), "map_reduce"
+    return ContextPlan(chunks, mode, len(sections), len(selected), tokens_full,
+                       sum(count_tokens(chunk) for chunk in chunks))
+
+
+def reduce_extractions(results):
+    """Merge per-chunk extractions: first present value wins for each field."""
+    merged = {}
+    for result in results:
+        for name, value in result.items():
+            if name == "Metadata" and isinstance(value, dict):
+                metadata = merged.setdefault("Metadata", {})
+                for sub_field, sub_value in value.items():
+                    if sub_field not in metadata or not has_value(metadata[sub_field]):
+                        metadata[sub_field] = sub_value
+            elif name not in merged or not has_value(merged[name]):
+                merged[name] = value
+    return merged
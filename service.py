@@ -0,0 +1,238 @@
+"""Long-running extraction service that keeps models and clients warm.
+
+Running `main.py` per contract pays for interpreter start-up, the openai and
+docling imports and the converter model load every time. The service does
+that once: it holds a batch `Pipeline` (warm conversion workers, one async
+Azure OpenAI client, one pooled Zenskar session) and accepts contracts as
+jobs over HTTP.
+
+    python service.py --port 8000 --convert-workers 2
+
+    # Path or URL the service can read; waits for the result
+    curl -X POST localhost:8000/extract -d '{"source": "./sample_contract.pdf"}'
+    # Upload the PDF and poll for the result
+    curl -X POST 'localhost:8000/extract?wait=0' -H 'Content-Type: application/pdf' \\
+        --data-binary @contract.pdf
+    curl localhost:8000/jobs/<id>
+    curl localhost:8000/stats
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from batch import Pipeline, add_pipeline_arguments, cache_from_args, pipeline_options_from_args
+from tracing import Tracer
+
+
+class ExtractionService:
+    """Runs a Pipeline on a background event loop and tracks submitted jobs."""
+
+    def __init__(self, max_jobs=1000, trace_dir=None, **pipeline_options):
+        self.pipeline_options = pipeline_options
+        self.max_jobs = max_jobs
+        self.trace_dir = Path(trace_dir) if trace_dir else None
+        self.jobs = OrderedDict()
+        self.started = None
+        self._lock = threading.Lock()
+        self._spool = tempfile.mkdtemp(prefix="contracts-")
+        self._loop = asyncio.new_event_loop()
+        self._thread = None
+        self.pipeline = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        # The pipeline's semaphores belong to the loop it is built on
+        self.pipeline = self._call(self._build_pipeline())
+        self.started = time.time()
+        if self.trace_dir is not None:
+            self.trace_dir.mkdir(parents=True, exist_ok=True)
+        return self
+
+    async def _build_pipeline(self):
+        return Pipeline(**self.pipeline_options)
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def spool(self, data):
+        """Write an uploaded PDF where the conversion workers can read it."""
+        path = os.path.join(self._spool, f"{uuid.uuid4().hex}.pdf")
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def submit(self, source, name=None, uploaded=False):
+        """Queue one contract and return its job id."""
+        job_id = uuid.uuid4().hex
+        job = {"id": job_id, "name": name or Path(source).name, "status": "queued",
+               "submitted_at": time.time(), "record": None, "done": threading.Event()}
+        with self._lock:
+            self.jobs[job_id] = job
+            self._evict()
+        asyncio.run_coroutine_threadsafe(self._run(job, source, uploaded), self._loop)
+        return job_id
+
+    def _evict(self):
+        while len(self.jobs) > self.max_jobs:
+            oldest = next((job_id for job_id, job in self.jobs.items()
+                           if job["done"].is_set()), None)
+            if oldest is None:
+                return
+            del self.jobs[oldest]
+
+    async def _run(self, job, source, uploaded):
+        tracer = Tracer(job["id"])
+        record = error = None
+        try:
+            record = await self.pipeline.process(job["id"], source, tracer,
+                                                 on_admit=lambda: job.update(status="running"))
+            if self.trace_dir is not None:
+                tracer.write_jsonl(self.trace_dir / f"{job['id']}.trace.jsonl")
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            if uploaded and os.path.exists(source):
+                os.remove(source)
+            # Waiters are released whatever happened to the job
+            job["record"] = record
+            if error is not None or record is None:
+                job["status"] = "error"
+                job["error"] = error or "job cancelled"
+            else:
+                job["status"] = record["status"]
+            job["done"].set()
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def wait(self, job_id, timeout=None):
+        job = self.get(job_id)
+        if job is not None:
+            job["done"].wait(timeout)
+        return job
+
+    def stats(self):
+        with self._lock:
+            statuses = [job["status"] for job in self.jobs.values()]
+        stats = {
+            "uptime": time.time() - self.started if self.started else None,
+            "jobs": {status: statuses.count(status) for status in sorted(set(statuses))},
+            "llm": self.pipeline.llm.stats(),
+            "submission": self.pipeline.submitter.stats(),
+        }
+        if self.pipeline.cache is not None:
+            stats["cache"] = self.pipeline.cache.stats()
+        return stats
+
+    def close(self):
+        if self.pipeline is not None:
+            self.pipeline.close()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+def job_view(job):
+    return {key: value for key, value in job.items() if key != "done"}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        service = self.server.service
+        path = urlparse(self.path).path.rstrip("/")
+        if path == "/health":
+            self._send(200, {"status": "ok"})
+        elif path == "/stats":
+            self._send(200, service.stats())
+        elif path.startswith("/jobs/"):
+            job = service.get(path.rsplit("/", 1)[1])
+            if job is None:
+                self._send(404, {"error": "unknown job"})
+            else:
+                self._send(200, job_view(job))
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        service = self.server.service
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/extract":
+            self._send(404, {"error": "not found"})
+            return
+        query = parse_qs(url.query)
+        wait = query.get("wait", ["1"])[0] not in {"0", "false", "no"}
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+
+        if self.headers.get("Content-Type", "").startswith("application/pdf"):
+            name = query.get("name", [None])[0]
+            job_id = service.submit(service.spool(body), name=name or "upload.pdf",
+                                    uploaded=True)
+        else:
+            try:
+                source = json.loads(body or b"{}")["source"]
+            except (json.JSONDecodeError, KeyError, TypeError):
+                self._send(400, {"error": 'expected a PDF body or JSON {"source": ...}'})
+                return
+            job_id = service.submit(source)
+
+        if not wait:
+            self._send(202, {"id": job_id, "status": "queued"})
+            return
+        job = service.wait(job_id)
+        self._send(200 if job["status"] == "ok" else 422, job_view(job))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve contract extraction over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    add_pipeline_arguments(parser)
+    parser.add_argument("--trace-dir", default=None, help="write one trace JSONL per job here")
+    parser.add_argument("--verbose", action="store_true", help="log every HTTP request")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    cache = cache_from_args(args)
+    service = ExtractionService(trace_dir=args.trace_dir,
+                                **pipeline_options_from_args(args, cache)).start()
+    server = ThreadingHTTPServer((args.host, args.port), _Handler)
+    server.daemon_threads = True
+    server.service = service
+    server.verbose = args.verbose
+    print(f"Extraction service listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        cache.close()
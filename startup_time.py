@@ -0,0 +1,78 @@
+"""Measure interpreter + import start-up time of the entry points.
+
+Each module is imported in a fresh interpreter with `python -X importtime`
+several times; the report gives the median wall time of the process, the
+cumulative import time of the module itself and the slowest imports under it.
+
+    python startup_time.py                      # main, main_withTool, batch, service
+    python startup_time.py main --runs 10 --top 15
+    python startup_time.py --json after.json --against before.json
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+DEFAULT_MODULES = ["main", "main_withTool", "batch", "service"]
+
+
+def parse_importtime(stderr):
+    """{module: cumulative microseconds} from `-X importtime` output."""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        module = name.strip()
+        times[module] = max(times.get(module, 0), int(cumulative))
+    return times
+
+
+def measure(module, runs=5):
+    walls = []
+    imports = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                capture_output=True, text=True)
+        walls.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            raise RuntimeError(f"importing {module} failed:\n{result.stderr[-2000:]}")
+        imports.append(parse_importtime(result.stderr))
+    # Report the slowest imports from the median run
+    median_run = sorted(imports, key=lambda times: times.get(module, 0))[len(imports) // 2]
+    return {
+        "wall_median": statistics.median(walls),
+        "import_median": statistics.median(times.get(module, 0) for times in imports) / 1e6,
+        "slowest": sorted(((name, us / 1e6) for name, us in median_run.items() if name != module),
+                          key=lambda item: item[1], reverse=True),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure start-up time of the entry points.")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="slowest imports listed per module")
+    parser.add_argument("--json", default=None, help="save the results here")
+    parser.add_argument("--against", default=None, help="earlier --json results to compare with")
+    args = parser.parse_args()
+
+    previous = json.load(open(args.against)) if args.against else {}
+    results = {}
+    for module in args.modules:
+        result = measure(module, args.runs)
+        results[module] = {"wall_median": result["wall_median"],
+                           "import_median": result["import_median"]}
+        line = f"{module}: {result['wall_median']:.3f}s process, {result['import_median']:.3f}s import"
+        if module in previous:
+            line += f" (was {previous[module]['wall_median']:.3f}s / " \
+                    f"{previous[module]['import_median']:.3f}s)"
+        print(line)
+        for name, seconds in result["slowest"][:args.top]:
+            print(f"    {seconds:7.3f}s  {name}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
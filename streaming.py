@@ -0,0 +1,125 @@
+"""Streaming extraction: emit each field as soon as its JSON value closes.
+
+For interactive review of a single upload. The extraction completion is
+requested with stream=True, parsed incrementally, and every field is run
+through the local validators the moment it is complete, so the UI can show
+it before the rest of the answer has arrived.
+
+    async for event in stream_fields(markdown):
+        print(event.name, event.value, event.is_valid, event.elapsed)
+
+    python streaming.py ./sample_contract.pdf
+"""
+import asyncio
+import json
+import sys
+import time
+from dataclasses import dataclass, field
+
+import main
+from llm import AsyncLLM
+from schema import EXTRACTION_FORMAT, IncrementalJSONParser
+
+
+@dataclass
+class FieldEvent:
+    name: str
+    value: object
+    validated: object
+    is_valid: bool
+    validation_log: list
+    elapsed: float  # seconds since the request was sent
+
+
+@dataclass
+class StreamStats:
+    started: float = 0.0
+    first_token: float = None
+    first_field: float = None
+    last_field: float = None
+    total: float = None
+    fields: int = 0
+    usage: dict = field(default_factory=dict)
+
+    def report(self):
+        return {
+            "time_to_first_token": self.first_token,
+            "time_to_first_field": self.first_field,
+            "time_to_last_field": self.last_field,
+            "total_time": self.total,
+            "fields": self.fields,
+            **self.usage,
+        }
+
+
+def validate_one(name, value):
+    """Run the local validators on a single field as it arrives."""
+    validated, validation_log, invalid_fields = main.validate_record({name: value})
+    return validated.get(name), not invalid_fields, validation_log
+
+
+async def stream_fields(markdown, prompt=main.PROMPT, llm=None, model=main.MODEL,
+                        structured=True, stats=None):
+    """Async generator of FieldEvent, one per top-level field in answer order."""
+    llm = llm or AsyncLLM()
+    stats = stats if stats is not None else StreamStats()
+    params = {"response_format": EXTRACTION_FORMAT} if structured else {}
+    stats.started = time.perf_counter()
+    stream = await llm.create(
+        model=model,
+        messages=main.build_messages(prompt, markdown),
+        stream=True,
+        stream_options={"include_usage": True},
+        **params,
+    )
+    parser = IncrementalJSONParser()
+    # Closing the stream frees its in-flight slot if the caller stops early
+    try:
+        async for chunk in stream:
+            if getattr(chunk, "usage", None):
+                stats.usage = {"prompt_tokens": chunk.usage.prompt_tokens,
+                               "completion_tokens": chunk.usage.completion_tokens}
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            now = time.perf_counter() - stats.started
+            if stats.first_token is None:
+                stats.first_token = now
+            for name, value in parser.feed(delta):
+                validated, is_valid, validation_log = validate_one(name, value)
+                if stats.first_field is None:
+                    stats.first_field = now
+                stats.last_field = now
+                stats.fields += 1
+                yield FieldEvent(name, value, validated, is_valid, validation_log, now)
+    finally:
+        await stream.aclose()
+    stats.total = time.perf_counter() - stats.started
+
+
+async def extract_streaming(markdown, on_field=None, **options):
+    """Collect a streamed extraction, calling on_field(event) for each field.
+
+    Returns (extracted_data, stats).
+    """
+    stats = StreamStats()
+    extracted = {}
+    async for event in stream_fields(markdown, stats=stats, **options):
+        extracted[event.name] = event.value
+        if on_field is not None:
+            on_field(event)
+    return extracted, stats
+
+
+def print_event(event):
+    status = "ok" if event.is_valid else "; ".join(event.validation_log)
+    print(f"[{event.elapsed:6.2f}s] {event.name}: {json.dumps(event.value)} ({status})")
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else "./sample_contract.pdf"
+    markdown = main.convert_document(source)
+    extracted, stats = asyncio.run(extract_streaming(markdown, on_field=print_event))
+    print(json.dumps(stats.report(), indent=4))
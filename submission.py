@@ -0,0 +1,195 @@
+"""Pooled, retrying, idempotent Zenskar contract submission.
+
+One requests.Session (keep-alive connection pool) is shared by all posts.
+Each contract carries an Idempotency-Key derived from the source document's
+hash. 429 and 5xx responses are retried with backoff, honouring
+Retry-After. A SQLite ledger records every created contract so a rerun
+skips documents that were already submitted. A revision of a contract
+that already exists in Zenskar is sent as a PATCH of the changed fields.
+
+    submitter = ZenskarSubmitter(max_workers=8)
+    result = submitter.submit(document_hash, payload)
+    result = submitter.update(zenskar_id, document_hash, changed_fields)
+    results = submitter.submit_many([(document_hash, payload), ...])
+
+    # Resubmit the final records of a batch run
+    python submission.py ./results --url http://127.0.0.1:8080/contract_v2
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from main import ZENSKAR_HEADERS, ZENSKAR_URL, build_payload
+
+DEFAULT_LEDGER = "./.cache/zenskar_ledger.sqlite3"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def idempotency_key(document_hash):
+    return hashlib.sha256(f"zenskar-contract:{document_hash}".encode("utf-8")).hexdigest()
+
+
+class SubmissionLedger:
+    def __init__(self, path=DEFAULT_LEDGER):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS submissions ("
+            " document_hash TEXT PRIMARY KEY, idempotency_key TEXT NOT NULL,"
+            " status_code INTEGER NOT NULL, response TEXT, submitted_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def get(self, document_hash):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status_code, response FROM submissions WHERE document_hash = ?",
+                (document_hash,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"status_code": row[0], "body": row[1]}
+
+    def record(self, document_hash, key, status_code, body):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO submissions"
+                " (document_hash, idempotency_key, status_code, response, submitted_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (document_hash, key, status_code, body, time.time()),
+            )
+            self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+class ZenskarSubmitter:
+    def __init__(self, url=ZENSKAR_URL, ledger=None, max_workers=4, max_retries=5,
+                 backoff=0.5, max_backoff=30.0, timeout=30, headers=None):
+        self.url = url
+        self.ledger = ledger
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(headers or ZENSKAR_HEADERS)
+        self.counters = {"created": 0, "updated": 0, "skipped": 0, "failed": 0, "retries": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def _delay(self, attempt, response):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def submit(self, document_hash, payload):
+        """POST one contract unless the ledger already has it.
+
+        Returns {"status": "created" | "skipped" | "failed", "status_code", "body", "retries"}.
+        """
+        return self._send("post", self.url, document_hash, payload, "created")
+
+    def update(self, contract_id, document_hash, changes):
+        """PATCH the changed fields of an existing contract unless the ledger already has it.
+
+        Returns {"status": "updated" | "skipped" | "failed", ...} as submit() does.
+        """
+        url = f"{self.url.rstrip('/')}/{contract_id}"
+        return self._send("patch", url, document_hash, changes, "updated")
+
+    def _send(self, method, url, document_hash, payload, done):
+        if self.ledger is not None:
+            previous = self.ledger.get(document_hash)
+            if previous is not None:
+                self._count("skipped")
+                return {"status": "skipped", "retries": 0, **previous}
+        key = idempotency_key(document_hash)
+        attempt = 0
+        while True:
+            response = None
+            try:
+                response = self.session.request(method, url, json=payload, timeout=self.timeout,
+                                                headers={"Idempotency-Key": key})
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = f"{type(e).__name__}: {e}"
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    break
+                error = f"HTTP {response.status_code}"
+            if attempt >= self.max_retries:
+                self._count("failed")
+                return {"status": "failed", "retries": attempt, "error": error,
+                        "status_code": response.status_code if response is not None else None,
+                        "body": response.text if response is not None else None}
+            time.sleep(self._delay(attempt, response))
+            attempt += 1
+            self._count("retries")
+
+        if response.ok:
+            if self.ledger is not None:
+                self.ledger.record(document_hash, key, response.status_code, response.text)
+            self._count(done)
+            status = done
+        else:
+            self._count("failed")
+            status = "failed"
+        return {"status": status, "status_code": response.status_code, "body": response.text,
+                "retries": attempt}
+
+    def submit_many(self, items):
+        """Submit (document_hash, payload) pairs in parallel; results keep input order."""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(lambda item: self.submit(*item), items))
+
+    def stats(self):
+        return dict(self.counters)
+
+    def close(self):
+        self.session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Submit the final records of a batch run.")
+    parser.add_argument("results", help="batch output directory")
+    parser.add_argument("--url", default=ZENSKAR_URL)
+    parser.add_argument("--ledger", default=DEFAULT_LEDGER)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    items = []
+    for path in sorted(Path(args.results).glob("*.json")):
+        record = json.loads(path.read_text())
+        if path.name == "summary.json" or "final" not in record:
+            continue
+        items.append((record["document_hash"], build_payload(record["final"])))
+    submitter = ZenskarSubmitter(args.url, SubmissionLedger(args.ledger),
+                                 max_workers=args.concurrency)
+    results = submitter.submit_many(items)
+    for (document_hash, _), result in zip(items, results):
+        print(f"[{result['status']}] {document_hash[:12]} HTTP {result.get('status_code')}")
+    print(json.dumps(submitter.stats(), indent=4))
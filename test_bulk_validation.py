@@ -0,0 +1,69 @@
+import random
+
+import pytest
+
+import main
+from bulk_validation import to_frame, to_records, validate_frame
+
+VALUES = {
+    "Contract ID": ["OF-1042", "unknown", "(Not Specified)", "N/A", ""],
+    "Contract Name": ["Order Form", "", "unknown"],
+    "Status": ["Active", "ACTIVE", "draft", "pending", " active", "Expired\n"],
+    "Customer ID": ["C-77", "Unknown", "not specified", "(unknown)"],
+    "Contract Start Date": ["2024-03-01", "2024-3-1", "2024-02-30", "03/01/2024", "2024-03-01\n",
+                            "2024-03- 1", "20240301", ""],
+    "Contract End Date": ["2025-02-28", "2025-02-29", "Feb 28, 2025"],
+    "Contract Amount": ["$25,000", "25000.00", "1,200.5", "$1,2,3", "25000.00\n", "$",
+                        "12.345", "USD 100", "0"],
+    "Currency": ["USD", "unknown"],
+    "Notes": ["renewal pending", "unknown"],
+}
+METADATA = {
+    "Billing Frequency": ["Monthly", "unknown", "Not Specified", ""],
+    "Contract Type": ["Subscription", "(not specified)"],
+}
+
+
+def random_record(rng):
+    record = {}
+    for field, values in VALUES.items():
+        roll = rng.random()
+        if roll < 0.15:
+            continue  # absent
+        record[field] = None if roll < 0.25 else rng.choice(values)
+    roll = rng.random()
+    if roll < 0.1:
+        record["Metadata"] = None
+    elif roll < 0.2:
+        record["Metadata"] = {}
+    elif roll < 0.9:
+        record["Metadata"] = {sub_field: None if rng.random() < 0.1 else rng.choice(values)
+                              for sub_field, values in METADATA.items() if rng.random() < 0.85}
+    return record
+
+
+@pytest.fixture(scope="module")
+def records():
+    rng = random.Random(16)
+    return [random_record(rng) for _ in range(500)]
+
+
+def test_matches_validate_record(records):
+    values, present = to_frame(records)
+    validated, log, invalid = validate_frame(values, present)
+    bulk_records = to_records(validated, present)
+
+    for row, record in enumerate(records):
+        expected, expected_log, expected_invalid = main.validate_record(record)
+        assert bulk_records[row] == expected, record
+        assert sorted(log[log["row"] == row]["message"]) == sorted(expected_log), record
+        failing = [column for column in invalid.columns if invalid.at[row, column]]
+        assert sorted(failing) == sorted(expected_invalid), record
+
+
+def test_empty_input():
+    values, present = to_frame([])
+    validated, log, invalid = validate_frame(values, present)
+
+    assert to_records(validated, present) == []
+    assert log.empty and list(log.columns) == ["row", "field", "message"]
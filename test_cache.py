@@ -0,0 +1,104 @@
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+import cache as cache_module
+from cache import Cache, completion_key, file_hash, markdown_key
+from llm import AsyncLLM, FakeAsyncClient
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = Cache(str(tmp_path / "cache"))
+    yield cache
+    cache.close()
+
+
+def test_keys_follow_content_and_settings(tmp_path):
+    a, b, c = tmp_path / "a.pdf", tmp_path / "b.pdf", tmp_path / "c.pdf"
+    a.write_bytes(b"%PDF-1.4 one")
+    b.write_bytes(b"%PDF-1.4 one")
+    c.write_bytes(b"%PDF-1.4 two")
+
+    assert file_hash(a) == file_hash(b) != file_hash(c)
+    assert markdown_key(a, {"ocr": "auto"}) == markdown_key(b, {"ocr": "auto"})
+    assert markdown_key(a, {"ocr": "auto"}) != markdown_key(a, {"ocr": "off"})
+    assert completion_key("doc", "PROMPT", "gpt") != completion_key("doc", "PROMPT", "gpt",
+                                                                   {"temperature": 0})
+    # Parts are length-prefixed: moving text between them changes the key
+    assert completion_key("ab", "c", "gpt") != completion_key("a", "bc", "gpt")
+
+
+def test_round_trip_and_counters(cache):
+    assert cache.get("markdown", "k") is None
+    cache.put("markdown", "k", "# Contract")
+
+    assert cache.get("markdown", "k") == "# Contract"
+    assert cache.get("completion", "k") is None
+    stats = cache.stats()
+    assert stats["hits"] == {"markdown": 1}
+    assert stats["misses"] == {"markdown": 1, "completion": 1}
+    assert stats["hit_rate"]["markdown"] == 0.5
+
+
+def test_refresh_skips_reads_but_stores(tmp_path):
+    path = str(tmp_path / "cache")
+    Cache(path).put("markdown", "k", "old")
+
+    refreshing = Cache(path, refresh=True)
+    assert refreshing.get("markdown", "k") is None
+    refreshing.put("markdown", "k", "new")
+
+    assert Cache(path).get("markdown", "k") == "new"
+
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    disabled = Cache(str(tmp_path / "cache"), enabled=False)
+    disabled.put("markdown", "k", "value")
+
+    assert disabled.get("markdown", "k") is None
+    assert not (tmp_path / "cache").exists()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    clock = itertools.count()
+    monkeypatch.setattr(cache_module, "time", SimpleNamespace(time=lambda: next(clock)))
+    cache = Cache(str(tmp_path / "cache"), max_bytes=10)
+    cache.put("markdown", "a", "aaaa")
+    cache.put("markdown", "b", "bbbb")
+    cache.get("markdown", "a")
+
+    cache.put("markdown", "c", "cccc")
+
+    assert cache.get("markdown", "b") is None
+    assert cache.get("markdown", "a") == "aaaa"
+    assert cache.get("markdown", "c") == "cccc"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_clear_by_kind(cache):
+    cache.put("markdown", "k", "m")
+    cache.put("completion", "k", "c")
+
+    cache.clear("completion")
+
+    assert cache.get("completion", "k") is None
+    assert cache.get("markdown", "k") == "m"
+
+
+def test_repeated_completion_is_served_from_the_cache(cache):
+    client = FakeAsyncClient(lambda messages, **params: '{"Contract ID": "C-1"}')
+    llm = AsyncLLM(client=client, cache=cache)
+
+    async def run():
+        first = await llm.chat("PROMPT", "doc")
+        second = await llm.chat("PROMPT", "doc")
+        other = await llm.chat("PROMPT", "doc", temperature=0)
+        return first, second, other
+
+    first, second, _ = asyncio.run(run())
+    assert first == second == '{"Contract ID": "C-1"}'
+    assert len(client.calls) == 2
+    assert cache.stats()["hits"] == {"completion": 1}
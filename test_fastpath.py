@@ -0,0 +1,73 @@
+from fastpath import fast_extract, normalize
+
+KEY_VALUES = """## Subscription Agreement
+
+Contract ID: SA-2024-118
+Status: Active
+Contract Type: see Exhibit A
+Customer Name: Acme Corp
+Start Date: 2024-03-01
+End Date: 01/04/2025
+Contract Amount: USD 12,500
+Payment Terms: Net 30 days
+Billing Frequency: Quarterly
+"""
+
+
+def test_validated_fields_are_accepted():
+    accepted = fast_extract(KEY_VALUES).accepted
+
+    assert accepted["Contract ID"] == "SA-2024-118"
+    assert accepted["Status"] == "Active"
+    assert accepted["Contract Start Date"] == "2024-03-01"
+    assert accepted["Payment Terms"] == "Net 30"
+    assert accepted["Metadata.Billing Frequency"] == "Quarterly"
+
+
+def test_free_text_lines_are_left_to_the_llm():
+    result = fast_extract(KEY_VALUES)
+
+    assert result.values["Metadata.Contract Type"] == "see Exhibit A"
+    for path in ("Metadata.Contract Type", "Customer Name", "Contract Name"):
+        assert path in result.missing
+
+
+def test_amount_is_canonical():
+    result = fast_extract(KEY_VALUES)
+
+    assert result.accepted["Contract Amount"] == "12500.00"
+    assert result.accepted["Currency"] == "USD"
+    assert normalize("Contract Amount", "$1,200") == ("1200.00", True)
+    assert normalize("Contract Amount", "€ 99.50 EUR") == ("99.50", True)
+    # Not a truncated 99
+    assert normalize("Contract Amount", "€ 99.5") == (None, False)
+    assert normalize("Contract Amount", "see schedule") == (None, False)
+
+
+def test_ambiguous_slash_dates_are_left_to_the_llm():
+    result = fast_extract(KEY_VALUES)
+
+    assert "Contract End Date" in result.missing
+    assert normalize("Contract End Date", "01/04/2025") == ("2025-01-04", False)
+    assert normalize("Contract End Date", "31/03/2026") == ("2026-03-31", True)
+    assert normalize("Contract End Date", "12/31/2025") == ("2025-12-31", True)
+    assert normalize("Contract End Date", "04/04/2025") == ("2025-04-04", True)
+
+
+def test_generic_labels_stay_below_the_threshold():
+    result = fast_extract("Client: Jane Doe, procurement\nTotal: $40.00\n")
+
+    assert result.sources["Contract Amount"] == "generic"
+    assert "Contract Amount" in result.missing
+
+
+def test_template_patterns_vouch_for_free_text():
+    markdown = ("## Order Form\n\nOrder Form Number: OF-1042\n"
+                "Client Company Name: Globex Ltd\nPayment Terms: Net 45\n")
+
+    result = fast_extract(markdown)
+
+    assert result.template == "order_form"
+    assert result.accepted["Customer Name"] == "Globex Ltd"
+    assert result.accepted["Contract Name"] == "Order Form"
+    assert result.accepted["Contract ID"] == "OF-1042"
@@ -0,0 +1,67 @@
+import pytest
+
+from jobs import JobStore, LeaseLost
+
+FAILED = {"status": "failed", "error": {"stage": "extract", "message": "RuntimeError: boom",
+                                        "traceback": "..."}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), max_attempts=2)
+    store.enqueue(["a.pdf"], lambda source, seen: source.removesuffix(".pdf"))
+    yield store
+    store.close()
+
+
+def test_expired_lease_is_claimed_by_another_worker(store):
+    stale = store.claim("worker-1", lease_seconds=0)
+    stale.checkpoint("converted", {"status": "ok"}, markdown="# A")
+
+    job = store.claim("worker-2")
+
+    assert job.job_id == stale.job_id
+    assert job.state == "converted" and job.attempts == 2
+    assert job.artifact("markdown") == "# A"
+    with pytest.raises(LeaseLost):
+        stale.checkpoint("extracted", {"status": "ok"})
+    assert not stale.finish({"status": "ok"})
+    assert job.finish({"status": "ok"})
+    assert store.stats()["status"] == {"done": 1}
+
+
+def test_failed_job_is_queued_again_until_attempts_run_out(store):
+    assert store.claim("worker").finish(FAILED)
+    assert store.stats()["status"] == {"queued": 1}
+
+    store.claim("worker").finish(FAILED)
+
+    assert store.claim("worker") is None
+    [failure] = store.failures()
+    assert failure["attempts"] == 2
+    assert failure["error"] == {"stage": "extract", "message": "RuntimeError: boom"}
+
+
+def test_requeue_resumes_from_the_checkpoint_or_restarts(store):
+    for _ in range(2):
+        job = store.claim("worker")
+        job.checkpoint("extracted", {"status": "ok"}, markdown="# A")
+        job.finish(FAILED)
+
+    assert store.requeue() == 1
+    job = store.claim("worker")
+    assert job.state == "extracted" and job.attempts == 1
+    job.finish(FAILED)
+    store.claim("worker").finish(FAILED)
+
+    assert store.requeue(restart=True) == 1
+    job = store.claim("worker")
+    assert job.state == "pending" and job.record == {}
+    assert job.artifact("markdown") is None
+
+
+def test_release_does_not_count_the_attempt(store):
+    store.claim("worker")
+    store.release("worker")
+
+    assert store.claim("worker").attempts == 1
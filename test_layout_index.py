@@ -0,0 +1,92 @@
+import pytest
+
+from batch import learnable
+from layout_index import LayoutIndex, fingerprint
+
+TEMPLATE = """# Vendor Order
+
+| Field | Value |
+|---|---|
+| Reference | {reference} |
+| Buyer | {buyer} |
+| Amount Due | {amount} |
+
+Start: {start}
+Status: Active
+Prepared by: Sales
+Region: EMEA
+Channel: Direct
+"""
+
+
+def document(reference="VO-100", buyer="Acme Corp", amount="$1,200.00", start="2024-03-01"):
+    return TEMPLATE.format(reference=reference, buyer=buyer, amount=amount, start=start)
+
+
+def record(reference="VO-100", buyer="Acme Corp", amount="1200.00", start="2024-03-01"):
+    return {"Contract ID": reference, "Customer Name": buyer, "Contract Amount": amount,
+            "Contract Start Date": start, "Status": "Active"}
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LayoutIndex(str(tmp_path / "layouts.sqlite3"))
+    yield index
+    index.close()
+
+
+def test_fingerprint_ignores_values_but_not_layout():
+    assert fingerprint(document())[0] == fingerprint(document("VO-7", "Globex", "$9.00"))[0]
+    assert fingerprint(document())[0] != fingerprint(document() + "\nRenewal: auto\n")[0]
+
+
+def test_unknown_layout_gives_nothing(index):
+    match = index.lookup(document())
+
+    assert match.known is None
+    assert match.values == {} and match.regions == {}
+
+
+def test_learned_labels_are_read_from_the_next_document(index):
+    index.learn(document(), record())
+
+    match = index.lookup(document("VO-200", "Globex Ltd", "$2,500.00", "2024-06-01"))
+
+    assert match.similarity == 1.0
+    assert match.values == {"Contract ID": "VO-200", "Customer Name": "Globex Ltd",
+                            "Contract Amount": "2500.00", "Contract Start Date": "2024-06-01",
+                            "Status": "Active"}
+    assert match.confidence["Contract ID"] == 0.5
+    assert "| Reference | VO-200 |" in match.context(["Contract ID", "Customer Name"])
+
+
+def test_agreeing_documents_raise_confidence(index):
+    for n in range(3):
+        index.learn(document(f"VO-{n}"), record(f"VO-{n}"))
+
+    assert index.lookup(document("VO-9")).confidence["Contract ID"] == 0.75
+    assert index.stats()["layouts"] == 1
+
+
+def test_near_identical_layout_matches(index):
+    index.learn(document(), record())
+    # One more key-value line than the learned layout
+    similar = document("VO-300") + "Renewal: auto\n"
+
+    match = index.lookup(similar, fields=["Contract ID"])
+
+    assert match.known is not None and match.known != match.fingerprint
+    assert 0.85 <= match.similarity < 1.0
+    assert match.values == {"Contract ID": "VO-300"}
+    assert index.stats()["near"] == 1
+
+
+def test_only_validated_values_with_content_are_learned():
+    final = {"Contract ID": "N/A", "Customer Name": "Acme Corp", "Status": "pending",
+             "Contract Start Date": "2024-03-01", "Contract Amount": None,
+             "Metadata": {"Billing Frequency": "unknown", "Contract Type": "Subscription"}}
+
+    assert learnable(final) == {"Customer Name": "Acme Corp",
+                                "Contract Start Date": "2024-03-01",
+                                "Metadata": {"Contract Type": "Subscription"}}
+    assert learnable({"Contract ID": "N/A"}) is None
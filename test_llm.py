@@ -0,0 +1,36 @@
+import asyncio
+import json
+
+import openai
+import pytest
+
+from llm import AsyncLLM, FakeAsyncClient
+
+MESSAGES = [{"role": "system", "content": "Extract."}, {"role": "user", "content": "Contract"}]
+
+
+def test_retries_rate_limits_and_server_errors():
+    client = FakeAsyncClient(lambda messages, **params: json.dumps({"Contract ID": "C-1"}),
+                             failures=[429, 500], retry_after=0)
+    llm = AsyncLLM(client=client, base_delay=0.001)
+
+    response = asyncio.run(llm.create(model="m", messages=MESSAGES))
+
+    assert json.loads(response.choices[0].message.content) == {"Contract ID": "C-1"}
+    assert len(client.calls) == 3
+    assert llm.counters["requests"] == 3
+    assert llm.counters["retries"] == 2
+    assert llm.counters["throttled"] == 1
+    assert llm.in_flight == 0
+
+
+def test_gives_up_after_max_retries():
+    client = FakeAsyncClient(failures=[500, 500, 500])
+    llm = AsyncLLM(client=client, max_retries=1, base_delay=0.001)
+
+    with pytest.raises(openai.InternalServerError):
+        asyncio.run(llm.create(model="m", messages=MESSAGES))
+
+    assert len(client.calls) == 2
+    assert llm.counters["errors"] == 1
+    assert llm.in_flight == 0
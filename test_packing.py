@@ -0,0 +1,135 @@
+import asyncio
+import json
+import re
+
+from llm import AsyncLLM, FakeAsyncClient
+from packing import Packer
+from sections import count_tokens
+
+DOCUMENT = re.compile(r"<<<DOCUMENT (\w+)>>>\n(.*?)\n<<<END \1>>>", re.S)
+
+
+def answer(drop=(), fail=()):
+    """Responder that extracts each document's text as its Contract ID.
+
+    Packs holding a `drop` document leave it out of the answer; any request
+    holding a `fail` document raises.
+    """
+    def responder(messages, **params):
+        user = messages[-1]["content"]
+        documents = DOCUMENT.findall(user) or [(None, user)]
+        if any(content in fail for _, content in documents):
+            raise RuntimeError("context length exceeded")
+        if documents[0][0] is None:
+            return json.dumps({"Contract ID": user})
+        return json.dumps({"documents": [{"id": doc_id, "fields": {"Contract ID": content}}
+                                         for doc_id, content in documents
+                                         if content not in drop]})
+    return responder
+
+
+def make_packer(client, **options):
+    llm = AsyncLLM(client=client)
+
+    async def send(system_prompt, user_content, response_format):
+        return await llm.chat(system_prompt, user_content, response_format=response_format)
+
+    async def single(content, fields):
+        return json.loads(await llm.chat("Extract.", content))
+
+    return Packer(send, single, wait=0.01, **options)
+
+
+def extract_all(responder, contents):
+    client = FakeAsyncClient(responder)
+
+    async def run():
+        packer = make_packer(client)
+        results = await asyncio.gather(*(packer.extract(content) for content in contents),
+                                       return_exceptions=True)
+        return results, packer.stats()
+
+    results, stats = asyncio.run(run())
+    return results, stats, client
+
+
+def test_small_documents_share_one_request():
+    results, stats, client = extract_all(answer(), ["alpha", "beta", "gamma"])
+
+    assert results == [({"Contract ID": "alpha"}, 3), ({"Contract ID": "beta"}, 3),
+                       ({"Contract ID": "gamma"}, 3)]
+    assert len(client.calls) == 1
+    assert stats["requests"] == 1 and stats["documents"] == 3
+
+
+def test_document_missing_from_the_answer_falls_back_to_single():
+    results, stats, _ = extract_all(answer(drop={"beta"}), ["alpha", "beta", "gamma"])
+
+    assert results[0] == ({"Contract ID": "alpha"}, 3)
+    assert results[1] == ({"Contract ID": "beta"}, 1)
+    assert results[2] == ({"Contract ID": "gamma"}, 3)
+    assert stats["splits"] == 1 and stats["single"] == 1
+
+
+def test_failed_request_splits_and_error_reaches_only_the_failing_document():
+    results, stats, _ = extract_all(answer(fail={"bad"}), ["alpha", "beta", "bad", "gamma"])
+
+    assert results[0] == ({"Contract ID": "alpha"}, 2)
+    assert results[1] == ({"Contract ID": "beta"}, 2)
+    assert isinstance(results[2], RuntimeError)
+    assert results[3] == ({"Contract ID": "gamma"}, 1)
+    # The pack of four and the pack of [bad, gamma] failed
+    assert stats["errors"] == 2
+    assert stats["single"] == 2
+
+
+def test_cancelled_caller_does_not_strand_the_pack():
+    client = FakeAsyncClient(answer(), latency=0.05)
+
+    async def run():
+        packer = make_packer(client)
+        cancelled = asyncio.ensure_future(packer.extract("alpha"))
+        kept = asyncio.ensure_future(packer.extract("beta"))
+        await asyncio.sleep(0.02)
+        cancelled.cancel()
+        return await asyncio.wait_for(kept, 1)
+
+    assert asyncio.run(run()) == ({"Contract ID": "beta"}, 2)
+
+
+def test_response_format_does_not_depend_on_the_pack():
+    client = FakeAsyncClient(answer())
+
+    async def run():
+        packer = make_packer(client)
+        first = await asyncio.gather(packer.extract("alpha"), packer.extract("beta"))
+        second = await asyncio.gather(packer.extract("gamma", ["Currency"]),
+                                      packer.extract("delta"), packer.extract("epsilon"))
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert [pack_size for _, pack_size in first + second] == [2, 2, 3, 3, 3]
+    assert second[0][0] == {"Currency": None}
+    assert client.calls[0]["response_format"] == client.calls[1]["response_format"]
+
+
+def test_unpacked_tokens_are_counted_with_the_single_request_prompt():
+    prompts = []
+
+    def single_prompt(fields):
+        prompts.append(fields)
+        return "Extract the contract."
+
+    client = FakeAsyncClient(answer())
+
+    async def run():
+        packer = make_packer(client, single_prompt=single_prompt)
+        await asyncio.gather(packer.extract("alpha"), packer.extract("beta", ["Currency"]))
+        return packer.stats()
+
+    stats = asyncio.run(run())
+
+    assert prompts == [None, ["Currency"]]
+    assert stats["prompt_tokens_unpacked"] == (2 * count_tokens("Extract the contract.")
+                                               + count_tokens("alpha") + count_tokens("beta"))
@@ -0,0 +1,44 @@
+from fastpath import BILLING_FREQUENCIES
+from prompt_layout import CORRECTION_EXAMPLE, EXAMPLES
+from schema import CONTRACT_SCHEMA, CORRECTION_SCHEMA
+
+
+def schema_errors(value, schema, path="$"):
+    """Where `value` breaks a strict schema: missing or extra keys, wrong types."""
+    types = schema.get("type")
+    types = types if isinstance(types, list) else [types]
+    if value is None:
+        return [] if "null" in types else [f"{path}: null"]
+    if "object" in types:
+        if not isinstance(value, dict):
+            return [f"{path}: not an object"]
+        errors = [f"{path}.{key}: missing" for key in schema["required"] if key not in value]
+        errors += [f"{path}.{key}: not in schema" for key in value
+                   if key not in schema["properties"]]
+        for key, sub_schema in schema["properties"].items():
+            if key in value:
+                errors += schema_errors(value[key], sub_schema, f"{path}.{key}")
+        return errors
+    if "array" in types:
+        if not isinstance(value, list):
+            return [f"{path}: not an array"]
+        return [error for n, item in enumerate(value)
+                for error in schema_errors(item, schema["items"], f"{path}[{n}]")]
+    return [] if isinstance(value, str) else [f"{path}: not a string"]
+
+
+def test_extraction_examples_match_the_schema():
+    for _, answer in EXAMPLES:
+        assert schema_errors(answer, CONTRACT_SCHEMA) == []
+
+
+def test_correction_example_matches_the_schema():
+    _, _, answer = CORRECTION_EXAMPLE
+
+    assert schema_errors(answer, CORRECTION_SCHEMA) == []
+
+
+def test_examples_use_the_canonical_billing_frequencies():
+    for _, answer in EXAMPLES:
+        frequency = answer["Metadata"]["Billing Frequency"]
+        assert frequency is None or frequency in BILLING_FREQUENCIES.values()
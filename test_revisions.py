@@ -0,0 +1,152 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+import batch
+from batch import Pipeline
+from llm import AsyncLLM, FakeAsyncClient
+from revisions import RevisionStore, change_set, plan_revision
+
+ORDER_FORM = """## Order Form
+
+Contract ID: OF-2024-001
+Customer Name: Acme Corp
+Start Date: 2024-03-01
+End Date: 2025-02-28
+
+## Fees
+
+Contract Amount: $12,000.00
+Payment Terms: Net 30
+
+## Support
+
+Support is provided on business days.
+"""
+AMENDED = ORDER_FORM.replace("$12,000.00", "$15,000.00")
+
+FINAL = {"Contract ID": "OF-2024-001", "Contract Name": "Order Form", "Status": "Active",
+         "Currency": "USD", "Customer ID": "C-1", "Customer Name": "Acme Corp",
+         "Contract Start Date": "2024-03-01", "Contract End Date": "2025-02-28",
+         "Payment Terms": "Net 30", "Contract Amount": "12000.00",
+         "Metadata": {"Billing Frequency": "Annual", "Contract Type": "Subscription"}}
+
+
+def test_change_set_lists_only_differing_fields():
+    current = dict(FINAL, **{"Contract Amount": "15000.00"},
+                   Metadata={"Billing Frequency": "Quarterly", "Contract Type": "Subscription"})
+
+    assert change_set(FINAL, current) == {
+        "Contract Amount": {"old": "12000.00", "new": "15000.00"},
+        "Metadata.Billing Frequency": {"old": "Annual", "new": "Quarterly"},
+    }
+    assert change_set(FINAL, FINAL) == {}
+
+
+def test_unchanged_markdown_reuses_every_value():
+    plan = plan_revision(ORDER_FORM, FINAL, ORDER_FORM)
+
+    assert plan.fields == []
+    assert plan.reuse["Contract Amount"] == "12000.00"
+    assert plan.sections_changed == 0
+
+
+def test_changed_section_reextracts_its_fields():
+    plan = plan_revision(ORDER_FORM, FINAL, AMENDED)
+
+    assert "Contract Amount" in plan.fields
+    assert plan.reuse["Customer Name"] == "Acme Corp"
+    assert "$15,000.00" in plan.context and "Acme Corp" not in plan.context
+    assert plan.sections_changed == 1
+    # Values not traceable to a section are looked for in the change, else kept
+    assert "Metadata.Contract Type" in plan.keep
+    merged = plan.merge({"Contract Amount": "15000.00"})
+    assert merged["Contract Amount"] == "15000.00"
+    assert merged["Metadata"]["Contract Type"] == "Subscription"
+
+
+def extraction_responder(requests):
+    """Answers every extraction with FINAL (the amount read from the text)."""
+    def responder(messages, **params):
+        user = messages[-1]["content"]
+        schema = params["response_format"]["json_schema"]["schema"]
+        requests.append(list(schema["properties"]))
+        values = dict(FINAL, **{"Contract Amount": "15000.00" if "15,000" in user else "12000.00"})
+        return json.dumps({key: values[key] for key in schema["properties"]})
+    return responder
+
+
+class TextConverter:
+    """Stands in for conversion.ConversionPool: the sources are markdown already."""
+
+    def __init__(self, workers=None, timeout=None, selection=None, stream=None):
+        self.selection = selection
+        self.stream = stream
+
+    def convert_pages(self, source, timeout=None):
+        return {"markdown": Path(source).read_text(), "pages": None, "stream": None,
+                "peak_rss_kb": 0}
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def run(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, "ConversionPool", TextConverter)
+    store = RevisionStore(str(tmp_path / "revisions.sqlite3"))
+    requests = []
+
+    def run(name, markdown, refresh=False):
+        source = tmp_path / f"{name}.pdf"
+        source.write_text(markdown)
+
+        async def process():
+            pipeline = Pipeline(convert_workers=1, submit=False, fast_path=False,
+                                revisions=store, refresh=refresh,
+                                llm=AsyncLLM(client=FakeAsyncClient(
+                                    extraction_responder(requests))))
+            try:
+                return await pipeline.process(name, str(source))
+            finally:
+                pipeline.close()
+
+        requests.clear()
+        record = asyncio.run(process())
+        assert record["status"] == "ok", record.get("error")
+        return record, list(requests)
+
+    yield run
+    store.close()
+
+
+def test_same_document_again_is_extracted_in_full(run):
+    run("v1", ORDER_FORM)
+
+    record, requests = run("v1-again", ORDER_FORM)
+
+    assert len(requests) == 1 and "Contract ID" in requests[0]
+    assert "revision" not in record
+
+
+def test_amended_document_reextracts_only_changed_fields(run):
+    run("v1", ORDER_FORM)
+
+    record, requests = run("v2", AMENDED)
+
+    assert len(requests) == 1 and "Contract ID" not in requests[0]
+    assert record["final"]["Contract Amount"] == "15000.00"
+    assert record["revision"]["incremental"]
+    assert record["revision"]["changes"] == {
+        "Contract Amount": {"old": "12000.00", "new": "15000.00"}}
+
+
+def test_refresh_extracts_an_amended_document_in_full(run):
+    run("v1", ORDER_FORM)
+
+    record, requests = run("v2", AMENDED, refresh=True)
+
+    assert len(requests) == 1 and "Contract ID" in requests[0]
+    assert not record["revision"]["incremental"]
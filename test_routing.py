@@ -0,0 +1,68 @@
+import main
+from routing import RoutingPolicy, assess, completeness, merge_escalated
+
+COMPLETE = {"Contract ID": "OF-1", "Contract Name": "Order Form", "Status": "Active",
+            "Currency": "USD", "Customer ID": "C-1", "Customer Name": "Acme Corp",
+            "Contract Start Date": "2024-03-01", "Contract End Date": "2025-02-28",
+            "Payment Terms": "Net 30", "Contract Amount": "1200.00",
+            "Metadata": {"Billing Frequency": "Monthly", "Contract Type": "Subscription"}}
+
+
+def escalation(extracted, **policy):
+    _, log, invalid = main.validate_record(extracted)
+    return assess(extracted, log, invalid, RoutingPolicy(**policy))
+
+
+def test_valid_complete_answer_stays_on_the_fast_deployment():
+    result = escalation(COMPLETE)
+
+    assert result.fields == [] and result.reasons == []
+    assert result.completeness == 1.0
+
+
+def test_invalid_fields_are_escalated():
+    result = escalation(dict(COMPLETE, **{"Contract Start Date": "March 1st",
+                                          "Status": "pending"}))
+
+    assert result.reasons == ["validation"]
+    assert result.fields == ["Status", "Contract Start Date"]
+    assert result.log_entries == 2
+
+
+def test_a_tolerated_log_entry_is_not_escalated():
+    assert escalation(dict(COMPLETE, Status="pending"), max_log_entries=1).fields == []
+
+
+def test_incomplete_answer_escalates_its_missing_fields():
+    extracted = dict(COMPLETE, **{"Customer ID": "N/A", "Payment Terms": "",
+                                  "Customer Name": None},
+                     Metadata={"Billing Frequency": "unknown"})
+
+    assert completeness(extracted) == 7 / 12
+    result = escalation(extracted)
+
+    assert "completeness" in result.reasons
+    assert set(result.fields) >= {"Customer ID", "Payment Terms", "Customer Name",
+                                  "Metadata.Billing Frequency", "Metadata.Contract Type"}
+
+
+def test_document_scope_escalates_every_field():
+    result = escalation(dict(COMPLETE, Status="pending"), scope="document")
+
+    assert len(result.fields) == 12
+
+
+def test_strong_values_replace_fast_ones_only_where_found():
+    fast = dict(COMPLETE, Status="pending", **{"Customer ID": "N/A"},
+                Metadata={"Billing Frequency": "unknown", "Contract Type": "Subscription"})
+    strong = {"Status": "Active", "Customer ID": None,
+              "Metadata": {"Billing Frequency": "Quarterly", "Contract Type": "Services"}}
+
+    merged = merge_escalated(fast, strong, ["Status", "Customer ID",
+                                            "Metadata.Billing Frequency"])
+
+    assert merged["Status"] == "Active"
+    assert merged["Customer ID"] == "N/A"
+    assert merged["Metadata"] == {"Billing Frequency": "Quarterly",
+                                  "Contract Type": "Subscription"}
+    assert fast["Status"] == "pending"
@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+import main
+from schema import (
+    CONTRACT_SCHEMA,
+    FIELD_PATHS,
+    ContractRecord,
+    IncrementalJSONParser,
+    flatten,
+    salvage_json,
+    unflatten,
+)
+
+ANSWER = json.dumps({
+    "Contract ID": "OF-1042",
+    "Contract Name": "Order, \"Form\" {draft}",
+    "Status": "Active",
+    "Metadata": {"Billing Frequency": "Monthly", "Contract Type": "Subscription"},
+    "Contract Amount": "1200.00",
+})
+
+
+def feed_in_chunks(text, size):
+    parser = IncrementalJSONParser()
+    emitted = []
+    for i in range(0, len(text), size):
+        emitted += parser.feed(text[i:i + size])
+    return parser, emitted
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, len(ANSWER)])
+def test_members_are_emitted_as_they_close(size):
+    parser, emitted = feed_in_chunks(ANSWER, size)
+
+    assert [key for key, _ in emitted] == list(json.loads(ANSWER))
+    assert dict(emitted) == json.loads(ANSWER)
+    assert parser.done
+
+
+def test_text_around_the_object_is_skipped():
+    parser, emitted = feed_in_chunks(f"Here you go:\n```json\n{ANSWER}\n```\nThanks {{", 5)
+
+    assert dict(emitted) == json.loads(ANSWER)
+    assert parser.done
+
+
+def test_truncated_stream_keeps_the_closed_members():
+    cut = ANSWER.index('"Contract Amount"') + len('"Contract Amount": "12')
+    parser, _ = feed_in_chunks(ANSWER[:cut], 4)
+
+    assert not parser.done
+    assert parser.salvage() == {key: value for key, value in json.loads(ANSWER).items()
+                                if key != "Contract Amount"}
+
+
+def test_member_cut_inside_a_nested_object_is_dropped():
+    cut = ANSWER.index('"Contract Type"')
+
+    assert salvage_json(ANSWER[:cut]) == {"Contract ID": "OF-1042",
+                                          "Contract Name": "Order, \"Form\" {draft}",
+                                          "Status": "Active"}
+
+
+def test_nothing_to_salvage():
+    assert salvage_json("") == {}
+    assert salvage_json("I could not find a contract.") == {}
+    assert salvage_json('{"Contract ID": ') == {}
+
+
+def test_parse_json_answer_falls_back_to_salvage():
+    assert main.parse_json_answer(ANSWER[:ANSWER.index('"Status"')]) == {
+        "Contract ID": "OF-1042", "Contract Name": "Order, \"Form\" {draft}"}
+    with pytest.raises(json.JSONDecodeError):
+        main.parse_json_answer("no json here")
+
+
+def test_schema_requires_every_field():
+    record = ContractRecord.from_dict(json.loads(ANSWER)).to_dict()
+
+    assert set(CONTRACT_SCHEMA["required"]) == set(record)
+    assert not CONTRACT_SCHEMA["additionalProperties"]
+    assert len(FIELD_PATHS) == len(flatten(record)) == 12
+    assert unflatten(flatten(record)) == record
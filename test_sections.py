@@ -0,0 +1,100 @@
+from sections import (
+    chunk_sections,
+    count_tokens,
+    index_markdown,
+    plan_context,
+    reduce_extractions,
+    select_sections,
+)
+
+HEADER = """# Master Services Agreement
+
+Contract Number: MSA-2024-7
+Customer Name: Acme Corp
+
+| Item | Fee |
+|---|---|
+| Platform | $10,000 |
+"""
+BOILERPLATE = "".join(f"""
+## Clause {n}
+
+The parties agree that confidentiality obligations survive and that each party
+shall indemnify the other for breaches of warranty under clause {n}.
+""" for n in range(1, 40))
+FEES = """
+## Fees and Payment
+
+Total contract value is $48,000 payable net 30 days from invoice, billed quarterly.
+"""
+LONG = HEADER + BOILERPLATE + FEES
+
+
+def test_index_splits_headings_tables_and_key_values():
+    sections = index_markdown(HEADER)
+
+    assert [(s.heading, s.kind) for s in sections] == [
+        ("Master Services Agreement", "text"),
+        ("Master Services Agreement", "key_value"),
+        ("Master Services Agreement", "table"),
+    ]
+    assert sections[1].text == "Contract Number: MSA-2024-7\nCustomer Name: Acme Corp"
+    assert sections[2].render().startswith("## Master Services Agreement\n| Item | Fee |")
+
+
+def test_short_document_goes_in_full():
+    plan = plan_context(HEADER, budget_tokens=6000)
+
+    assert plan.mode == "full"
+    assert plan.chunks == [HEADER]
+
+
+def test_long_document_sends_only_relevant_sections():
+    plan = plan_context(LONG, budget_tokens=1000)
+
+    assert plan.mode == "selected"
+    assert count_tokens(LONG) > 1000 >= plan.tokens_sent
+    [context] = plan.chunks
+    assert "MSA-2024-7" in context
+    assert "$48,000" in context
+    assert plan.sections_sent < plan.sections_total
+
+
+def test_selection_keeps_the_opening_section_and_document_order():
+    sections = index_markdown(LONG)
+
+    selected = select_sections(sections, fields=["Payment Terms"], per_field=1)
+
+    assert selected[0] is sections[0]
+    assert selected[-1].heading == "Fees and Payment"
+    assert [s.order for s in selected] == sorted(s.order for s in selected)
+
+
+def test_context_over_budget_is_chunked():
+    plan = plan_context(LONG, budget_tokens=60)
+
+    assert plan.mode == "map_reduce"
+    assert len(plan.chunks) > 1
+    assert all(count_tokens(chunk) <= 60 for chunk in plan.chunks)
+
+
+def test_long_section_is_split_across_chunks():
+    [section] = index_markdown("word " * 400)
+
+    chunks = chunk_sections([section], budget_tokens=100)
+
+    assert len(chunks) == 5
+    assert "".join(chunks) == section.render()
+
+
+def test_reduce_keeps_the_first_present_value():
+    merged = reduce_extractions([
+        {"Contract ID": "N/A", "Customer Name": "Acme Corp",
+         "Metadata": {"Billing Frequency": None}},
+        {"Contract ID": "MSA-2024-7", "Customer Name": "Acme",
+         "Metadata": {"Billing Frequency": "Quarterly", "Contract Type": "unknown"}},
+        {"Metadata": {"Contract Type": "Services"}},
+    ])
+
+    assert merged == {"Contract ID": "MSA-2024-7", "Customer Name": "Acme Corp",
+                      "Metadata": {"Billing Frequency": "Quarterly", "Contract Type": "Services"}}
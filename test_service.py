@@ -0,0 +1,89 @@
+import asyncio
+import os
+
+import pytest
+
+import service
+from service import ExtractionService
+
+
+class FakePipeline:
+    """Stands in for batch.Pipeline: `process` answers with `outcome(source)`."""
+
+    def __init__(self, outcome):
+        self.outcome = outcome
+
+    async def process(self, doc_id, source, tracer=None, job=None, on_admit=None):
+        on_admit()
+        await asyncio.sleep(0)
+        return self.outcome(source)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def start_service(monkeypatch):
+    monkeypatch.setattr(service, "Pipeline", FakePipeline)
+    started = []
+
+    def start(outcome):
+        started.append(ExtractionService(outcome=outcome).start())
+        return started[-1]
+
+    yield start
+    for extraction_service in started:
+        extraction_service.close()
+
+
+def raises(source):
+    raise RuntimeError(f"cannot read {source}")
+
+
+def test_job_finishes_with_an_error_when_the_pipeline_raises(start_service):
+    extraction_service = start_service(raises)
+
+    job = extraction_service.wait(extraction_service.submit("a.pdf"), timeout=5)
+
+    assert job["done"].is_set()
+    assert job["status"] == "error"
+    assert job["error"] == "RuntimeError: cannot read a.pdf"
+    assert job["record"] is None
+    assert extraction_service.get(job["id"]) is job
+
+
+def test_job_takes_the_record_status(start_service):
+    extraction_service = start_service(lambda source: {"status": "failed", "source": source})
+
+    job = extraction_service.wait(extraction_service.submit("a.pdf"), timeout=5)
+
+    assert job["status"] == "failed"
+    assert job["record"] == {"status": "failed", "source": "a.pdf"}
+
+
+def test_uploaded_source_is_removed_after_an_error(start_service):
+    extraction_service = start_service(raises)
+    path = extraction_service.spool(b"%PDF-1.4")
+
+    job = extraction_service.wait(extraction_service.submit(path, uploaded=True), timeout=5)
+
+    assert job["status"] == "error"
+    assert not os.path.exists(path)
+
+
+def test_command_line_takes_the_batch_pipeline_options(tmp_path):
+    args = service.parse_args(["--no-revisions", "--layout-index", str(tmp_path / "layouts.db"),
+                               "--no-submit", "--max-in-flight", "3", "--pack-tokens", "4000",
+                               "--cache-dir", str(tmp_path / "cache"), "--no-cache"])
+    cache = service.cache_from_args(args)
+    options = service.pipeline_options_from_args(args, cache)
+    try:
+        assert options["revisions"] is None
+        assert options["layout_index"] is not None
+        assert options["submit"] is False
+        assert options["max_in_flight"] == 3
+        assert options["pack_tokens"] == 4000
+    finally:
+        options["layout_index"].close()
+        options["submitter"].close()
+        cache.close()
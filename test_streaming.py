@@ -0,0 +1,42 @@
+import asyncio
+
+from llm import AsyncLLM, FakeAsyncClient
+
+MESSAGES = [{"role": "system", "content": "Extract."}, {"role": "user", "content": "Contract"}]
+
+
+def test_stream_holds_its_slot_until_read():
+    client = FakeAsyncClient(lambda messages, **params: "x" * 40, chunk_size=10)
+    llm = AsyncLLM(client=client, max_in_flight=1)
+
+    async def run():
+        stream = await llm.create(model="m", messages=MESSAGES, stream=True,
+                                  stream_options={"include_usage": True})
+        second = asyncio.ensure_future(llm.create(model="m", messages=MESSAGES))
+        await asyncio.sleep(0.01)
+        assert not second.done()
+        assert llm.in_flight == 1
+        text = "".join([chunk.choices[0].delta.content async for chunk in stream
+                        if chunk.choices])
+        await second
+        return text
+
+    assert asyncio.run(run()) == "x" * 40
+    assert llm.in_flight == 0
+    # The streamed usage is counted along with the second request's
+    assert llm.counters["completion_tokens"] == 2 * 10
+
+
+def test_closed_stream_gives_its_slot_back():
+    client = FakeAsyncClient(lambda messages, **params: "x" * 40, chunk_size=10)
+    llm = AsyncLLM(client=client, max_in_flight=1)
+
+    async def run():
+        stream = await llm.create(model="m", messages=MESSAGES, stream=True)
+        async for _ in stream:
+            break
+        await stream.aclose()
+        return await asyncio.wait_for(llm.create(model="m", messages=MESSAGES), 1)
+
+    asyncio.run(run())
+    assert llm.in_flight == 0
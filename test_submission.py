@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+from submission import SubmissionLedger, ZenskarSubmitter
+from zenskar_stub import ZenskarStub
+
+PAYLOAD = {"name": "Order form", "customer": "Acme"}
+
+
+@pytest.fixture
+def stub():
+    with ZenskarStub() as stub:
+        yield stub
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = SubmissionLedger(str(tmp_path / "ledger.sqlite3"))
+    yield ledger
+    ledger.close()
+
+
+def test_retries_then_creates_one_contract(stub, ledger):
+    stub.fail_next(2, status=503)
+    submitter = ZenskarSubmitter(stub.url, ledger=ledger, backoff=0.01)
+
+    result = submitter.submit("hash-1", PAYLOAD)
+
+    assert result["status"] == "created"
+    assert result["retries"] == 2
+    assert stub.requests == 3
+    assert len(stub.contracts) == 1
+    assert ledger.get("hash-1")["status_code"] == 200
+
+
+def test_resubmission_is_skipped_by_the_ledger(stub, ledger):
+    submitter = ZenskarSubmitter(stub.url, ledger=ledger)
+
+    first = submitter.submit("hash-1", PAYLOAD)
+    second = submitter.submit("hash-1", PAYLOAD)
+
+    assert first["status"] == "created"
+    assert second["status"] == "skipped"
+    assert json.loads(second["body"])["id"] == json.loads(first["body"])["id"]
+    assert stub.requests == 1
+    assert submitter.stats()["skipped"] == 1
+
+
+def test_resubmission_without_ledger_reuses_the_idempotency_key(stub):
+    submitter = ZenskarSubmitter(stub.url)
+
+    first = submitter.submit("hash-1", PAYLOAD)
+    second = submitter.submit("hash-1", PAYLOAD)
+
+    assert second["status"] == "created"
+    assert json.loads(second["body"])["id"] == json.loads(first["body"])["id"]
+    assert len(stub.contracts) == 1
+
+
+def test_failure_after_retries_is_not_recorded(stub, ledger):
+    stub.fail_next(3, status=500)
+    submitter = ZenskarSubmitter(stub.url, ledger=ledger, max_retries=1, backoff=0.01)
+
+    result = submitter.submit("hash-1", PAYLOAD)
+
+    assert result["status"] == "failed"
+    assert result["status_code"] == 500
+    assert ledger.get("hash-1") is None
+    assert not stub.contracts
+
+
+def test_update_patches_the_contract(stub, ledger):
+    submitter = ZenskarSubmitter(stub.url, ledger=ledger)
+    contract_id = json.loads(submitter.submit("hash-1", PAYLOAD)["body"])["id"]
+
+    result = submitter.update(contract_id, "hash-2", {"customer": "Acme Ltd"})
+
+    assert result["status"] == "updated"
+    assert stub.contracts[contract_id]["customer"] == "Acme Ltd"
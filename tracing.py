@@ -0,0 +1,255 @@
+"""Per-stage timing and token instrumentation.
+
+Each document gets a Tracer. Stages run inside `tracer.span(name)`, which
+records wall time, CPU time, peak RSS and any attributes set on it (tokens
+from `usage`, cache hits, retries). The span being recorded is available
+through `current_span` so lower layers (the LLM client, the conversion pool)
+can annotate it without being passed a handle.
+
+Output is a JSONL trace per document, an aggregated per-stage report, and
+optionally an OpenTelemetry (OTLP/JSON) span export to a local file.
+"""
+import contextvars
+import json
+import math
+import os
+import resource
+import secrets
+import sys
+import time
+from contextlib import contextmanager
+
+current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def peak_rss_kb():
+    """High-water resident set size of this process in KiB."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def _proc_status_kb(name):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(name + ":"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def current_rss_kb():
+    """Resident set size of this process right now in KiB (the peak where /proc is missing)."""
+    return _proc_status_kb("VmRSS") or peak_rss_kb()
+
+
+def reset_peak_rss():
+    """Restart the high-water mark read by window_peak_rss_kb (Linux only)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def window_peak_rss_kb():
+    """Peak RSS since the last reset_peak_rss() in KiB (process peak where unsupported)."""
+    return _proc_status_kb("VmHWM") or peak_rss_kb()
+
+
+class Span:
+    def __init__(self, trace_id, name, parent_id=None, attributes=None):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self.wall_time = None
+        self.cpu_time = None
+        self.peak_rss_kb = None
+        self.status = "ok"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, **counters):
+        for key, value in counters.items():
+            self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "wall_time": self.wall_time,
+            "cpu_time": self.cpu_time,
+            "peak_rss_kb": self.peak_rss_kb,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class Tracer:
+    def __init__(self, doc_id):
+        self.doc_id = doc_id
+        self.trace_id = secrets.token_hex(16)
+        self.spans = []
+
+    @contextmanager
+    def span(self, name, **attributes):
+        parent = current_span.get()
+        span = Span(self.trace_id, name, parent.span_id if parent else None, attributes)
+        token = current_span.set(span)
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield span
+        except BaseException:
+            span.status = "error"
+            raise
+        finally:
+            # CPU time is process-wide, so concurrent stages share it; the
+            # conversion pool reports the worker's own CPU time as an attribute.
+            span.wall_time = time.perf_counter() - wall
+            span.cpu_time = time.process_time() - cpu
+            span.peak_rss_kb = peak_rss_kb()
+            current_span.reset(token)
+            self.spans.append(span)
+
+    def timings(self):
+        """Total wall time per span name (excluding the document root span)."""
+        totals = {}
+        for span in self.spans:
+            if span.parent_id is not None:
+                totals[span.name] = totals.get(span.name, 0.0) + span.wall_time
+        return totals
+
+    def write_jsonl(self, path):
+        with open(path, "w") as f:
+            for span in self.spans:
+                f.write(json.dumps({"doc_id": self.doc_id, **span.to_dict()}) + "\n")
+
+
+def annotate(**attributes):
+    """Set attributes on the current span, if any."""
+    span = current_span.get()
+    if span is not None:
+        span.set(**attributes)
+
+
+def count(**counters):
+    """Add to counters on the current span, if any."""
+    span = current_span.get()
+    if span is not None:
+        span.add(**counters)
+
+
+def count_usage(usage):
+    """Add a completion's token usage to the current span."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    count(prompt_tokens=usage.prompt_tokens or 0,
+          completion_tokens=usage.completion_tokens or 0,
+          cached_tokens=getattr(details, "cached_tokens", None) or 0)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+SUMMED_ATTRIBUTES = ("prompt_tokens", "completion_tokens", "cached_tokens", "cache_hit",
+                     "retries", "throttled", "llm_calls")
+
+
+def aggregate(tracers):
+    """Per-stage report across documents: counts, wall/CPU time, tokens, cache hits, retries."""
+    stages = {}
+    for tracer in tracers:
+        for span in tracer.spans:
+            stage = stages.setdefault(span.name, {"count": 0, "errors": 0, "wall": [], "cpu": 0.0,
+                                                  "peak_rss_kb": 0})
+            stage["count"] += 1
+            stage["errors"] += span.status != "ok"
+            stage["wall"].append(span.wall_time)
+            stage["cpu"] += span.cpu_time + span.attributes.get("worker_cpu_time", 0.0)
+            stage["peak_rss_kb"] = max(stage["peak_rss_kb"], span.peak_rss_kb or 0,
+                                       span.attributes.get("worker_peak_rss_kb", 0))
+            for name in SUMMED_ATTRIBUTES:
+                if name in span.attributes:
+                    stage[name] = stage.get(name, 0) + span.attributes[name]
+    report = {}
+    for name, stage in stages.items():
+        wall = stage.pop("wall")
+        report[name] = {
+            **stage,
+            "wall_total": sum(wall),
+            "wall_p50": percentile(wall, 50),
+            "wall_p95": percentile(wall, 95),
+        }
+    return report
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_export(tracer, service_name="contract-extraction"):
+    """One OTLP/JSON ExportTraceServiceRequest for a document's spans."""
+    spans = []
+    for span in tracer.spans:
+        attributes = {
+            "doc.id": tracer.doc_id,
+            "process.cpu_time": span.cpu_time,
+            "process.peak_rss_kb": span.peak_rss_kb,
+            **span.attributes,
+        }
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(int(span.start * 1e9)),
+            "endTimeUnixNano": str(int((span.start + span.wall_time) * 1e9)),
+            "attributes": [{"key": key, "value": _otlp_value(value)}
+                           for key, value in attributes.items() if value is not None],
+            "status": {"code": 1 if span.status == "ok" else 2},
+        }
+        if span.parent_id:
+            otlp_span["parentSpanId"] = span.parent_id
+        spans.append(otlp_span)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": service_name}},
+                {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+            ]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": spans}],
+        }]
+    }
+
+
+class OTLPFileExporter:
+    """Append OTLP/JSON trace requests to a local file, one per line."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def export(self, tracer):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(otlp_export(tracer)) + "\n")
@@ -0,0 +1,143 @@
+"""Local stand-in for the Zenskar contract API, for tests and benchmarks.
+
+Creates contracts in memory, applies PATCH updates to them, deduplicates
+on Idempotency-Key and can be told to fail the next N requests with a
+given status.
+
+    with ZenskarStub() as stub:
+        submitter = ZenskarSubmitter(stub.url)
+        stub.fail_next(2, status=503)
+        ...
+        print(stub.contracts, stub.requests)
+
+    python zenskar_stub.py --port 8080
+"""
+import argparse
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.stub.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _injected_failure(self, stub):
+        if not stub.failures:
+            return False
+        status = stub.failures.pop(0)
+        headers = {"Retry-After": str(stub.retry_after)} if status == 429 else {}
+        self._send(status, {"error": "injected failure"}, headers)
+        return True
+
+    def do_POST(self):
+        stub = self.server.stub
+        payload = self._read()
+        with stub.lock:
+            stub.requests += 1
+            if self._injected_failure(stub):
+                return
+            if self.path.rstrip("/") != "/contract_v2":
+                self._send(404, {"error": "not found"})
+                return
+            key = self.headers.get("Idempotency-Key")
+            if key and key in stub.by_key:
+                self._send(200, stub.contracts[stub.by_key[key]])
+                return
+            contract = {"id": str(uuid.uuid4()), **payload}
+            stub.contracts[contract["id"]] = contract
+            if key:
+                stub.by_key[key] = contract["id"]
+        self._send(200, contract)
+
+    def do_PATCH(self):
+        stub = self.server.stub
+        payload = self._read()
+        with stub.lock:
+            stub.requests += 1
+            if self._injected_failure(stub):
+                return
+            prefix, _, contract_id = self.path.rstrip("/").rpartition("/")
+            if prefix != "/contract_v2" or contract_id not in stub.contracts:
+                self._send(404, {"error": "not found"})
+                return
+            key = self.headers.get("Idempotency-Key")
+            if key and key in stub.updates:
+                self._send(200, stub.contracts[contract_id])
+                return
+            stub.contracts[contract_id].update(payload)
+            if key:
+                stub.updates[key] = payload
+        self._send(200, stub.contracts[contract_id])
+
+
+class ZenskarStub:
+    def __init__(self, host="127.0.0.1", port=0, verbose=False):
+        self.contracts = {}
+        self.by_key = {}
+        self.updates = {}
+        self.failures = []
+        self.retry_after = 0
+        self.requests = 0
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/contract_v2"
+
+    def fail_next(self, count, status=503, retry_after=0):
+        with self.lock:
+            self.failures.extend([status] * count)
+            self.retry_after = retry_after
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the local Zenskar API stub.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    stub = ZenskarStub(args.host, args.port, verbose=True)
+    print(f"Zenskar stub listening on {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.server.server_close()